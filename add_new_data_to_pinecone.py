@@ -7,8 +7,9 @@ import json
 from dotenv import load_dotenv
 from pinecone import Pinecone
 import asyncio
-from chunk_prisma_data import convert_to_documents
+from chunk_prisma_data import convert_to_documents, chunk_documents
 from generate_embeddings import get_embedding_with_fallback
+from record_ids import vector_id as record_vector_id
 
 # Load environment variables
 load_dotenv()
@@ -71,7 +72,7 @@ async def add_new_data_to_pinecone():
         }
         
         print("Converting new data to documents...")
-        documents = convert_to_documents(new_data)
+        documents = chunk_documents(convert_to_documents(new_data))
         print(f"Generated {len(documents)} documents")
         
         # Initialize Pinecone
@@ -79,11 +80,6 @@ async def add_new_data_to_pinecone():
         pc = Pinecone(api_key=PINECONE_API_KEY)
         index = pc.Index("medical-records")
         
-        # Get current vector count to determine new IDs
-        stats = index.describe_index_stats()
-        current_vector_count = stats.total_vector_count
-        print(f"Current vector count: {current_vector_count}")
-        
         # Generate embeddings for new documents
         print("Generating embeddings for new documents...")
         vectors = []
@@ -94,8 +90,8 @@ async def add_new_data_to_pinecone():
             embedding = get_embedding_with_fallback(doc.page_content)
             
             if embedding is not None:
-                # Create a unique ID for each vector
-                vector_id = f"chunk_{current_vector_count + i}"
+                # Record-keyed ID, so re-running overwrites these records instead of adding copies
+                vector_id = record_vector_id(doc.page_content, doc.metadata)
                 
                 # Prepare metadata
                 metadata = doc.metadata.copy()
@@ -0,0 +1,111 @@
+"""
+Semantic answer cache for MedicalRAG.ask_question.
+A stored answer is reused when a new query embeds within a cosine
+distance threshold of an earlier one, retrieves the same chunks and
+was answered against the same index version and conversation context.
+"""
+
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+from dotenv import load_dotenv
+
+import numpy as np
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Configuration
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "512"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "1800"))
+ANSWER_CACHE_MAX_DISTANCE = float(os.getenv("ANSWER_CACHE_MAX_DISTANCE", "0.05"))
+
+class SemanticAnswerCache:
+    def __init__(self, max_size: int = ANSWER_CACHE_SIZE, ttl: float = ANSWER_CACHE_TTL,
+                 max_distance: float = ANSWER_CACHE_MAX_DISTANCE):
+        """Initialize the cache with size, TTL (seconds) and cosine distance limits"""
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_distance = max_distance
+        # (index_version, chunk_ids, context_key) -> list of (stored_at, normalized embedding, answer)
+        self.entries: "OrderedDict[Tuple[int, Tuple[str, ...], str], List[Tuple[float, np.ndarray, str]]]" = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _normalize(embedding: Sequence[float]) -> Optional[np.ndarray]:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            return None
+        return vector / norm
+
+    def get(self, embedding: Sequence[float], chunk_ids: Sequence[str], index_version: int,
+            context_key: str = "") -> Optional[str]:
+        """Return a cached answer for a near-identical query over the same chunks"""
+        query = self._normalize(embedding)
+        key = (index_version, tuple(chunk_ids), context_key)
+        with self.lock:
+            bucket = self.entries.get(key)
+            if query is None or not bucket:
+                self.misses += 1
+                return None
+
+            now = time.monotonic()
+            fresh = [entry for entry in bucket if now - entry[0] <= self.ttl]
+            self.size -= len(bucket) - len(fresh)
+            if not fresh:
+                del self.entries[key]
+                self.misses += 1
+                return None
+            self.entries[key] = fresh
+
+            matrix = np.stack([entry[1] for entry in fresh])
+            distances = 1.0 - matrix @ query
+            best = int(np.argmin(distances))
+            if distances[best] > self.max_distance:
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return fresh[best][2]
+
+    def put(self, embedding: Sequence[float], chunk_ids: Sequence[str], index_version: int, answer: str,
+            context_key: str = ""):
+        """Store an answer for the query embedding and retrieved chunks"""
+        query = self._normalize(embedding)
+        if query is None or self.max_size <= 0:
+            return
+        key = (index_version, tuple(chunk_ids), context_key)
+        with self.lock:
+            self.entries.setdefault(key, []).append((time.monotonic(), query, answer))
+            self.entries.move_to_end(key)
+            self.size += 1
+            # Evict whole buckets, least recently used first
+            while self.size > self.max_size and self.entries:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self):
+        """Drop all cached answers"""
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss counters and the current size"""
+        with self.lock:
+            return {
+                "size": self.size,
+                "hits": self.hits,
+                "misses": self.misses
+            }
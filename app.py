@@ -1,11 +1,14 @@
 import os
 import json
+import asyncio
 import logging
-from flask import Flask, request, jsonify
+import uuid
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 from dotenv import load_dotenv
 from medical_rag import MedicalRAG
 from background_processor import start_background_processor, queue_file_for_processing
+from update_rag import update_rag_with_provided_data
 from datetime import datetime
 
 # Load environment variables
@@ -30,11 +33,15 @@ rag = MedicalRAG()
 # Start background processor
 start_background_processor()
 
+def get_session_id(data):
+    """Session id from the request body or X-Session-Id header; a new one if absent"""
+    return str(data.get('session_id') or request.headers.get('X-Session-Id') or uuid.uuid4())
+
 @app.route('/', methods=['GET'])
 def home():
     """Root endpoint"""
     logger.info("Root endpoint accessed")
-    return jsonify({"message": "Medical RAG API is running", "endpoints": ["/health", "/ask", "/update_rag"]}), 200
+    return jsonify({"message": "Medical RAG API is running", "endpoints": ["/health", "/stats", "/ask", "/ask/stream", "/ask/batch", "/update_rag"]}), 200
 
 @app.route('/health', methods=['GET'])
 def health_check():
@@ -42,6 +49,12 @@ def health_check():
     logger.info("Health check endpoint accessed")
     return jsonify({"status": "healthy", "message": "Medical RAG API is running"}), 200
 
+@app.route('/stats', methods=['GET'])
+def stats():
+    """Runtime counters for caches and upstream calls"""
+    logger.info("Stats endpoint accessed")
+    return jsonify(rag.get_stats()), 200
+
 @app.route('/ask', methods=['POST'])
 def ask_question():
     """Endpoint to ask questions about medical records"""
@@ -53,16 +66,68 @@ def ask_question():
             return jsonify({"error": "Missing 'question' in request body"}), 400
         
         question = data['question']
+        session_id = get_session_id(data)
         logger.info(f"Processing question: {question}")
-        response = rag.ask_question(question)
+        response = rag.ask_question(question, session_id)
         logger.info(f"Question processed successfully")
         
-        return jsonify({"question": question, "answer": response}), 200
+        return jsonify({"question": question, "answer": response, "session_id": session_id}), 200
         
     except Exception as e:
         logger.error(f"Error processing question: {e}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/ask/stream', methods=['POST'])
+def ask_question_stream():
+    """Endpoint to ask questions and receive the answer as Server-Sent Events"""
+    data = request.get_json(silent=True)
+    
+    if not data or 'question' not in data:
+        logger.warning("Missing 'question' in request body")
+        return jsonify({"error": "Missing 'question' in request body"}), 400
+    
+    question = data['question']
+    session_id = get_session_id(data)
+    logger.info(f"Processing streaming question: {question}")
+    
+    def generate():
+        try:
+            for event in rag.ask_question_stream(question, session_id):
+                yield f"event: {event['event']}\ndata: {json.dumps(event['data'], default=str)}\n\n"
+        except Exception as e:
+            logger.error(f"Error streaming question: {e}")
+            yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.route('/ask/batch', methods=['POST'])
+def ask_questions_batch():
+    """Endpoint to ask many independent questions in one request"""
+    try:
+        data = request.get_json()
+        
+        if not data or not isinstance(data.get('questions'), list):
+            logger.warning("Missing 'questions' list in request body")
+            return jsonify({"error": "Missing 'questions' list in request body"}), 400
+        
+        questions = data['questions']
+        logger.info(f"Processing batch of {len(questions)} questions")
+        if 'max_concurrency' in data:
+            results = rag.ask_many(questions, max_concurrency=int(data['max_concurrency']))
+        else:
+            results = rag.ask_many(questions)
+        logger.info("Batch processed successfully")
+        
+        return jsonify({"results": results}), 200
+        
+    except Exception as e:
+        logger.error(f"Error processing batch: {e}")
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/update_rag', methods=['POST'])
 def update_rag_data():
     """Endpoint to update RAG with new data"""
@@ -79,6 +144,13 @@ def update_rag_data():
         # Extract the actual data from the payload
         payload_data = data.get('data', data)
         
+        # Callers that advance a sync watermark ask to wait until the rows are ingested
+        if isinstance(data, dict) and data.get('wait'):
+            logger.info("Processing RAG update before responding")
+            if not asyncio.run(update_rag_with_provided_data(payload_data)):
+                return jsonify({"error": "RAG update failed"}), 500
+            return jsonify({"message": "RAG update completed"}), 200
+        
         # Save received data to a temporary file for processing
         import json
         import os
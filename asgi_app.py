@@ -0,0 +1,201 @@
+"""
+ASGI entry point for the Medical RAG API.
+Serves the same endpoints as app.py on top of AsyncMedicalRAG, e.g.:
+
+    hypercorn asgi_app:app --bind 0.0.0.0:8000
+"""
+
+import os
+import json
+import asyncio
+import logging
+import uuid
+from datetime import datetime
+from quart import Quart, request, jsonify
+from quart_cors import cors
+from dotenv import load_dotenv
+from async_medical_rag import AsyncMedicalRAG
+from background_processor import start_background_processor, queue_file_for_processing
+from update_rag import update_rag_with_provided_data
+
+# Load environment variables
+load_dotenv()
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Initialize Quart app
+app = Quart(__name__)
+
+# Configure CORS for localhost:3000 and localhost:3500
+app = cors(app, allow_origin=["http://localhost:3000", "http://localhost:3500"])
+
+# Initialize the async Medical RAG system
+rag = AsyncMedicalRAG()
+
+@app.before_serving
+async def startup():
+    """Start background processing once the server is up"""
+    start_background_processor()
+
+@app.after_serving
+async def shutdown():
+    """Release the shared HTTP connection pool"""
+    await rag.aclose()
+
+def get_session_id(data):
+    """Session id from the request body or X-Session-Id header; a new one if absent"""
+    return str(data.get('session_id') or request.headers.get('X-Session-Id') or uuid.uuid4())
+
+@app.route('/', methods=['GET'])
+async def home():
+    """Root endpoint"""
+    logger.info("Root endpoint accessed")
+    return jsonify({"message": "Medical RAG API is running", "endpoints": ["/health", "/stats", "/ask", "/ask/stream", "/ask/batch", "/update_rag"]}), 200
+
+@app.route('/health', methods=['GET'])
+async def health_check():
+    """Health check endpoint"""
+    logger.info("Health check endpoint accessed")
+    return jsonify({"status": "healthy", "message": "Medical RAG API is running"}), 200
+
+@app.route('/stats', methods=['GET'])
+async def stats():
+    """Runtime counters for caches and upstream calls"""
+    logger.info("Stats endpoint accessed")
+    return jsonify(rag.get_stats()), 200
+
+@app.route('/ask', methods=['POST'])
+async def ask_question():
+    """Endpoint to ask questions about medical records"""
+    try:
+        data = await request.get_json()
+
+        if not data or 'question' not in data:
+            logger.warning("Missing 'question' in request body")
+            return jsonify({"error": "Missing 'question' in request body"}), 400
+
+        question = data['question']
+        session_id = get_session_id(data)
+        logger.info(f"Processing question: {question}")
+        response = await rag.aask_question(question, session_id)
+        logger.info("Question processed successfully")
+
+        return jsonify({"question": question, "answer": response, "session_id": session_id}), 200
+
+    except Exception as e:
+        logger.error(f"Error processing question: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/ask/stream', methods=['POST'])
+async def ask_question_stream():
+    """Endpoint to ask questions and receive the answer as Server-Sent Events"""
+    data = await request.get_json(silent=True)
+
+    if not data or 'question' not in data:
+        logger.warning("Missing 'question' in request body")
+        return jsonify({"error": "Missing 'question' in request body"}), 400
+
+    question = data['question']
+    session_id = get_session_id(data)
+    logger.info(f"Processing streaming question: {question}")
+
+    async def generate():
+        try:
+            async for event in rag.aask_question_stream(question, session_id):
+                yield f"event: {event['event']}\ndata: {json.dumps(event['data'], default=str)}\n\n"
+        except Exception as e:
+            logger.error(f"Error streaming question: {e}")
+            yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+
+    return generate(), 200, {
+        "Content-Type": "text/event-stream",
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    }
+
+@app.route('/ask/batch', methods=['POST'])
+async def ask_questions_batch():
+    """Endpoint to ask many independent questions in one request"""
+    try:
+        data = await request.get_json()
+
+        if not data or not isinstance(data.get('questions'), list):
+            logger.warning("Missing 'questions' list in request body")
+            return jsonify({"error": "Missing 'questions' list in request body"}), 400
+
+        questions = data['questions']
+        logger.info(f"Processing batch of {len(questions)} questions")
+        # The batch path manages its own thread pools, so keep it off the event loop
+        if 'max_concurrency' in data:
+            results = await asyncio.to_thread(rag.ask_many, questions, int(data['max_concurrency']))
+        else:
+            results = await asyncio.to_thread(rag.ask_many, questions)
+        logger.info("Batch processed successfully")
+
+        return jsonify({"results": results}), 200
+
+    except Exception as e:
+        logger.error(f"Error processing batch: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/update_rag', methods=['POST'])
+async def update_rag_data():
+    """Endpoint to update RAG with new data"""
+    try:
+        data = await request.get_json()
+
+        if not data:
+            logger.warning("No data provided in update RAG request")
+            return jsonify({"error": "No data provided"}), 400
+
+        # Log the received data
+        logger.info(f"Received data for RAG update: {data.keys() if isinstance(data, dict) else 'Non-dict data'}")
+
+        # Extract the actual data from the payload
+        payload_data = data.get('data', data)
+
+        # Callers that advance a sync watermark ask to wait until the rows are ingested;
+        # ingestion blocks, so it runs on its own event loop in a worker thread
+        if isinstance(data, dict) and data.get('wait'):
+            logger.info("Processing RAG update before responding")
+            if not await asyncio.to_thread(lambda: asyncio.run(update_rag_with_provided_data(payload_data))):
+                return jsonify({"error": "RAG update failed"}), 500
+            return jsonify({"message": "RAG update completed"}), 200
+
+        # Create a timestamp for this update
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        temp_file = f"temp_update_{timestamp}.json"
+
+        # Save the received data
+        with open(temp_file, "w") as f:
+            json.dump(payload_data, f, indent=2, default=str)
+
+        logger.info(f"Data saved to {temp_file}")
+
+        # Queue the file for background processing
+        queue_file_for_processing(temp_file)
+        logger.info("Queued RAG update for background processing")
+
+        return jsonify({
+            "message": "Data received and queued for RAG update",
+            "received_items": len(payload_data) if isinstance(payload_data, list) else 1,
+            "timestamp": timestamp
+        }), 200
+
+    except Exception as e:
+        logger.error(f"Error in update_rag_data: {e}")
+        return jsonify({"error": str(e)}), 500
+
+if __name__ == '__main__':
+    from hypercorn.asyncio import serve
+    from hypercorn.config import Config
+
+    config = Config()
+    config.bind = [f"0.0.0.0:{int(os.environ.get('PORT', 8000))}"]
+    logger.info(f"Starting async Medical RAG API on {config.bind[0]}")
+    asyncio.run(serve(app, config))
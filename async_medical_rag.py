@@ -0,0 +1,265 @@
+"""
+Asynchronous query path for the Medical RAG system.
+Embedding and chat completion calls go through the shared httpx.AsyncClient
+connection pool, so a single worker can hold many in-flight questions.
+Retrieval, caching and prompt logic is shared with MedicalRAG; blocking
+vector store and BM25 calls run in worker threads.
+"""
+
+import json
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import httpx
+
+from medical_rag import MedicalRAG, StreamError, DEFAULT_SESSION_ID
+from embedding_cache import normalize_text
+from single_flight import AsyncSingleFlight
+from hedging import AsyncRequestHedger, HedgeTimeout
+from http_clients import get_async_client, close_async_clients, EMBEDDING_READ_TIMEOUT, LLM_READ_TIMEOUT
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+class AsyncMedicalRAG(MedicalRAG):
+    def __init__(self):
+        """Initialize the Medical RAG system with async HTTP clients"""
+        super().__init__()
+        self.async_embedding_flight = AsyncSingleFlight("embedding")
+        self.async_generation_flight = AsyncSingleFlight("generation")
+        # Shares latency samples and the hedge budget with the sync path
+        self.async_hedger = AsyncRequestHedger(self.hedger.policy)
+        logger.info("Async Medical RAG system initialized successfully")
+
+    async def aclose(self):
+        """Close the shared HTTP connection pools"""
+        await close_async_clients()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return runtime counters, including the async single-flight tables"""
+        stats = super().get_stats()
+        stats["async_single_flight"] = {
+            "embedding": self.async_embedding_flight.stats(),
+            "generation": self.async_generation_flight.stats()
+        }
+        return stats
+
+    async def aget_embedding(self, text: str) -> Optional[List[float]]:
+        """Generate embedding for text using Sambanova API without blocking the event loop"""
+        cached = self.embedding_cache.get(text, self.embedding_model)
+        if cached is not None:
+            logger.debug("Using cached query embedding")
+            return cached
+
+        key = (self.embedding_model, normalize_text(text))
+        return await self.async_embedding_flight.do(key, self.arequest_embedding, text)
+
+    async def arequest_embedding(self, text: str) -> Optional[List[float]]:
+        """Call the Sambanova embeddings API for a single text"""
+        try:
+            payload = {
+                "model": self.embedding_model,
+                "input": text
+            }
+
+            logger.debug(f"Generating embedding for text (length: {len(text)} chars)")
+            response = await self.key_pool.arequest(
+                lambda api_key: get_async_client(api_key).post("/embeddings", json=payload,
+                                                               timeout=EMBEDDING_READ_TIMEOUT)
+            )
+
+            if response.status_code == 200:
+                data = response.json()
+                if 'data' in data and len(data['data']) > 0:
+                    logger.debug("Successfully generated embedding")
+                    embedding = data['data'][0]['embedding']
+                    self.embedding_cache.put(text, self.embedding_model, embedding)
+                    return embedding
+                else:
+                    logger.error("Unexpected embedding response format")
+                    return None
+            else:
+                logger.error(f"Error generating embedding: {response.status_code} - {response.text}")
+                return None
+
+        except httpx.TimeoutException:
+            logger.error("Request timeout while generating embedding")
+            return None
+        except Exception as error:
+            logger.error(f"Error generating embedding: {error}")
+            return None
+
+    async def asearch_similar_documents(self, query: str, query_embedding: List[float],
+                                        top_k: int = 5) -> List[Dict]:
+        """Search the vector store in a worker thread (Pinecone client, or local store query and reload)"""
+        return await asyncio.to_thread(self.search_similar_documents, query, top_k, query_embedding)
+
+    async def aretrieve(self, query: str) -> Tuple[Optional[List[float]], List[Dict]]:
+        """Embed the query and retrieve relevant documents"""
+        lexical_matches = await asyncio.to_thread(self.lexical_lookup, query)
+        if lexical_matches:
+            return None, lexical_matches
+
+        query_embedding = await self.aget_embedding(query)
+        if query_embedding is None:
+            logger.warning("Failed to generate query embedding")
+            return None, []
+        return query_embedding, await self.asearch_similar_documents(query, query_embedding)
+
+    async def agenerate_response(self, query: str, context_documents: List[Dict],
+                                 history: Optional[List[Dict[str, str]]] = None) -> str:
+        """Generate response using the LLM with RAG context"""
+        try:
+            payload = self.build_llm_payload(query, context_documents, history=history)
+
+            logger.info("Generating response with LLM...")
+            # The losing request of a hedge is cancelled, which closes its stream
+            send = lambda: self.key_pool.arequest(
+                lambda api_key: get_async_client(api_key).post("/chat/completions", json=payload,
+                                                               timeout=LLM_READ_TIMEOUT)
+            )
+            response = await self.async_hedger.call(
+                send,
+                send if len(self.key_pool) > 1 else None,
+                deadline=LLM_READ_TIMEOUT,
+                accept=lambda result: result.status_code == 200
+            )
+
+            if response.status_code == 200:
+                data = response.json()
+                if 'choices' in data and len(data['choices']) > 0:
+                    logger.info("Successfully generated response")
+                    return data['choices'][0]['message']['content']
+                else:
+                    logger.error("Unexpected response format from LLM")
+                    return "Sorry, I received an unexpected response format."
+            else:
+                logger.error(f"Error generating response: {response.status_code} - {response.text}")
+                return "Sorry, I encountered an error while generating the response."
+
+        except (httpx.TimeoutException, HedgeTimeout):
+            logger.error("Request timeout while generating response")
+            return "Sorry, the request timed out. Please try again."
+        except Exception as error:
+            logger.error(f"Error generating response: {error}")
+            return "Sorry, I encountered an error while generating the response."
+
+    async def aopen_stream(self, api_key: str, payload: Dict) -> httpx.Response:
+        """Send a streaming chat completion request and return once headers arrive"""
+        client = get_async_client(api_key)
+        request = client.build_request("POST", "/chat/completions", json=payload, timeout=LLM_READ_TIMEOUT)
+        return await client.send(request, stream=True)
+
+    async def astream_response(self, query: str, context_documents: List[Dict],
+                               history: Optional[List[Dict[str, str]]] = None) -> AsyncIterator[str]:
+        """Generate response using the LLM with RAG context, yielding tokens as they arrive
+
+        Raises StreamError if the request fails or the stream breaks off, so a
+        partial answer is never mistaken for a complete one.
+        """
+        try:
+            payload = self.build_llm_payload(query, context_documents, stream=True, history=history)
+
+            logger.info("Streaming response from LLM...")
+            # The key counts as busy until the whole answer has been read
+            async with self.key_pool.astream(lambda api_key: self.aopen_stream(api_key, payload)) as response:
+                if response.status_code != 200:
+                    body = await response.aread()
+                    logger.error(f"Error streaming response: {response.status_code} - {body.decode(errors='replace')}")
+                    raise StreamError("Sorry, I encountered an error while generating the response.")
+
+                # Server-sent events: one "data: {...}" line per chunk, ending with "data: [DONE]"
+                finished = False
+                async for line in response.aiter_lines():
+                    if not line or not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        finished = True
+                        break
+                    chunk = json.loads(data)
+                    choices = chunk.get('choices') or []
+                    if choices:
+                        token = (choices[0].get('delta') or {}).get('content')
+                        if token:
+                            yield token
+                if not finished:
+                    logger.error("LLM stream ended before [DONE]")
+                    raise StreamError("Sorry, the response was cut off. Please try again.")
+
+            logger.info("Successfully streamed response")
+
+        except StreamError:
+            raise
+        except httpx.TimeoutException as error:
+            logger.error("Request timeout while streaming response")
+            raise StreamError("Sorry, the request timed out. Please try again.") from error
+        except Exception as error:
+            logger.error(f"Error streaming response: {error}")
+            raise StreamError("Sorry, I encountered an error while generating the response.") from error
+
+    async def aanswer_from_documents(self, query: str, query_embedding: Optional[List[float]],
+                                     relevant_docs: List[Dict], history: List[Dict[str, str]]) -> str:
+        """Async counterpart of MedicalRAG.answer_from_documents"""
+        plan = self.plan_answer(query, query_embedding, relevant_docs, history)
+        if plan.response is not None:
+            return plan.response
+
+        response = await self.async_generation_flight.do(
+            plan.flight_key, self.agenerate_response, query, relevant_docs, history
+        )
+        self.store_answer(query_embedding, plan, response)
+        return response
+
+    async def aask_question(self, query: str, session_id: str = DEFAULT_SESSION_ID) -> str:
+        """Main async method to ask a question and get a response"""
+        if not query or not query.strip():
+            logger.warning("Empty or invalid question provided")
+            return "Please provide a valid question."
+
+        logger.info(f"Processing question: {query[:50]}...")
+        query_embedding, relevant_docs = await self.aretrieve(query)
+        history = self.sessions.get_turns(session_id)
+        response = await self.aanswer_from_documents(query, query_embedding, relevant_docs, history)
+
+        # Store in chat history
+        self.record_turn(query, response, session_id)
+
+        logger.info("Question processed successfully")
+        return response
+
+    async def aask_question_stream(self, query: str, session_id: str = DEFAULT_SESSION_ID) -> AsyncIterator[Dict[str, Any]]:
+        """Ask a question, yielding retrieval results first and then answer tokens"""
+        if not query or not query.strip():
+            logger.warning("Empty or invalid question provided")
+            yield {"event": "error", "data": {"error": "Please provide a valid question."}}
+            return
+
+        logger.info(f"Processing streaming question: {query[:50]}...")
+        query_embedding, relevant_docs = await self.aretrieve(query)
+        yield {"event": "documents", "data": {"documents": relevant_docs}}
+
+        history = self.sessions.get_turns(session_id)
+        plan = self.plan_answer(query, query_embedding, relevant_docs, history)
+        if plan.response is not None:
+            response = plan.response
+            yield {"event": "token", "data": {"content": response}}
+        else:
+            tokens = []
+            try:
+                async for token in self.astream_response(query, relevant_docs, history):
+                    tokens.append(token)
+                    yield {"event": "token", "data": {"content": token}}
+            except StreamError as error:
+                # Nothing is cached or kept in the history for a failed answer
+                yield {"event": "error", "data": {"error": str(error), "partial": "".join(tokens)}}
+                return
+            response = "".join(tokens)
+            self.store_answer(query_embedding, plan, response)
+
+        # Store in chat history once the full answer is known
+        self.record_turn(query, response, session_id)
+
+        logger.info("Streaming question processed successfully")
+        yield {"event": "done", "data": {"answer": response}}
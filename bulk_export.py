@@ -0,0 +1,154 @@
+"""
+Parallel bulk export of the Prisma tables.
+All six tables are exported concurrently over an asyncpg pool with
+COPY ... TO STDOUT instead of row-by-row fetches. Tables larger than
+BULK_EXPORT_SPLIT_ROWS are split into primary key ranges taken from the
+planner's histogram (pg_stats), so one large table is also exported on
+several connections at once.
+"""
+
+import os
+import re
+import csv
+import io
+import time
+import uuid
+import asyncio
+import logging
+import tempfile
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from typing import Callable, Dict, List, Optional, Tuple
+
+import asyncpg
+from dotenv import load_dotenv
+
+from record_ids import RECORD_TABLES
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Configuration
+DATABASE_URL = os.getenv("DATABASE_URL")
+BULK_EXPORT_POOL_SIZE = int(os.getenv("BULK_EXPORT_POOL_SIZE", "8"))
+BULK_EXPORT_SPLIT_ROWS = int(os.getenv("BULK_EXPORT_SPLIT_ROWS", "100000"))
+
+# COPY writes NULL as this marker so it can be told apart from an empty string
+# (the csv module drops the quoting COPY would put around a real "\N")
+NULL_MARKER = "\\N{bulk-export-null}"
+
+TIMESTAMP_PATTERN = re.compile(r"^(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d)(?:\.(\d{1,6}))?(?:([+-]\d\d)(?::?(\d\d))?)?$")
+
+def _quote_literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+def parse_timestamp(text: str) -> datetime:
+    """Parse PostgreSQL's text timestamp output into the datetime asyncpg would return"""
+    match = TIMESTAMP_PATTERN.match(text)
+    if not match:
+        raise ValueError(f"Unrecognised timestamp {text!r}")
+    base, fraction, offset_hours, offset_minutes = match.groups()
+    value = f"{base}.{(fraction or '').ljust(6, '0')}"
+    if offset_hours is None:
+        return datetime.fromisoformat(value)
+    # asyncpg returns timestamptz values in UTC
+    parsed = datetime.fromisoformat(f"{value}{offset_hours}:{offset_minutes or '00'}")
+    return parsed.astimezone(timezone.utc)
+
+# PostgreSQL type name -> converter from COPY text output; other types stay strings
+TYPE_CONVERTERS: Dict[str, Callable[[str], object]] = {
+    "int2": int,
+    "int4": int,
+    "int8": int,
+    "float4": float,
+    "float8": float,
+    "numeric": Decimal,
+    "bool": lambda text: text == "t",
+    "date": date.fromisoformat,
+    "timestamp": parse_timestamp,
+    "timestamptz": parse_timestamp,
+    "uuid": uuid.UUID
+}
+
+async def key_ranges(conn, table: str, parts: int) -> List[Tuple[Optional[str], Optional[str]]]:
+    """Split a table into about `parts` primary key ranges using the planner's histogram"""
+    _, _, primary_key = RECORD_TABLES[table]
+    bounds = await conn.fetchval(
+        "SELECT histogram_bounds::text::text[] FROM pg_stats "
+        "WHERE schemaname = current_schema() AND tablename = $1 AND attname = $2",
+        table, primary_key
+    )
+    if parts <= 1 or not bounds:
+        return [(None, None)]
+    step = len(bounds) / parts
+    cuts = sorted({bounds[int(step * i)] for i in range(1, parts)})
+    edges = [None, *cuts, None]
+    return list(zip(edges[:-1], edges[1:]))
+
+def range_query(table: str, low: Optional[str], high: Optional[str]) -> str:
+    _, _, primary_key = RECORD_TABLES[table]
+    conditions = []
+    if low is not None:
+        conditions.append(f'"{primary_key}" >= {_quote_literal(low)}')
+    if high is not None:
+        conditions.append(f'"{primary_key}" < {_quote_literal(high)}')
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+    return f'SELECT * FROM "{table}"{where}'
+
+async def copy_rows(pool, table: str, query: str) -> List[Dict]:
+    """COPY one query's rows out as CSV and parse them back into typed dicts"""
+    async with pool.acquire() as conn:
+        attributes = (await conn.prepare(f"{query} LIMIT 0")).get_attributes()
+        with tempfile.TemporaryFile() as buffer:
+            await conn.copy_from_query(query, output=buffer, format="csv", null=NULL_MARKER)
+            buffer.seek(0)
+            reader = csv.reader(io.TextIOWrapper(buffer, encoding="utf-8", newline=""))
+            converters = [TYPE_CONVERTERS.get(attribute.type.name) for attribute in attributes]
+            names = [attribute.name for attribute in attributes]
+            rows = []
+            for values in reader:
+                row = {}
+                for name, converter, value in zip(names, converters, values):
+                    if value == NULL_MARKER:
+                        row[name] = None
+                    elif converter is not None:
+                        row[name] = converter(value)
+                    else:
+                        row[name] = value
+                rows.append(row)
+    return rows
+
+async def bulk_export_prisma_data(pool_size: int = BULK_EXPORT_POOL_SIZE,
+                                  split_rows: int = BULK_EXPORT_SPLIT_ROWS) -> Dict[str, List[Dict]]:
+    """Export all Prisma tables concurrently; returns the same shape as fetch_prisma_data"""
+    if not DATABASE_URL:
+        raise ValueError("DATABASE_URL not found in environment variables")
+
+    started = time.monotonic()
+    pool = await asyncpg.create_pool(DATABASE_URL, min_size=1, max_size=pool_size)
+    try:
+        jobs = []
+        async with pool.acquire() as conn:
+            for table in RECORD_TABLES:
+                estimate = await conn.fetchval(
+                    "SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass($1)", f'"{table}"'
+                ) or 0
+                parts = min(pool_size, -(-estimate // split_rows)) if estimate > split_rows else 1
+                for low, high in await key_ranges(conn, table, parts):
+                    jobs.append((table, range_query(table, low, high)))
+
+        logger.info(f"Exporting {len(RECORD_TABLES)} tables as {len(jobs)} COPY jobs over {pool_size} connections")
+        results = await asyncio.gather(*(copy_rows(pool, table, query) for table, query in jobs))
+    finally:
+        await pool.close()
+
+    data = {data_key: [] for data_key, _, _ in RECORD_TABLES.values()}
+    for (table, _), rows in zip(jobs, results):
+        data[RECORD_TABLES[table][0]].extend(rows)
+    for table, (data_key, _, _) in RECORD_TABLES.items():
+        logger.info(f"  Exported {len(data[data_key])} rows from {table}")
+    logger.info(f"Bulk export finished in {time.monotonic() - started:.1f}s")
+    return data
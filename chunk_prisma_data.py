@@ -6,6 +6,9 @@ from dotenv import load_dotenv
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.docstore.document import Document
 import json
+from record_ids import RECORD_TABLES, assign_chunk_numbers
+from bulk_export import bulk_export_prisma_data
+from watermark_store import WATERMARK_COLUMN, Watermark, row_key
 
 # Set up logging
 logger = logging.getLogger(__name__)
@@ -15,6 +18,12 @@ load_dotenv()
 
 # Database configuration
 DATABASE_URL = os.getenv("DATABASE_URL")
+# Rows per page when streaming tables (stream_prisma_data)
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "500"))
+# The chunk corpus every ingestion path writes and the API's lexical index loads
+CHUNKED_DATA_PATH = os.getenv("CHUNKED_DATA_PATH", "chunked_prisma_data.json")
+# Export all tables concurrently with COPY (bulk_export.py) instead of sequential fetches
+BULK_EXPORT = os.getenv("BULK_EXPORT", "false").lower() == "true"
 
 async def fetch_prisma_data():
     """Fetch data from all Prisma database tables"""
@@ -23,6 +32,9 @@ async def fetch_prisma_data():
         if not DATABASE_URL:
             logger.error("DATABASE_URL not found in environment variables")
             return {}, []
+        
+        if BULK_EXPORT:
+            return await bulk_export_prisma_data()
             
         # Connect to the database
         logger.info("Connecting to Prisma database...")
@@ -78,6 +90,110 @@ async def fetch_prisma_data():
         logger.error(f"Error fetching data: {error}")
         return {}
 
+async def stream_table(conn, table, batch_size=STREAM_BATCH_SIZE):
+    """Yield a table's rows in primary key order, batch_size rows at a time
+
+    Keyset pagination: each page seeks past the last key on the primary key
+    index, so no page gets slower with depth and no transaction stays open.
+    """
+    _, _, primary_key = RECORD_TABLES[table]
+    last_key = None
+    while True:
+        if last_key is None:
+            rows = await conn.fetch(
+                f'SELECT * FROM "{table}" ORDER BY "{primary_key}" LIMIT $1', batch_size
+            )
+        else:
+            rows = await conn.fetch(
+                f'SELECT * FROM "{table}" WHERE "{primary_key}" > $1 ORDER BY "{primary_key}" LIMIT $2',
+                last_key, batch_size
+            )
+        if not rows:
+            return
+        yield [dict(record) for record in rows]
+        if len(rows) < batch_size:
+            return
+        last_key = rows[-1][primary_key]
+
+async def stream_prisma_data(batch_size=STREAM_BATCH_SIZE):
+    """Yield {data key: rows} batches from all Prisma tables instead of loading them whole"""
+    if not DATABASE_URL:
+        raise ValueError("DATABASE_URL not found in environment variables")
+    
+    logger.info("Connecting to Prisma database...")
+    conn = await asyncpg.connect(DATABASE_URL)
+    try:
+        for table, (data_key, _, _) in RECORD_TABLES.items():
+            logger.info(f"Streaming {table} data...")
+            count = 0
+            async for rows in stream_table(conn, table, batch_size):
+                count += len(rows)
+                yield {data_key: rows}
+            logger.info(f"  Streamed {count} rows from {table}")
+    finally:
+        await conn.close()
+
+async def fetch_changed_rows(conn, table, watermark, limit, column=WATERMARK_COLUMN):
+    """Up to `limit` rows of a table changed after watermark, oldest first
+
+    Rows are ordered by (column, primary key), so rows sharing a timestamp
+    are neither skipped nor repeated across pages.
+    """
+    _, _, primary_key = RECORD_TABLES[table]
+    order = f'ORDER BY "{column}", "{primary_key}" LIMIT'
+    if watermark is None:
+        rows = await conn.fetch(
+            f'SELECT * FROM "{table}" WHERE "{column}" IS NOT NULL {order} $1', limit
+        )
+    else:
+        rows = await conn.fetch(
+            f'SELECT * FROM "{table}" WHERE ("{column}", "{primary_key}") > ($1, $2) {order} $3',
+            watermark.changed_at, watermark.record_id, limit
+        )
+    return [dict(record) for record in rows]
+
+async def latest_watermark(conn, table, column=WATERMARK_COLUMN):
+    """Watermark of the newest row in a table, or None if it has no rows"""
+    _, _, primary_key = RECORD_TABLES[table]
+    row = await conn.fetchrow(
+        f'SELECT "{column}", "{primary_key}" FROM "{table}" WHERE "{column}" IS NOT NULL '
+        f'ORDER BY "{column}" DESC, "{primary_key}" DESC LIMIT 1'
+    )
+    return Watermark(row[column], str(row[primary_key])) if row else None
+
+async def collect_changes(conn, store, batch_size, column=WATERMARK_COLUMN):
+    """Rows changed since each synced table's watermark
+
+    Returns ({data key: rows}, {table: (new watermark, ingested row keys)}).
+    Tables without a watermark are read from the beginning. Every page of
+    the overlap window and beyond is read before returning, so the caller
+    can ingest all changes in a single update.
+    """
+    data = {}
+    advanced = {}
+    for table, (data_key, _, primary_key) in RECORD_TABLES.items():
+        watermark = store.get(table)
+        seen = store.recent(table)
+        cursor = store.window_start(watermark) if watermark else None
+        rows = []
+        keys = []
+        while True:
+            page = await fetch_changed_rows(conn, table, cursor, batch_size, column)
+            for row in page:
+                key = row_key(row[primary_key], row[column])
+                if key not in seen:
+                    rows.append(row)
+                    keys.append(key)
+            if page:
+                cursor = Watermark(page[-1][column], str(page[-1][primary_key]))
+                watermark = max(watermark, cursor) if watermark else cursor
+            if len(page) < batch_size:
+                break
+        if rows:
+            data[data_key] = rows
+            advanced[table] = (watermark, keys)
+    return data, advanced
+
 def convert_to_documents(data):
     """Convert fetched data to LangChain Documents"""
     documents = []
@@ -239,6 +355,9 @@ def chunk_documents(documents):
     # Split documents into chunks
     chunked_documents = text_splitter.split_documents(documents)
     
+    # Number each record's chunks so they get stable source:primary_key:chunk_no IDs
+    assign_chunk_numbers(chunk.metadata for chunk in chunked_documents)
+    
     return chunked_documents
 
 async def main():
@@ -278,10 +397,10 @@ async def main():
             "metadata": chunk.metadata
         })
     
-    with open("chunked_prisma_data.json", "w", encoding="utf-8") as f:
+    with open(CHUNKED_DATA_PATH, "w", encoding="utf-8") as f:
         json.dump(chunk_data, f, indent=2, default=str)
     
-    logger.info(f"\nAll chunks saved to 'chunked_prisma_data.json'")
+    logger.info(f"\nAll chunks saved to '{CHUNKED_DATA_PATH}'")
     
     return chunked_documents
 
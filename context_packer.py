@@ -0,0 +1,168 @@
+"""
+Token-budgeted context assembly for the LLM prompt.
+Drops near-duplicate chunks, keeps the sentences of each document that are
+most relevant to the query and stops once the token budget is spent.
+"""
+
+import os
+import re
+import math
+import logging
+import threading
+from typing import Dict, List, NamedTuple, Set
+from dotenv import load_dotenv
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Configuration
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+CONTEXT_DUPLICATE_THRESHOLD = float(os.getenv("CONTEXT_DUPLICATE_THRESHOLD", "0.85"))
+
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+SENTENCE_PATTERN = re.compile(r"(?<!Dr\.)(?<!Mr\.)(?<!Ms\.)(?<!Mrs\.)(?<=[.!?])\s+|\n+")
+URL_LINE_PATTERN = re.compile(r"^[\w\s]*URL:\s*\S+$", re.IGNORECASE)
+FIELD_LINE_PATTERN = re.compile(r"^(ID|[\w\s]+ ID|Name|Created):", re.IGNORECASE)
+
+class PackedContext(NamedTuple):
+    text: str
+    tokens: int
+    original_tokens: int
+    documents_used: int
+    documents_dropped: int
+
+    @property
+    def tokens_saved(self) -> int:
+        return max(self.original_tokens - self.tokens, 0)
+
+def estimate_tokens(text: str) -> int:
+    """Fast token estimate (~4 characters per token for English text)"""
+    return math.ceil(len(text) / 4)
+
+def _shingles(text: str, size: int = 3) -> Set[str]:
+    words = WORD_PATTERN.findall(text.lower())
+    if len(words) < size:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+def _jaccard(left: Set[str], right: Set[str]) -> float:
+    if not left or not right:
+        return 0.0
+    return len(left & right) / len(left | right)
+
+def _format_document(number: int, content: str, source: str, score: float) -> str:
+    return (
+        f"Document {number}:\n"
+        f"Content: {content}\n"
+        f"Source: {source}\n"
+        f"Relevance Score: {score:.4f}\n\n"
+    )
+
+class ContextPacker:
+    def __init__(self, token_budget: int = CONTEXT_TOKEN_BUDGET,
+                 duplicate_threshold: float = CONTEXT_DUPLICATE_THRESHOLD):
+        """Initialize the packer with a token budget and near-duplicate threshold"""
+        self.token_budget = token_budget
+        self.duplicate_threshold = duplicate_threshold
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.tokens_saved = 0
+
+    def _select_sentences(self, content: str, query_terms: Set[str], token_limit: int) -> str:
+        """Keep identifying fields plus the most query-relevant sentences, in original order"""
+        wants_urls = bool(query_terms & {"url", "urls", "audio", "file", "link", "certificate"})
+        sentences = [sentence.strip() for sentence in SENTENCE_PATTERN.split(content) if sentence.strip()]
+        if not sentences:
+            return ""
+
+        ranked = []
+        for position, sentence in enumerate(sentences):
+            if URL_LINE_PATTERN.match(sentence) and not wants_urls:
+                continue
+            terms = set(WORD_PATTERN.findall(sentence.lower()))
+            overlap = len(terms & query_terms)
+            # The record header and ID/name fields identify the record, so keep them first
+            pinned = position == 0 or bool(FIELD_LINE_PATTERN.match(sentence))
+            ranked.append((not pinned, -overlap, position, sentence))
+        ranked.sort()
+
+        chosen = []
+        used = 0
+        for _, _, position, sentence in ranked:
+            cost = estimate_tokens(sentence) + 1
+            if used + cost > token_limit and chosen:
+                continue
+            chosen.append((position, sentence))
+            used += cost
+        chosen.sort()
+        return "\n".join(sentence for _, sentence in chosen)
+
+    def pack(self, documents: List[Dict], query: str = "") -> PackedContext:
+        """Assemble context from ranked documents within the token budget"""
+        original_parts = []
+        for i, doc in enumerate(documents):
+            metadata = doc.get('metadata', {})
+            original_parts.append(_format_document(
+                i + 1, metadata.get('content', 'N/A'), metadata.get('source', 'N/A'), doc.get('score', 0.0)
+            ))
+        original_tokens = estimate_tokens("".join(original_parts))
+
+        query_terms = set(WORD_PATTERN.findall(query.lower()))
+        parts: List[str] = []
+        kept_shingles: List[Set[str]] = []
+        used = 0
+        dropped = 0
+        for i, doc in enumerate(documents):
+            metadata = doc.get('metadata', {})
+            content = metadata.get('content', 'N/A')
+
+            # Skip chunks that repeat something already in the context
+            shingles = _shingles(content)
+            if any(_jaccard(shingles, kept) >= self.duplicate_threshold for kept in kept_shingles):
+                dropped += 1
+                continue
+
+            remaining = self.token_budget - used
+            # Share what is left evenly between this and the remaining documents
+            share = remaining // (len(documents) - i)
+            overhead = estimate_tokens(_format_document(len(parts) + 1, "", metadata.get('source', 'N/A'), 0.0))
+            if share - overhead <= 0:
+                dropped += len(documents) - i
+                break
+
+            selected = self._select_sentences(content, query_terms, share - overhead)
+            part = _format_document(len(parts) + 1, selected, metadata.get('source', 'N/A'), doc.get('score', 0.0))
+            parts.append(part)
+            kept_shingles.append(shingles)
+            used += estimate_tokens(part)
+
+        text = "".join(parts)
+        packed = PackedContext(
+            text=text,
+            tokens=estimate_tokens(text),
+            original_tokens=original_tokens,
+            documents_used=len(parts),
+            documents_dropped=dropped
+        )
+
+        with self.lock:
+            self.requests += 1
+            self.tokens_saved += packed.tokens_saved
+
+        logger.info(
+            f"Packed context: {packed.tokens} tokens from {packed.documents_used} documents "
+            f"({packed.tokens_saved} tokens saved, {packed.documents_dropped} documents dropped)"
+        )
+        return packed
+
+    def stats(self) -> Dict[str, int]:
+        """Return the number of packed requests and total tokens saved"""
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "tokens_saved": self.tokens_saved,
+                "token_budget": self.token_budget
+            }
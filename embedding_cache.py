@@ -0,0 +1,181 @@
+"""
+Bounded, thread-safe LRU + TTL cache for query embeddings, and a persistent
+content-addressed cache (SQLite) shared by the ingestion pipeline runs.
+"""
+
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+from dotenv import load_dotenv
+
+import numpy as np
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Configuration
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "1024"))
+EMBEDDING_CACHE_TTL = float(os.getenv("EMBEDDING_CACHE_TTL", "3600"))
+PERSISTENT_EMBEDDING_CACHE_PATH = os.getenv("PERSISTENT_EMBEDDING_CACHE_PATH", "embedding_cache.sqlite3")
+
+# SQLite limits the number of bound parameters per statement
+SQLITE_BATCH_SIZE = 500
+
+def normalize_text(text: str) -> str:
+    """Normalize query text so trivially different phrasings share a cache key"""
+    return ' '.join(text.lower().split())
+
+def content_hash(text: str) -> str:
+    """Hash of the exact chunk text, the persistent cache key"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+class EmbeddingCache:
+    def __init__(self, max_size: int = EMBEDDING_CACHE_SIZE, ttl: float = EMBEDDING_CACHE_TTL):
+        """Initialize the cache with a maximum entry count and a TTL in seconds"""
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries: "OrderedDict[Tuple[str, str], Tuple[float, List[float]]]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, text: str, model: str) -> Optional[List[float]]:
+        """Return the cached embedding for text and model, or None"""
+        key = (model, normalize_text(text))
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            stored_at, embedding = entry
+            if time.monotonic() - stored_at > self.ttl:
+                del self.entries[key]
+                self.evictions += 1
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return embedding
+
+    def put(self, text: str, model: str, embedding: List[float]):
+        """Store an embedding, evicting the least recently used entries if full"""
+        if self.max_size <= 0:
+            return
+        key = (model, normalize_text(text))
+        with self.lock:
+            self.entries[key] = (time.monotonic(), embedding)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Drop all cached embeddings"""
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss counters and the current size"""
+        with self.lock:
+            return {
+                "size": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
+
+class PersistentEmbeddingCache:
+    def __init__(self, path: str = PERSISTENT_EMBEDDING_CACHE_PATH):
+        """Open (or create) the on-disk cache of embeddings keyed by model and content hash"""
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " model TEXT NOT NULL,"
+                " content_hash TEXT NOT NULL,"
+                " vector BLOB NOT NULL,"
+                " PRIMARY KEY (model, content_hash)"
+                ") WITHOUT ROWID"
+            )
+            self.conn.commit()
+
+    def get_many(self, texts: List[str], model: str) -> List[Optional[List[float]]]:
+        """Return the stored embedding for each text, or None where there is none"""
+        hashes = [content_hash(text) for text in texts]
+        found: Dict[str, List[float]] = {}
+        with self.lock:
+            unique = list(dict.fromkeys(hashes))
+            for start in range(0, len(unique), SQLITE_BATCH_SIZE):
+                batch = unique[start:start + SQLITE_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                rows = self.conn.execute(
+                    f"SELECT content_hash, vector FROM embeddings WHERE model = ? AND content_hash IN ({placeholders})",
+                    [model, *batch]
+                ).fetchall()
+                for digest, vector in rows:
+                    found[digest] = np.frombuffer(vector, dtype=np.float32).tolist()
+            embeddings = [found.get(digest) for digest in hashes]
+            hits = sum(embedding is not None for embedding in embeddings)
+            self.hits += hits
+            self.misses += len(embeddings) - hits
+        return embeddings
+
+    def get(self, text: str, model: str) -> Optional[List[float]]:
+        """Return the stored embedding for text and model, or None"""
+        return self.get_many([text], model)[0]
+
+    def put_many(self, items: Iterable[Tuple[str, List[float]]], model: str):
+        """Store (text, embedding) pairs as float32 blobs"""
+        rows = [
+            (model, content_hash(text), np.asarray(embedding, dtype=np.float32).tobytes())
+            for text, embedding in items if embedding is not None
+        ]
+        if not rows:
+            return
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, content_hash, vector) VALUES (?, ?, ?)", rows
+            )
+            self.conn.commit()
+
+    def put(self, text: str, model: str, embedding: List[float]):
+        """Store one embedding"""
+        self.put_many([(text, embedding)], model)
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss counters and the number of stored embeddings"""
+        with self.lock:
+            size = self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            return {
+                "size": size,
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+_persistent_cache: Optional[PersistentEmbeddingCache] = None
+_persistent_cache_lock = threading.Lock()
+
+def get_persistent_embedding_cache() -> PersistentEmbeddingCache:
+    """Return the process-wide persistent embedding cache"""
+    global _persistent_cache
+    with _persistent_cache_lock:
+        if _persistent_cache is None:
+            _persistent_cache = PersistentEmbeddingCache()
+        return _persistent_cache
@@ -0,0 +1,195 @@
+"""
+Append-only checkpoint log for generated embeddings.
+Each new embedding is appended to a JSON-lines log (fsync'd in batches)
+instead of rewriting the whole embeddings file. Compaction folds the log
+into the embeddings snapshot (the binary store, or JSON when
+EMBEDDING_STORE_FORMAT=json) through an atomic rename, so a crash never
+leaves a half-written snapshot behind.
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional
+from dotenv import load_dotenv
+
+import numpy as np
+
+from record_ids import vector_id
+from embedding_store import (
+    BinaryEmbeddingStore, write_binary_store, remove_binary_store,
+    EMBEDDING_STORE_FORMAT, EMBEDDING_SIDECAR_PATH
+)
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Configuration
+EMBEDDINGS_SNAPSHOT_PATH = os.getenv("LOCAL_EMBEDDINGS_PATH", "embedded_prisma_data.json")
+EMBEDDING_LOG_PATH = os.getenv("EMBEDDING_LOG_PATH", "embedded_prisma_data.log")
+EMBEDDING_LOG_FSYNC_EVERY = int(os.getenv("EMBEDDING_LOG_FSYNC_EVERY", "64"))
+EMBEDDING_LOG_FSYNC_INTERVAL = float(os.getenv("EMBEDDING_LOG_FSYNC_INTERVAL", "1.0"))
+
+def _json_default(value: Any) -> Any:
+    # Embeddings read from the binary store are NumPy rows
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return str(value)
+
+class EmbeddingCheckpointLog:
+    def __init__(self, log_path: str = EMBEDDING_LOG_PATH, fsync_every: int = EMBEDDING_LOG_FSYNC_EVERY,
+                 fsync_interval: float = EMBEDDING_LOG_FSYNC_INTERVAL):
+        """Open the log for appending; records are durable once sync() has run"""
+        self.log_path = log_path
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.file = open(log_path, "a", encoding="utf-8")
+        # Terminate a torn last line left by a crash so new records start cleanly
+        if self.file.tell() > 0:
+            with open(log_path, "rb") as existing:
+                existing.seek(-1, os.SEEK_END)
+                if existing.read(1) != b"\n":
+                    self.file.write("\n")
+        self.pending = 0
+        self.last_sync = time.monotonic()
+        self.appended = 0
+
+    def append(self, record: Dict):
+        """Append one {"content", "metadata", "embedding"} record"""
+        self.file.write(json.dumps(record, separators=(",", ":"), default=_json_default) + "\n")
+        self.pending += 1
+        self.appended += 1
+        if self.pending >= self.fsync_every or time.monotonic() - self.last_sync >= self.fsync_interval:
+            self.sync()
+
+    def sync(self):
+        """Flush and fsync everything appended so far"""
+        if self.pending:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.pending = 0
+        self.last_sync = time.monotonic()
+
+    def close(self):
+        self.sync()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+def replay_log(log_path: str = EMBEDDING_LOG_PATH) -> Iterator[Dict]:
+    """Yield logged records one line at a time; a torn final line from a crash is skipped"""
+    if not os.path.exists(log_path):
+        return
+    with open(log_path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                logger.warning(f"Skipping unreadable record at {log_path}:{line_number}")
+
+def iter_snapshot(snapshot_path: str = EMBEDDINGS_SNAPSHOT_PATH) -> Iterator[Dict]:
+    """Yield snapshot records; compacted snapshots are streamed one record per line"""
+    if not os.path.exists(snapshot_path):
+        return
+    with open(snapshot_path, "r", encoding="utf-8") as f:
+        if f.readline().strip() == "[":
+            try:
+                for line in f:
+                    line = line.strip().rstrip(",")
+                    if line and line != "]":
+                        yield json.loads(line)
+                return
+            except json.JSONDecodeError:
+                # Pretty-printed snapshot from before compaction existed
+                pass
+
+    with open(snapshot_path, "r", encoding="utf-8") as f:
+        content = f.read().strip()
+    if content:
+        yield from json.loads(content)
+
+def iter_embeddings(snapshot_path: str = EMBEDDINGS_SNAPSHOT_PATH, log_path: str = EMBEDDING_LOG_PATH,
+                    sidecar_path: str = EMBEDDING_SIDECAR_PATH) -> Iterator[Dict]:
+    """Yield every embedded chunk from the snapshot and then the log, once per vector ID and content"""
+    binary_store = BinaryEmbeddingStore(sidecar_path)
+    snapshot = binary_store.iter_records() if binary_store.exists() else iter_snapshot(snapshot_path)
+    seen = set()
+    for source in (snapshot, replay_log(log_path)):
+        for record in source:
+            # A crash between compaction and log removal can repeat records
+            content = record.get("content", "")
+            key = f"{vector_id(content, record.get('metadata', {}))}\0{content}"
+            digest = hashlib.md5(key.encode("utf-8")).digest()
+            if digest in seen:
+                continue
+            seen.add(digest)
+            yield record
+
+def write_json_array(records: Iterable[Dict], path: str) -> int:
+    """Atomically write records as a JSON array, one record per line; returns the record count"""
+    temp_path = f"{path}.tmp"
+    count = 0
+    with open(temp_path, "w", encoding="utf-8") as f:
+        # One record per line keeps the file valid JSON and streamable
+        f.write("[\n")
+        for record in records:
+            if count:
+                f.write(",\n")
+            f.write(json.dumps(record, separators=(",", ":"), default=_json_default))
+            count += 1
+        f.write("\n]\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+    return count
+
+def write_snapshot(records: Iterable[Dict], snapshot_path: str = EMBEDDINGS_SNAPSHOT_PATH,
+                   log_path: str = EMBEDDING_LOG_PATH, sidecar_path: str = EMBEDDING_SIDECAR_PATH,
+                   store_format: str = EMBEDDING_STORE_FORMAT) -> int:
+    """Replace the snapshot with records in the configured format and remove the log"""
+    if store_format == "binary":
+        count = write_binary_store(records, sidecar_path)
+        # The binary store supersedes the JSON snapshot
+        if os.path.exists(snapshot_path):
+            os.remove(snapshot_path)
+    else:
+        count = write_json_array(records, snapshot_path)
+        remove_binary_store(sidecar_path)
+    if os.path.exists(log_path):
+        os.remove(log_path)
+    return count
+
+def compact(snapshot_path: str = EMBEDDINGS_SNAPSHOT_PATH, log_path: str = EMBEDDING_LOG_PATH,
+            sidecar_path: str = EMBEDDING_SIDECAR_PATH, store_format: str = EMBEDDING_STORE_FORMAT,
+            keep: Optional[Callable[[Dict], bool]] = None, force: bool = False) -> Optional[int]:
+    """Fold the log into a new snapshot (atomic rename) and remove the log; returns the record count
+
+    keep, if given, drops records it returns False for (superseded or deleted chunks); force
+    rewrites the snapshot even when there is no log to fold in.
+    """
+    binary_store = BinaryEmbeddingStore(sidecar_path)
+    if store_format == "binary":
+        # A JSON snapshot without a binary store is migrated on the first compaction
+        migrate = os.path.exists(snapshot_path) and not binary_store.exists()
+        if not os.path.exists(log_path) and not migrate and not force:
+            return None
+    elif not os.path.exists(log_path) and not binary_store.exists() and not force:
+        return None
+
+    records = iter_embeddings(snapshot_path, log_path, sidecar_path)
+    if keep is not None:
+        records = (record for record in records if keep(record))
+    count = write_snapshot(records, snapshot_path, log_path, sidecar_path, store_format)
+    logger.info(f"Compacted embedding log into {sidecar_path if store_format == 'binary' else snapshot_path} ({count} records)")
+    return count
@@ -0,0 +1,179 @@
+"""
+Binary embedding store.
+Vectors live in a float32 (or float16) .npy matrix that NumPy memory-maps,
+and ids, content and metadata live in a JSON-lines sidecar, one line per
+matrix row. Replacing the sidecar is the commit point: its header names
+the matrix file it belongs to, so readers never pair a new matrix with old
+metadata.
+"""
+
+import os
+import json
+import uuid
+import shutil
+import logging
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from dotenv import load_dotenv
+
+import numpy as np
+
+from record_ids import vector_id
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Configuration
+EMBEDDING_STORE_FORMAT = os.getenv("EMBEDDING_STORE_FORMAT", "binary").lower()
+EMBEDDING_STORE_DTYPE = os.getenv("EMBEDDING_STORE_DTYPE", "float32").lower()
+
+def sidecar_path_for(snapshot_path: str) -> str:
+    """Sidecar of the binary store that replaces the JSON snapshot at snapshot_path"""
+    return f"{os.path.splitext(snapshot_path)[0]}.meta.jsonl"
+
+# Follows LOCAL_EMBEDDINGS_PATH unless set explicitly
+EMBEDDING_SIDECAR_PATH = os.getenv(
+    "EMBEDDING_SIDECAR_PATH", sidecar_path_for(os.getenv("LOCAL_EMBEDDINGS_PATH", "embedded_prisma_data.json"))
+)
+
+SUPPORTED_DTYPES = {"float32": np.float32, "float16": np.float16}
+
+def write_binary_store(records: Iterable[Dict], sidecar_path: str = EMBEDDING_SIDECAR_PATH,
+                       dtype: str = EMBEDDING_STORE_DTYPE) -> int:
+    """Stream {"content", "metadata", "embedding"} records into a new matrix + sidecar; returns the row count"""
+    if dtype not in SUPPORTED_DTYPES:
+        raise ValueError(f"Unsupported embedding dtype {dtype}, expected one of {sorted(SUPPORTED_DTYPES)}")
+    np_dtype = np.dtype(SUPPORTED_DTYPES[dtype])
+
+    directory = os.path.dirname(os.path.abspath(sidecar_path))
+    base = os.path.basename(sidecar_path).split(".")[0]
+    matrix_name = f"{base}.{uuid.uuid4().hex[:12]}.npy"
+    matrix_path = os.path.join(directory, matrix_name)
+    body_path = f"{matrix_path}.body"
+    rows_path = f"{sidecar_path}.rows"
+
+    # Rows are streamed to temporary files because the .npy header needs the final shape
+    count = 0
+    dim = 0
+    with open(body_path, "wb") as body, open(rows_path, "w", encoding="utf-8") as rows:
+        for record in records:
+            vector = np.asarray(record["embedding"], dtype=np_dtype)
+            if count == 0:
+                dim = vector.shape[0]
+            elif vector.shape[0] != dim:
+                logger.warning(f"Skipping embedding with dimension {vector.shape[0]} (expected {dim})")
+                continue
+            body.write(vector.tobytes())
+            content = record.get("content", "")
+            metadata = record.get("metadata", {})
+            rows.write(json.dumps({
+                "id": vector_id(content, metadata),
+                "content": content,
+                "metadata": metadata
+            }, separators=(",", ":"), default=str) + "\n")
+            count += 1
+
+    with open(matrix_path, "wb") as matrix, open(body_path, "rb") as body:
+        np.lib.format.write_array_header_1_0(matrix, {
+            "descr": np.lib.format.dtype_to_descr(np_dtype),
+            "fortran_order": False,
+            "shape": (count, dim)
+        })
+        shutil.copyfileobj(body, matrix)
+        matrix.flush()
+        os.fsync(matrix.fileno())
+    os.remove(body_path)
+
+    temp_sidecar = f"{sidecar_path}.tmp"
+    with open(temp_sidecar, "w", encoding="utf-8") as sidecar, open(rows_path, "r", encoding="utf-8") as rows:
+        sidecar.write(json.dumps({"matrix": matrix_name, "rows": count, "dim": dim, "dtype": dtype}) + "\n")
+        shutil.copyfileobj(rows, sidecar)
+        sidecar.flush()
+        os.fsync(sidecar.fileno())
+    os.remove(rows_path)
+
+    previous = BinaryEmbeddingStore(sidecar_path).header()
+    os.replace(temp_sidecar, sidecar_path)
+    # Readers that already mapped the old matrix keep their mapping after the unlink
+    if previous and previous["matrix"] != matrix_name:
+        old_matrix = os.path.join(directory, previous["matrix"])
+        if os.path.exists(old_matrix):
+            os.remove(old_matrix)
+
+    logger.info(f"Wrote {count} {dtype} embeddings ({dim} dimensions) to {matrix_name}")
+    return count
+
+def remove_binary_store(sidecar_path: str = EMBEDDING_SIDECAR_PATH):
+    """Delete the sidecar and its matrix"""
+    header = BinaryEmbeddingStore(sidecar_path).header()
+    if header:
+        matrix_path = os.path.join(os.path.dirname(os.path.abspath(sidecar_path)), header["matrix"])
+        if os.path.exists(matrix_path):
+            os.remove(matrix_path)
+    if os.path.exists(sidecar_path):
+        os.remove(sidecar_path)
+
+class BinaryEmbeddingStore:
+    def __init__(self, sidecar_path: str = EMBEDDING_SIDECAR_PATH):
+        """Reader for a matrix + sidecar pair written by write_binary_store"""
+        self.sidecar_path = sidecar_path
+        self.matrix: Optional[np.ndarray] = None
+
+    def exists(self) -> bool:
+        return os.path.exists(self.sidecar_path)
+
+    def header(self) -> Optional[Dict]:
+        """The sidecar header, or None if there is no store"""
+        if not self.exists():
+            return None
+        with open(self.sidecar_path, "r", encoding="utf-8") as f:
+            return json.loads(f.readline())
+
+    def open(self) -> np.ndarray:
+        """Memory-map the matrix read-only; rows are paged in on access"""
+        header = self.header()
+        if header is None:
+            raise FileNotFoundError(f"Embedding sidecar {self.sidecar_path} not found")
+        matrix_path = os.path.join(os.path.dirname(os.path.abspath(self.sidecar_path)), header["matrix"])
+        matrix = np.load(matrix_path, mmap_mode="r")
+        if matrix.shape[0] != header["rows"]:
+            raise ValueError(f"{header['matrix']} has {matrix.shape[0]} rows, sidecar expects {header['rows']}")
+        self.matrix = matrix
+        return matrix
+
+    def __len__(self) -> int:
+        header = self.header()
+        return header["rows"] if header else 0
+
+    def iter_rows(self) -> Iterator[Dict]:
+        """Yield sidecar rows ({"id", "content", "metadata"}) without touching the matrix"""
+        if not self.exists():
+            return
+        with open(self.sidecar_path, "r", encoding="utf-8") as f:
+            f.readline()
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+    def iter_records(self) -> Iterator[Dict]:
+        """Yield records whose "embedding" is a zero-copy view of the mapped row"""
+        matrix = self.matrix if self.matrix is not None else self.open()
+        for row, item in enumerate(self.iter_rows()):
+            item["embedding"] = matrix[row]
+            yield item
+
+    def iter_batches(self, batch_size: int) -> Iterator[Tuple[List[Dict], np.ndarray]]:
+        """Yield (sidecar rows, matrix slice) pairs; slices are views into the mapping"""
+        matrix = self.matrix if self.matrix is not None else self.open()
+        rows: List[Dict] = []
+        start = 0
+        for item in self.iter_rows():
+            rows.append(item)
+            if len(rows) >= batch_size:
+                yield rows, matrix[start:start + len(rows)]
+                start += len(rows)
+                rows = []
+        if rows:
+            yield rows, matrix[start:start + len(rows)]
@@ -0,0 +1,45 @@
+"""
+Detect exact entity IDs (USR099, DOC006, HOSP004, ...) in a query and turn
+them into metadata filters, so retrieval only scores that entity's vectors.
+"""
+
+import re
+import logging
+from typing import Dict, List
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# ID prefix -> metadata fields that convert_to_documents stores that ID under
+ENTITY_FIELDS = {
+    "USR": ["user_id", "patient_id"],
+    "DOC": ["doctor_id", "treated_by"],
+    "DR": ["doctor_id", "treated_by"],
+    "HOSP": ["hospital_id"],
+    "INT": ["interaction_id"],
+    "REP": ["report_id"],
+    "SOAP": ["soap_id"]
+}
+
+ENTITY_ID_PATTERN = re.compile(r"\b(USR|DOC|DR|HOSP|INT|REP|SOAP)(\d+)\b", re.IGNORECASE)
+
+def extract_entity_filters(query: str) -> Dict[str, List[str]]:
+    """Return {metadata field: [ids]} for every entity ID mentioned in the query"""
+    filters: Dict[str, List[str]] = {}
+    for prefix, number in ENTITY_ID_PATTERN.findall(query):
+        entity_id = f"{prefix.upper()}{number}"
+        for field in ENTITY_FIELDS[prefix.upper()]:
+            values = filters.setdefault(field, [])
+            if entity_id not in values:
+                values.append(entity_id)
+
+    if filters:
+        logger.debug(f"Detected entity filters in query: {filters}")
+    return filters
+
+def to_pinecone_filter(filters: Dict[str, List[str]]) -> Dict:
+    """Convert entity filters into a Pinecone metadata filter (any field may match)"""
+    clauses = [{field: {"$in": values}} for field, values in filters.items()]
+    if len(clauses) == 1:
+        return clauses[0]
+    return {"$or": clauses}
@@ -1,9 +1,17 @@
 import os
 import json
-import requests
-import time
 import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List, Optional, Tuple
 from dotenv import load_dotenv
+from http_clients import get_session, log_connection_stats, EMBEDDING_TIMEOUT
+from key_pool import get_key_pool, NoKeyAvailable, KEY_INGEST_ACQUIRE_TIMEOUT
+from context_packer import estimate_tokens
+from embedding_cache import get_persistent_embedding_cache, content_hash
+from embedding_log import EmbeddingCheckpointLog, iter_embeddings, compact
+from record_ids import vector_id, assign_chunk_numbers
+from chunk_prisma_data import CHUNKED_DATA_PATH
 
 # Set up logging
 logger = logging.getLogger(__name__)
@@ -15,186 +23,246 @@ load_dotenv()
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 LLM_API_KEY = os.getenv("LLM_API_KEY")
 SAMBANOVA_BASE_URL = os.getenv("SAMBANOVA_BASE_URL", "https://api.sambanova.ai/v1")
+EMBEDDING_MODEL = "E5-Mistral-7B-Instruct"
 
-# Fallback API keys (if available)
-FALLBACK_API_KEYS = [
-    os.getenv("FALLBACK_API_KEY_1"),
-    os.getenv("FALLBACK_API_KEY_2"),
-    os.getenv("FALLBACK_API_KEY_3"),
-    os.getenv("FALLBACK_API_KEY_4"),
-    os.getenv("FALLBACK_API_KEY_5")
-]
+# Batched embedding settings: chunks per request, tokens per request and
+# how many requests may be in flight at once (set the batch size to 1 for
+# one chunk per request)
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+EMBEDDING_BATCH_MAX_TOKENS = int(os.getenv("EMBEDDING_BATCH_MAX_TOKENS", "16000"))
+EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", "4"))
 
-def get_sambanova_embedding(text, api_key=None):
-    """Generate embedding for text using Sambanova API"""
-    current_api_key = None
+def get_embedding_with_fallback(text):
+    """Get an embedding from the persistent cache, or through the shared API key pool"""
+    cache = get_persistent_embedding_cache()
+    embedding = cache.get(text, EMBEDDING_MODEL)
+    if embedding is not None:
+        logger.debug("Using cached embedding")
+        return embedding
+    
+    embedding = request_embedding(text)
+    if embedding is not None:
+        cache.put(text, EMBEDDING_MODEL, embedding)
+    return embedding
+
+def request_embedding(text):
+    """Call the embeddings API through the shared API key pool (LLM_API_KEY plus FALLBACK_API_KEY_*)"""
     try:
-        # Use provided API key or default
-        current_api_key = api_key or LLM_API_KEY
-        
-        if not current_api_key:
-            logger.error("No API key available for Sambanova")
-            return None
-            
-        headers = {
-            "Authorization": f"Bearer {current_api_key}",
-            "Content-Type": "application/json"
-        }
-        
-        # Use the correct model name
         payload = {
-            "model": "E5-Mistral-7B-Instruct",
+            "model": EMBEDDING_MODEL,
             "input": text
         }
-        
-        # Try the standard embeddings endpoint
         url = f"{SAMBANOVA_BASE_URL}/embeddings"
         
-        logger.debug(f"Generating embedding for text (length: {len(text)} chars)")
-        response = requests.post(url, headers=headers, json=payload)
+        # The pool picks the least-loaded key with capacity and backs off on 429s;
+        # ingestion waits for a key with capacity instead of failing fast like user requests
+        response = get_key_pool().request(
+            lambda api_key: get_session(api_key).post(url, json=payload, timeout=EMBEDDING_TIMEOUT),
+            acquire_timeout=KEY_INGEST_ACQUIRE_TIMEOUT
+        )
         
         if response.status_code == 200:
             data = response.json()
             logger.debug("Successfully generated embedding")
             return data['data'][0]['embedding']
-        elif response.status_code == 429:
-            # Rate limit hit
-            key_display = "Unknown"
-            if current_api_key:
-                key_str = str(current_api_key)
-                key_display = key_str[:8] if len(key_str) > 8 else key_str
-            logger.warning(f"Rate limit hit with API key: {key_display}...")
-            return None
-        else:
-            key_display = "Unknown"
-            if current_api_key:
-                key_str = str(current_api_key)
-                key_display = key_str[:8] if len(key_str) > 8 else key_str
-            logger.error(f"Error with API key {key_display}...: {response.status_code} - {response.text}")
-            return None
-            
+        
+        logger.error(f"Failed to generate embedding: {response.status_code} - {response.text}")
+        return None
+        
     except Exception as error:
-        key_display = "Unknown"
-        if current_api_key:
-            key_str = str(current_api_key)
-            key_display = key_str[:8] if len(key_str) > 8 else key_str
-        logger.error(f"Error generating embedding with API key {key_display}...: {error}")
+        logger.error(f"Failed to generate embedding with all available API keys: {error}")
         return None
 
-def get_embedding_with_fallback(text):
-    """Try to get embedding using primary key, then fallback keys"""
-    # Try primary API key first
-    logger.debug("Trying primary API key...")
-    embedding = get_sambanova_embedding(text)
-    if embedding is not None:
-        logger.debug("Successfully generated embedding with primary API key")
-        return embedding
-    
-    # Log available fallback keys for debugging
-    available_keys = [key for key in FALLBACK_API_KEYS if key]
-    logger.info(f"Primary key failed, trying {len(available_keys)} fallback keys...")
-    
-    # Try fallback API keys
-    for i, fallback_key in enumerate(FALLBACK_API_KEYS):
-        if fallback_key:
-            logger.info(f"Trying fallback API key {i+1}...")
-            embedding = get_sambanova_embedding(text, fallback_key)
-            if embedding is not None:
-                logger.info(f"  ✓ Success with fallback API key {i+1}")
-                return embedding
-            time.sleep(1)  # Small delay between attempts
-    
-    logger.error("Failed to generate embedding with all available API keys")
-    return None
+def make_embedding_batches(texts: List[str], max_items: int = EMBEDDING_BATCH_SIZE,
+                           max_tokens: int = EMBEDDING_BATCH_MAX_TOKENS) -> List[List[int]]:
+    """Group text positions into consecutive batches bounded by item and token count"""
+    batches = []
+    batch: List[int] = []
+    batch_tokens = 0
+    for i, text in enumerate(texts):
+        tokens = estimate_tokens(text)
+        # A single oversized text still gets a batch of its own
+        if batch and (len(batch) >= max_items or batch_tokens + tokens > max_tokens):
+            batches.append(batch)
+            batch = []
+            batch_tokens = 0
+        batch.append(i)
+        batch_tokens += tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+def get_embeddings_batch(texts: List[str]) -> List[Optional[List[float]]]:
+    """Embed several texts, taking cached ones from the persistent cache and the rest from one API request"""
+    cache = get_persistent_embedding_cache()
+    embeddings = cache.get_many(texts, EMBEDDING_MODEL)
+    # Identical texts are requested once
+    missing = list(dict.fromkeys(texts[i] for i, embedding in enumerate(embeddings) if embedding is None))
+    if missing:
+        requested = dict(zip(missing, request_embeddings_batch(missing)))
+        cache.put_many(
+            ((text, embedding) for text, embedding in requested.items() if embedding is not None),
+            EMBEDDING_MODEL
+        )
+        embeddings = [
+            embedding if embedding is not None else requested.get(text)
+            for text, embedding in zip(texts, embeddings)
+        ]
+    return embeddings
 
-def load_existing_embeddings():
-    """Load existing embeddings if they exist and are valid"""
+def request_embeddings_batch(texts: List[str]) -> List[Optional[List[float]]]:
+    """Embed several texts in one multi-input request; failed items are retried one by one"""
+    if len(texts) == 1:
+        return [request_embedding(texts[0])]
+    
+    embeddings: List[Optional[List[float]]] = [None] * len(texts)
     try:
-        if os.path.exists("embedded_prisma_data.json"):
-            with open("embedded_prisma_data.json", "r", encoding="utf-8") as f:
-                content = f.read().strip()
-                if content:  # Check if file is not empty
-                    data = json.loads(content)
-                    if isinstance(data, list):  # Check if it's a list
-                        logger.info(f"Loaded {len(data)} existing embeddings")
-                        return data
-                    else:
-                        logger.warning("Existing embeddings file has invalid format")
-                        return []
-                else:
-                    logger.warning("Existing embeddings file is empty")
-                    return []
-        return []
-    except json.JSONDecodeError as json_error:
-        logger.error(f"Error parsing existing embeddings JSON: {json_error}")
-        # Try to salvage what we can or start fresh
-        return []
+        payload = {
+            "model": EMBEDDING_MODEL,
+            "input": texts
+        }
+        url = f"{SAMBANOVA_BASE_URL}/embeddings"
+        # Ingestion waits for a key with capacity instead of failing fast like user requests
+        response = get_key_pool().request(
+            lambda api_key: get_session(api_key).post(url, json=payload, timeout=EMBEDDING_TIMEOUT),
+            acquire_timeout=KEY_INGEST_ACQUIRE_TIMEOUT
+        )
+        
+        if response.status_code == 200:
+            # Results carry their input position; fall back to response order
+            data = response.json().get('data', [])
+            for position, item in enumerate(data):
+                index = item.get('index', position)
+                if 0 <= index < len(texts):
+                    embeddings[index] = item['embedding']
+        else:
+            logger.warning(f"Batch embedding request failed: {response.status_code} - {response.text}")
+    except NoKeyAvailable as error:
+        # Every key stayed throttled for the whole wait; retrying chunk by chunk would only wait again
+        logger.error(f"Batch embedding request failed: {error}")
+        return embeddings
     except Exception as error:
-        logger.error(f"Error loading existing embeddings: {error}")
-        return []
+        logger.warning(f"Batch embedding request failed: {error}")
+    
+    # Whatever the batch did not return is embedded on its own, so one bad chunk
+    # does not fail its neighbours
+    missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+    if missing:
+        logger.info(f"Retrying {len(missing)} of {len(texts)} chunks individually")
+        for i in missing:
+            embeddings[i] = request_embedding(texts[i])
+    return embeddings
+
+def iter_embedding_batches(texts: List[str], concurrency: int = EMBEDDING_CONCURRENCY
+                           ) -> Iterator[Tuple[List[int], List[Optional[List[float]]]]]:
+    """Embed texts in concurrent batches, yielding (positions, embeddings) in input order.
+
+    At most `concurrency` batches are in flight; the next one is only submitted
+    once the oldest has been consumed, so a slow consumer holds back the requests.
+    """
+    batches = make_embedding_batches(texts)
+    logger.info(f"Embedding {len(texts)} texts in {len(batches)} batches ({concurrency} concurrent)")
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        window = deque()
+        for batch in batches:
+            if len(window) >= concurrency:
+                positions, future = window.popleft()
+                yield positions, future.result()
+            window.append((batch, executor.submit(get_embeddings_batch, [texts[i] for i in batch])))
+        while window:
+            positions, future = window.popleft()
+            yield positions, future.result()
 
 def generate_embeddings_for_chunks():
-    """Generate embeddings for all chunked data"""
+    """Generate embeddings for all chunked data; returns True once the embedding snapshot is up to date
+
+    Chunks that fail to embed are left out of the snapshot and retried on the next run.
+    """
     try:
         # Load chunked data
         logger.info("Loading chunked data...")
-        with open("chunked_prisma_data.json", "r", encoding="utf-8") as f:
+        with open(CHUNKED_DATA_PATH, "r", encoding="utf-8") as f:
             chunks = json.load(f)
+        # Files written before chunks carried chunk_no are numbered in file order
+        assign_chunk_numbers(chunk['metadata'] for chunk in chunks)
         
-        # Load existing embeddings
-        existing_embeddings = load_existing_embeddings()
+        # The chunk file is the live corpus: each vector ID must carry exactly its chunk's content
+        live = {vector_id(chunk['content'], chunk['metadata']): content_hash(chunk['content']) for chunk in chunks}
         
-        logger.info(f"Found {len(chunks)} chunks to process")
-        logger.info(f"Already processed: {len(existing_embeddings)} chunks")
+        def is_live(record):
+            content = record.get('content', '')
+            return live.get(vector_id(content, record.get('metadata', {}))) == content_hash(content)
+        
+        # Resume from the snapshot and checkpoint log, keeping only vector IDs in memory;
+        # embeddings of updated or deleted records are stale and dropped on compaction
+        processed = set()
+        stale = 0
+        for embedding in iter_embeddings():
+            if is_live(embedding):
+                processed.add(vector_id(embedding.get('content', ''), embedding.get('metadata', {})))
+            else:
+                stale += 1
         
-        # Create a set of already processed chunk contents for quick lookup
-        processed_contents = {embedding.get('content', '') for embedding in existing_embeddings}
+        logger.info(f"Found {len(chunks)} chunks to process")
+        logger.info(f"Already processed: {len(processed)} chunks")
+        if stale:
+            logger.info(f"Dropping {stale} embeddings of updated or deleted records")
         
-        # Filter out already processed chunks
-        new_chunks = [chunk for chunk in chunks if chunk['content'] not in processed_contents]
+        # Filter out already processed chunks and repeats of the same vector
+        new_chunks = []
+        for chunk in chunks:
+            chunk_id = vector_id(chunk['content'], chunk['metadata'])
+            if chunk_id not in processed:
+                processed.add(chunk_id)
+                new_chunks.append(chunk)
         
         logger.info(f"New chunks to process: {len(new_chunks)}")
         
         # If no new chunks, we're done
         if not new_chunks:
             logger.info("No new chunks to process!")
-            return existing_embeddings
+            compact(keep=is_live, force=stale > 0)
+            return True
         
-        # Process new chunks
+        # Process new chunks in batches spread over the key pool
         logger.info(f"Processing {len(new_chunks)} new chunks...")
-        for i, chunk in enumerate(new_chunks):
-            logger.info(f"Generating embedding for new chunk {i+1}/{len(new_chunks)}...")
-            
-            # Add small delay to avoid rate limits
-            time.sleep(0.5)
-            
-            # Get embedding for the chunk content using fallback mechanism
-            embedding = get_embedding_with_fallback(chunk['content'])
-            
-            if embedding is not None:
-                # Add embedding to chunk data
-                embedded_chunk = {
-                    "content": chunk['content'],
-                    "metadata": chunk['metadata'],
-                    "embedding": embedding
-                }
-                existing_embeddings.append(embedded_chunk)
-                logger.info(f"  ✓ Embedding generated (dimension: {len(embedding)})")
-                
-                # Save progress after each successful embedding
-                with open("embedded_prisma_data.json", "w", encoding="utf-8") as f:
-                    json.dump(existing_embeddings, f, indent=2)
-            else:
-                logger.error(f"  ✗ Failed to generate embedding for chunk {i+1}")
+        done = 0
+        failed = 0
+        texts = [chunk['content'] for chunk in new_chunks]
+        # Each embedding is appended to the checkpoint log, so a crash loses at most
+        # the records since the last fsync
+        with EmbeddingCheckpointLog() as checkpoint_log:
+            for positions, embeddings in iter_embedding_batches(texts):
+                for i, embedding in zip(positions, embeddings):
+                    if embedding is not None:
+                        checkpoint_log.append({
+                            "content": new_chunks[i]['content'],
+                            "metadata": new_chunks[i]['metadata'],
+                            "embedding": embedding
+                        })
+                    else:
+                        failed += 1
+                        logger.error(f"  ✗ Failed to generate embedding for chunk {i+1}")
+                done += len(positions)
+                logger.info(f"  ✓ Embedded {done}/{len(new_chunks)} new chunks")
+        
+        # Fold the log into the snapshot that the upsert and local search read
+        compact(keep=is_live, force=stale > 0)
+        
+        if failed:
+            logger.warning(f"{failed} chunks could not be embedded and will be retried on the next run")
         
-        logger.info(f"Successfully generated embeddings for {len(existing_embeddings)} chunks")
-        logger.info("Embedded data saved to 'embedded_prisma_data.json'")
+        log_connection_stats("Embedding generation")
+        logger.info(f"API key usage: {get_key_pool().stats()}")
+        logger.info(f"Persistent embedding cache: {get_persistent_embedding_cache().stats()}")
+        logger.info(f"Embedding snapshot holds {len(processed) - failed} chunks ({len(new_chunks) - failed} new)")
+        logger.info("Embedded data saved to the embedding snapshot")
         
-        return existing_embeddings
+        return True
         
     except Exception as error:
         logger.error(f"Error generating embeddings: {error}")
-        return []
+        return False
 
 if __name__ == "__main__":
     # Set up logging for standalone execution
@@ -203,11 +271,11 @@ if __name__ == "__main__":
     
     logger.info("Generating embeddings for chunked medical data...")
     logger.info(f"Using Sambanova API: {SAMBANOVA_BASE_URL}")
-    logger.info(f"Model: E5-Mistral-7B-Instruct")
+    logger.info(f"Model: {EMBEDDING_MODEL}")
     
-    embedded_chunks = generate_embeddings_for_chunks()
+    success = generate_embeddings_for_chunks()
     
-    if embedded_chunks:
+    if success:
         logger.info("Embedding generation completed successfully!")
     else:
         logger.error("Failed to generate embeddings.")
\ No newline at end of file
@@ -0,0 +1,283 @@
+"""
+Hedged upstream requests.
+If the primary call has not answered by the rolling latency percentile, a
+duplicate is sent (normally with a different API key) and whichever answers
+first wins. Hedges are capped to a fraction of traffic so a slow upstream
+is not hit with twice the load, and only successful calls feed the latency
+percentile so throttled or failing responses do not move the threshold.
+"""
+
+import os
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Awaitable, Callable, Dict, Optional
+from dotenv import load_dotenv
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Configuration
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "true").lower() == "true"
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "0.95"))
+HEDGE_MAX_FRACTION = float(os.getenv("HEDGE_MAX_FRACTION", "0.1"))
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "1.0"))
+HEDGE_DEFAULT_DELAY = float(os.getenv("HEDGE_DEFAULT_DELAY", "10.0"))
+HEDGE_WINDOW = int(os.getenv("HEDGE_WINDOW", "200"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+HEDGE_MAX_WORKERS = int(os.getenv("HEDGE_MAX_WORKERS", "32"))
+# Hedged races whose losing call may still be running; no hedge is sent beyond this
+HEDGE_MAX_IN_FLIGHT = int(os.getenv("HEDGE_MAX_IN_FLIGHT", "4"))
+
+class HedgeTimeout(Exception):
+    """Neither the primary nor the hedge answered before the deadline"""
+
+def _settle(errors: list) -> Any:
+    """Neither call was accepted: re-raise the last error or return the last rejected result"""
+    if not errors:
+        raise HedgeTimeout("No response before the request deadline")
+    if isinstance(errors[-1], Exception):
+        raise errors[-1]
+    return errors[-1]
+
+class HedgePolicy:
+    def __init__(self, percentile: float = HEDGE_PERCENTILE, max_fraction: float = HEDGE_MAX_FRACTION,
+                 min_delay: float = HEDGE_MIN_DELAY, default_delay: float = HEDGE_DEFAULT_DELAY,
+                 window: int = HEDGE_WINDOW, min_samples: int = HEDGE_MIN_SAMPLES):
+        """Track recent latencies and the hedge budget"""
+        self.percentile = percentile
+        self.max_fraction = max_fraction
+        self.min_delay = min_delay
+        self.default_delay = default_delay
+        self.min_samples = min_samples
+        self.latencies = deque(maxlen=window)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def record(self, latency: float):
+        """Record the latency of a successful upstream call"""
+        with self.lock:
+            self.latencies.append(latency)
+
+    def delay(self) -> float:
+        """Seconds to wait before hedging: the rolling percentile latency"""
+        with self.lock:
+            if len(self.latencies) < self.min_samples:
+                return self.default_delay
+            ordered = sorted(self.latencies)
+        index = min(int(len(ordered) * self.percentile), len(ordered) - 1)
+        return max(ordered[index], self.min_delay)
+
+    def start_request(self):
+        with self.lock:
+            self.requests += 1
+
+    def try_hedge(self) -> bool:
+        """Take a hedge from the budget; False once hedges would exceed max_fraction of requests"""
+        with self.lock:
+            if self.hedges + 1 > self.max_fraction * self.requests:
+                return False
+            self.hedges += 1
+            return True
+
+    def record_hedge_win(self):
+        with self.lock:
+            self.hedge_wins += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Return request, hedge and threshold counters"""
+        delay = self.delay()
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+                "hedge_delay_seconds": round(delay, 3),
+                "latency_samples": len(self.latencies)
+            }
+
+class RequestHedger:
+    def __init__(self, policy: Optional[HedgePolicy] = None, max_workers: int = HEDGE_MAX_WORKERS,
+                 max_in_flight: int = HEDGE_MAX_IN_FLIGHT):
+        """Run calls through a thread pool so a hedge can race the primary"""
+        self.policy = policy or HedgePolicy()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hedge")
+        # Hedges get their own small pool, and a race holds its slot until the losing call
+        # finishes too, so abandoned calls can never tie up more than max_in_flight workers
+        self.hedge_executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="hedge-dup")
+        self.hedge_slots = threading.BoundedSemaphore(max_in_flight)
+
+    def _timed(self, fn: Callable[[], Any], accept: Callable[[Any], bool]) -> Callable[[], Any]:
+        def run():
+            started = time.monotonic()
+            result = fn()
+            if accept(result):
+                self.policy.record(time.monotonic() - started)
+            return result
+        return run
+
+    def _release_slot_when_done(self, futures):
+        """Give the hedge slot back once every call of the race has finished"""
+        remaining = [len(futures)]
+        lock = threading.Lock()
+
+        def finished(_):
+            with lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            self.hedge_slots.release()
+
+        for future in futures:
+            future.add_done_callback(finished)
+
+    def call(self, primary: Callable[[], Any], hedge: Optional[Callable[[], Any]] = None,
+             deadline: Optional[float] = None, accept: Callable[[Any], bool] = lambda result: True) -> Any:
+        """Return the first accepted result of primary, or of hedge if primary is slow.
+
+        A result that accept() rejects, or an exception, from one call falls back
+        to the other call if it is still running. A losing synchronous call cannot be
+        interrupted mid-request; it is cancelled if it has not started and otherwise
+        left to finish with its result discarded.
+        """
+        self.policy.start_request()
+        if not HEDGE_ENABLED or hedge is None:
+            return self._timed(primary, accept)()
+
+        started = time.monotonic()
+        hedge_delay = self.policy.delay()
+        primary_future = self.executor.submit(self._timed(primary, accept))
+        pending = {primary_future}
+        hedge_future = None
+        errors = []
+        while pending:
+            remaining = None if deadline is None else deadline - (time.monotonic() - started)
+            if remaining is not None and remaining <= 0:
+                break
+
+            if hedge_future is None:
+                # Until the hedge is sent, wake up at the hedge threshold
+                hedge_at = hedge_delay - (time.monotonic() - started)
+                timeout = hedge_at if remaining is None else min(hedge_at, remaining)
+            else:
+                timeout = remaining
+            if timeout is not None:
+                timeout = max(timeout, 0)
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                try:
+                    result = future.result()
+                except Exception as error:
+                    errors.append(error)
+                    continue
+                if accept(result):
+                    for other in pending:
+                        other.cancel()
+                    if future is hedge_future:
+                        self.policy.record_hedge_win()
+                        logger.info("Hedged request answered first")
+                    return result
+                errors.append(result)
+
+            # Hedge once the primary is past the threshold, or as soon as it fails
+            elapsed = time.monotonic() - started
+            if hedge_future is None and (errors or elapsed >= hedge_delay) and self._take_hedge_slot():
+                logger.info("Primary request slow or failed, sending hedged request")
+                hedge_future = self.hedge_executor.submit(self._timed(hedge, accept))
+                self._release_slot_when_done([primary_future, hedge_future])
+                pending.add(hedge_future)
+
+        for future in pending:
+            future.cancel()
+        return _settle(errors)
+
+    def _take_hedge_slot(self) -> bool:
+        """A free hedge slot and hedge budget, or False to let the primary run alone"""
+        if not self.hedge_slots.acquire(blocking=False):
+            logger.debug("Too many hedged requests still running, not hedging")
+            return False
+        if not self.policy.try_hedge():
+            self.hedge_slots.release()
+            return False
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return self.policy.stats()
+
+class AsyncRequestHedger:
+    def __init__(self, policy: Optional[HedgePolicy] = None):
+        """Race coroutine calls on the running event loop; the loser is cancelled"""
+        self.policy = policy or HedgePolicy()
+
+    async def _timed(self, fn: Callable[[], Awaitable[Any]], accept: Callable[[Any], bool]) -> Any:
+        started = time.monotonic()
+        result = await fn()
+        if accept(result):
+            self.policy.record(time.monotonic() - started)
+        return result
+
+    async def call(self, primary: Callable[[], Awaitable[Any]],
+                   hedge: Optional[Callable[[], Awaitable[Any]]] = None,
+                   deadline: Optional[float] = None,
+                   accept: Callable[[Any], bool] = lambda result: True) -> Any:
+        """Async counterpart of RequestHedger.call; the losing request is cancelled"""
+        self.policy.start_request()
+        if not HEDGE_ENABLED or hedge is None:
+            return await self._timed(primary, accept)
+
+        started = time.monotonic()
+        hedge_delay = self.policy.delay()
+        primary_task = asyncio.ensure_future(self._timed(primary, accept))
+        pending = {primary_task}
+        hedge_task = None
+        errors = []
+        try:
+            while pending:
+                remaining = None if deadline is None else deadline - (time.monotonic() - started)
+                if remaining is not None and remaining <= 0:
+                    break
+
+                if hedge_task is None:
+                    hedge_at = hedge_delay - (time.monotonic() - started)
+                    timeout = hedge_at if remaining is None else min(hedge_at, remaining)
+                else:
+                    timeout = remaining
+                if timeout is not None:
+                    timeout = max(timeout, 0)
+                done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                for task in done:
+                    try:
+                        result = task.result()
+                    except Exception as error:
+                        errors.append(error)
+                        continue
+                    if accept(result):
+                        if task is hedge_task:
+                            self.policy.record_hedge_win()
+                            logger.info("Hedged request answered first")
+                        return result
+                    errors.append(result)
+
+                elapsed = time.monotonic() - started
+                if hedge_task is None and (errors or elapsed >= hedge_delay) and self.policy.try_hedge():
+                    logger.info("Primary request slow or failed, sending hedged request")
+                    hedge_task = asyncio.ensure_future(self._timed(hedge, accept))
+                    pending.add(hedge_task)
+        finally:
+            for task in pending:
+                task.cancel()
+
+        return _settle(errors)
+
+    def stats(self) -> Dict[str, Any]:
+        return self.policy.stats()
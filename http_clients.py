@@ -0,0 +1,153 @@
+"""
+Shared, pooled HTTP clients for SambaNova API calls.
+One keep-alive session (and one async client) is kept per API key so that
+embedding and chat requests reuse TCP/TLS connections instead of paying a
+new handshake on every call.
+"""
+
+import os
+import logging
+import threading
+from typing import Any, Dict, Optional
+from dotenv import load_dotenv
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import httpx
+except ImportError:  # httpx is only needed for the async query path
+    httpx = None
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Configuration
+SAMBANOVA_BASE_URL = os.getenv("SAMBANOVA_BASE_URL", "https://api.sambanova.ai/v1")
+HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", "4"))
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "32"))
+HTTP_ASYNC_MAX_CONNECTIONS = int(os.getenv("HTTP_ASYNC_MAX_CONNECTIONS", "200"))
+HTTP_ASYNC_MAX_KEEPALIVE = int(os.getenv("HTTP_ASYNC_MAX_KEEPALIVE", "50"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "10"))
+EMBEDDING_READ_TIMEOUT = float(os.getenv("EMBEDDING_READ_TIMEOUT", "30"))
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "60"))
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "false").lower() in ("1", "true", "yes")
+
+# (connect, read) timeouts in the form requests expects
+EMBEDDING_TIMEOUT = (HTTP_CONNECT_TIMEOUT, EMBEDDING_READ_TIMEOUT)
+LLM_TIMEOUT = (HTTP_CONNECT_TIMEOUT, LLM_READ_TIMEOUT)
+
+_lock = threading.Lock()
+_sessions: Dict[str, requests.Session] = {}
+_async_clients: Dict[str, Any] = {}
+_async_stats = {"requests": 0, "connections": 0}
+
+def _key_label(api_key: str) -> str:
+    """Short, non-secret label for an API key"""
+    return f"{api_key[:8]}..." if len(api_key) > 8 else api_key
+
+def get_session(api_key: str) -> requests.Session:
+    """Return the shared keep-alive session for an API key"""
+    with _lock:
+        session = _sessions.get(api_key)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=HTTP_POOL_CONNECTIONS,
+                pool_maxsize=HTTP_POOL_MAXSIZE
+            )
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers.update({
+                "Authorization": f"Bearer {api_key}",
+                "Content-Type": "application/json"
+            })
+            _sessions[api_key] = session
+            logger.info(f"Created pooled HTTP session for API key {_key_label(api_key)} (pool size {HTTP_POOL_MAXSIZE})")
+        return session
+
+async def _trace_connections(event_name: str, info: Dict[str, Any]):
+    """httpcore trace hook that counts newly opened connections"""
+    if event_name == "connection.connect_tcp.complete":
+        _async_stats["connections"] += 1
+        logger.debug("Opened new async HTTP connection")
+
+async def _on_async_request(request):
+    """httpx event hook that counts requests and attaches the connection trace"""
+    _async_stats["requests"] += 1
+    request.extensions["trace"] = _trace_connections
+
+def get_async_client(api_key: str):
+    """Return the shared async client for an API key (HTTP/2 when enabled)"""
+    if httpx is None:
+        raise ImportError("httpx is required for the async query path")
+
+    with _lock:
+        client = _async_clients.get(api_key)
+        if client is None:
+            client = httpx.AsyncClient(
+                base_url=SAMBANOVA_BASE_URL,
+                headers={
+                    "Authorization": f"Bearer {api_key}",
+                    "Content-Type": "application/json"
+                },
+                limits=httpx.Limits(
+                    max_connections=HTTP_ASYNC_MAX_CONNECTIONS,
+                    max_keepalive_connections=HTTP_ASYNC_MAX_KEEPALIVE
+                ),
+                timeout=httpx.Timeout(LLM_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+                http2=HTTP2_ENABLED,
+                event_hooks={"request": [_on_async_request]}
+            )
+            _async_clients[api_key] = client
+            logger.info(f"Created pooled async HTTP client for API key {_key_label(api_key)} (http2={HTTP2_ENABLED})")
+        return client
+
+async def close_async_clients():
+    """Close all shared async clients"""
+    with _lock:
+        clients = list(_async_clients.values())
+        _async_clients.clear()
+    for client in clients:
+        await client.aclose()
+
+def connection_stats() -> Dict[str, Any]:
+    """Return request and connection counts for the shared clients"""
+    sessions = {}
+    with _lock:
+        items = list(_sessions.items())
+    for api_key, session in items:
+        requests_sent = 0
+        connections_opened = 0
+        adapter = session.get_adapter(SAMBANOVA_BASE_URL)
+        pools = adapter.poolmanager.pools
+        for pool_key in list(pools.keys()):
+            pool = pools.get(pool_key)
+            if pool is not None:
+                requests_sent += pool.num_requests
+                connections_opened += pool.num_connections
+        sessions[_key_label(api_key)] = {
+            "requests": requests_sent,
+            "connections_opened": connections_opened,
+            "reused": max(requests_sent - connections_opened, 0)
+        }
+
+    return {
+        "sessions": sessions,
+        "async": {
+            "requests": _async_stats["requests"],
+            "connections_opened": _async_stats["connections"],
+            "reused": max(_async_stats["requests"] - _async_stats["connections"], 0)
+        }
+    }
+
+def log_connection_stats(prefix: Optional[str] = None):
+    """Log connection reuse for the shared sessions"""
+    for label, stats in connection_stats()["sessions"].items():
+        logger.info(
+            f"{prefix + ': ' if prefix else ''}HTTP session {label} sent {stats['requests']} requests "
+            f"over {stats['connections_opened']} connections ({stats['reused']} reused)"
+        )
@@ -0,0 +1,66 @@
+"""
+Monotonic version counter for the vector index.
+The ingestion path bumps it after every successful upsert so that
+anything derived from the old index contents can be invalidated.
+"""
+
+import os
+import logging
+import threading
+from dotenv import load_dotenv
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Configuration
+INDEX_VERSION_PATH = os.getenv("INDEX_VERSION_PATH", "index_version.txt")
+
+_lock = threading.Lock()
+_cached_version = 0
+_cached_mtime = None
+
+def get_index_version() -> int:
+    """Return the current index version (0 if the index was never updated)"""
+    global _cached_version, _cached_mtime
+    try:
+        mtime = os.stat(INDEX_VERSION_PATH).st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
+    with _lock:
+        # Only re-read the file when it changed on disk
+        if mtime != _cached_mtime:
+            try:
+                with open(INDEX_VERSION_PATH, "r", encoding="utf-8") as f:
+                    _cached_version = int(f.read().strip() or 0)
+                _cached_mtime = mtime
+            except (OSError, ValueError) as error:
+                logger.error(f"Error reading index version: {error}")
+        return _cached_version
+
+def bump_index_version() -> int:
+    """Increment the index version and persist it atomically"""
+    global _cached_version, _cached_mtime
+    with _lock:
+        version = _cached_version
+        if os.path.exists(INDEX_VERSION_PATH):
+            try:
+                with open(INDEX_VERSION_PATH, "r", encoding="utf-8") as f:
+                    version = int(f.read().strip() or 0)
+            except (OSError, ValueError) as error:
+                logger.error(f"Error reading index version: {error}")
+        version += 1
+
+        temp_path = f"{INDEX_VERSION_PATH}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(str(version))
+        os.replace(temp_path, INDEX_VERSION_PATH)
+
+        _cached_version = version
+        _cached_mtime = os.stat(INDEX_VERSION_PATH).st_mtime_ns
+
+    logger.info(f"Index version bumped to {version}")
+    return version
@@ -0,0 +1,72 @@
+"""
+Lock serialising the ingestion runs that rewrite the chunk file, the
+embedding snapshot and the Pinecone index (incremental updates, full and
+streaming refreshes, reconciliation repairs). It is held across threads
+of this process and, through an flock on a lock file, across processes
+sharing the working directory.
+"""
+
+import os
+import asyncio
+import logging
+import threading
+from contextlib import asynccontextmanager
+from dotenv import load_dotenv
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows; only threads of this process are serialised there
+    fcntl = None
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Configuration
+INGEST_LOCK_PATH = os.getenv("INGEST_LOCK_PATH", "ingest.lock")
+
+_thread_lock = threading.Lock()
+
+def _acquire(path: str):
+    """Block until this thread holds the lock; returns the locked file, if any"""
+    if not _thread_lock.acquire(blocking=False):
+        logger.info("Waiting for another ingestion run in this process to finish")
+        _thread_lock.acquire()
+    if fcntl is None:
+        return None
+    try:
+        handle = open(path, "a")
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            logger.info(f"Waiting for another process holding {path} to finish ingesting")
+            fcntl.flock(handle, fcntl.LOCK_EX)
+        return handle
+    except BaseException:
+        _thread_lock.release()
+        raise
+
+def _release(handle):
+    try:
+        if handle is not None:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+            handle.close()
+    finally:
+        _thread_lock.release()
+
+@asynccontextmanager
+async def ingest_lock(path: str = INGEST_LOCK_PATH):
+    """Hold the ingestion lock; the wait happens in a worker thread so the event loop keeps running"""
+    acquiring = asyncio.ensure_future(asyncio.to_thread(_acquire, path))
+    try:
+        handle = await asyncio.shield(acquiring)
+    except asyncio.CancelledError:
+        # The worker thread still takes the lock; hand it back as soon as it does
+        acquiring.add_done_callback(lambda future: future.exception() is None and _release(future.result()))
+        raise
+    try:
+        yield
+    finally:
+        _release(handle)
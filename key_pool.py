@@ -0,0 +1,312 @@
+"""
+Rate-limit-aware scheduler for the Sambanova API keys.
+Every configured key (LLM_API_KEY plus FALLBACK_API_KEY_1..5) gets its own
+token bucket. Each request goes to the least-loaded key that has capacity
+and is not cooling down after a 429, so the keys add up in throughput
+instead of being tried one after another. A streamed response keeps its
+key counted as in flight until the stream is closed.
+"""
+
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+from contextlib import asynccontextmanager, contextmanager
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+from dotenv import load_dotenv
+
+import requests
+
+try:
+    import httpx
+except ImportError:  # httpx is only needed for the async query path
+    httpx = None
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Configuration
+KEY_RATE_PER_SECOND = float(os.getenv("KEY_RATE_PER_SECOND", "2.0"))
+KEY_BURST = float(os.getenv("KEY_BURST", "5"))
+KEY_MAX_RETRIES = int(os.getenv("KEY_MAX_RETRIES", "4"))
+KEY_BACKOFF_BASE = float(os.getenv("KEY_BACKOFF_BASE", "0.5"))
+KEY_BACKOFF_MAX = float(os.getenv("KEY_BACKOFF_MAX", "30"))
+KEY_DEFAULT_COOLDOWN = float(os.getenv("KEY_DEFAULT_COOLDOWN", "10"))
+# User requests fail fast rather than queue behind throttled keys
+KEY_ACQUIRE_TIMEOUT = float(os.getenv("KEY_ACQUIRE_TIMEOUT", "5"))
+# Ingestion waits for capacity instead, so rate limits slow it down rather than fail chunks
+KEY_INGEST_ACQUIRE_TIMEOUT = float(os.getenv("KEY_INGEST_ACQUIRE_TIMEOUT", "600"))
+
+# Status codes worth retrying on another key
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+# Errors raised before the request reached the server, so retrying cannot duplicate work.
+# Read timeouts are not among them: the upstream may still be generating the answer
+CONNECTION_ERRORS: Tuple[type, ...] = (ConnectionError, requests.exceptions.ConnectionError)
+if httpx is not None:
+    CONNECTION_ERRORS += (httpx.ConnectError, httpx.ConnectTimeout)
+
+class NoKeyAvailable(Exception):
+    """No API key had capacity before the acquire timeout"""
+
+def configured_api_keys() -> List[str]:
+    """The primary key followed by any fallback keys, without duplicates"""
+    keys = [os.getenv("LLM_API_KEY")] + [os.getenv(f"FALLBACK_API_KEY_{i}") for i in range(1, 6)]
+    unique = []
+    for key in keys:
+        if key and key not in unique:
+            unique.append(key)
+    return unique
+
+def key_display(api_key: str) -> str:
+    """First characters of a key, safe for logs"""
+    return f"{api_key[:8]}..." if api_key else "Unknown"
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds from a Retry-After header (delta-seconds or HTTP date)"""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+def backoff_delay(attempt: int, base: float = KEY_BACKOFF_BASE, cap: float = KEY_BACKOFF_MAX) -> float:
+    """Exponential backoff with full jitter"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+class KeyState:
+    def __init__(self, api_key: str, burst: float):
+        self.api_key = api_key
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.cooldown_until = 0.0
+        self.in_flight = 0
+        self.requests = 0
+        self.throttled = 0
+        self.errors = 0
+
+class ApiKeyPool:
+    def __init__(self, api_keys: List[str], rate: float = KEY_RATE_PER_SECOND, burst: float = KEY_BURST):
+        """Initialize a token bucket per key"""
+        if not api_keys:
+            raise ValueError("No API keys configured for the key pool")
+        self.rate = rate
+        self.burst = burst
+        self.states = [KeyState(api_key, burst) for api_key in api_keys]
+        self.by_key = {state.api_key: state for state in self.states}
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.states)
+
+    def _try_acquire(self, exclude: Optional[str] = None) -> Tuple[Optional[str], float]:
+        """Take a token from the best key; otherwise return how long to wait"""
+        now = time.monotonic()
+        with self.lock:
+            ready = []
+            wait = KEY_BACKOFF_MAX
+            for state in self.states:
+                state.tokens = min(self.burst, state.tokens + (now - state.updated) * self.rate)
+                state.updated = now
+                if state.cooldown_until > now:
+                    wait = min(wait, state.cooldown_until - now)
+                elif state.tokens < 1:
+                    wait = min(wait, (1 - state.tokens) / self.rate)
+                else:
+                    ready.append(state)
+
+            # Prefer a different key than the one that just failed, if another is ready
+            if exclude and len(ready) > 1:
+                ready = [state for state in ready if state.api_key != exclude]
+            if not ready:
+                return None, wait
+
+            state = min(ready, key=lambda state: (state.in_flight, -state.tokens))
+            state.tokens -= 1
+            state.in_flight += 1
+            state.requests += 1
+            return state.api_key, 0.0
+
+    def acquire(self, exclude: Optional[str] = None, timeout: Optional[float] = KEY_ACQUIRE_TIMEOUT) -> str:
+        """Block until a key has capacity (at most timeout seconds, None waits indefinitely); release() it when done"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            api_key, wait = self._try_acquire(exclude)
+            if api_key:
+                return api_key
+            if deadline is not None and time.monotonic() + wait > deadline:
+                raise NoKeyAvailable(f"No API key available within {timeout}s")
+            time.sleep(wait)
+
+    async def aacquire(self, exclude: Optional[str] = None, timeout: Optional[float] = KEY_ACQUIRE_TIMEOUT) -> str:
+        """Async counterpart of acquire()"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            api_key, wait = self._try_acquire(exclude)
+            if api_key:
+                return api_key
+            if deadline is not None and time.monotonic() + wait > deadline:
+                raise NoKeyAvailable(f"No API key available within {timeout}s")
+            await asyncio.sleep(wait)
+
+    def release(self, api_key: str, status_code: Optional[int] = None, retry_after: Optional[float] = None):
+        """Return a key after a request; a 429 puts it into cooldown"""
+        with self.lock:
+            state = self.by_key[api_key]
+            state.in_flight -= 1
+            if status_code == 429:
+                state.throttled += 1
+                cooldown = retry_after if retry_after is not None else KEY_DEFAULT_COOLDOWN
+                state.cooldown_until = max(state.cooldown_until, time.monotonic() + cooldown)
+                state.tokens = 0
+                logger.warning(f"Rate limit hit with API key {key_display(api_key)}, cooling down for {cooldown:.1f}s")
+            elif status_code is None or status_code >= 500:
+                state.errors += 1
+
+    def _settle(self, api_key: str, response: Any) -> bool:
+        """Release the key for a response; True if the request should be retried"""
+        status_code = response.status_code
+        self.release(api_key, status_code, parse_retry_after(response.headers.get("Retry-After")))
+        return status_code in RETRYABLE_STATUS
+
+    def _send(self, send: Callable[[str], Any], max_retries: int, retry_exceptions: Tuple[type, ...],
+              hold: bool, acquire_timeout: Optional[float] = KEY_ACQUIRE_TIMEOUT) -> Tuple[Any, Optional[str]]:
+        """Run request(); with hold, a successful response is returned with its still-acquired key"""
+        last_key = None
+        for attempt in range(max_retries + 1):
+            api_key = self.acquire(exclude=last_key, timeout=acquire_timeout)
+            try:
+                response = send(api_key)
+            except Exception as error:
+                self.release(api_key)
+                logger.warning(f"Request with API key {key_display(api_key)} failed: {error}")
+                if attempt == max_retries or not isinstance(error, retry_exceptions):
+                    raise
+            else:
+                if hold and response.status_code == 200:
+                    return response, api_key
+                if not self._settle(api_key, response) or attempt == max_retries:
+                    return response, None
+                logger.info(f"Retrying after {response.status_code} from API key {key_display(api_key)}")
+                # Free the connection of a streamed response we are not going to read
+                response.close()
+            last_key = api_key
+            time.sleep(backoff_delay(attempt))
+
+    def request(self, send: Callable[[str], Any], max_retries: int = KEY_MAX_RETRIES,
+                retry_exceptions: Tuple[type, ...] = CONNECTION_ERRORS,
+                acquire_timeout: Optional[float] = KEY_ACQUIRE_TIMEOUT) -> Any:
+        """Call send(api_key) on scheduled keys, retrying 429/5xx and connection errors with backoff.
+
+        Returns the last response (which may be an error response) or re-raises
+        the last exception once retries are exhausted. Exceptions outside
+        retry_exceptions (e.g. read timeouts on long completions) are not retried.
+        NoKeyAvailable is raised if no key has capacity within acquire_timeout.
+        """
+        response, _ = self._send(send, max_retries, retry_exceptions, hold=False, acquire_timeout=acquire_timeout)
+        return response
+
+    @contextmanager
+    def stream(self, send: Callable[[str], Any], max_retries: int = KEY_MAX_RETRIES,
+               retry_exceptions: Tuple[type, ...] = CONNECTION_ERRORS) -> Iterator[Any]:
+        """request() for a streamed response; the key is released once the body has been read"""
+        response, api_key = self._send(send, max_retries, retry_exceptions, hold=True)
+        status_code = response.status_code
+        try:
+            yield response
+        except Exception:
+            # The stream broke off: count it against the key like a failed request
+            status_code = None
+            raise
+        finally:
+            response.close()
+            if api_key is not None:
+                self.release(api_key, status_code)
+
+    async def _asend(self, send: Callable[[str], Awaitable[Any]], max_retries: int,
+                     retry_exceptions: Tuple[type, ...], hold: bool) -> Tuple[Any, Optional[str]]:
+        """Async counterpart of _send()"""
+        last_key = None
+        for attempt in range(max_retries + 1):
+            api_key = await self.aacquire(exclude=last_key)
+            try:
+                response = await send(api_key)
+            except asyncio.CancelledError:
+                # A cancelled hedge is neither a failure nor a throttle
+                self.release(api_key, 0)
+                raise
+            except Exception as error:
+                self.release(api_key)
+                logger.warning(f"Request with API key {key_display(api_key)} failed: {error}")
+                if attempt == max_retries or not isinstance(error, retry_exceptions):
+                    raise
+            else:
+                if hold and response.status_code == 200:
+                    return response, api_key
+                if not self._settle(api_key, response) or attempt == max_retries:
+                    return response, None
+                logger.info(f"Retrying after {response.status_code} from API key {key_display(api_key)}")
+                await response.aclose()
+            last_key = api_key
+            await asyncio.sleep(backoff_delay(attempt))
+
+    async def arequest(self, send: Callable[[str], Awaitable[Any]], max_retries: int = KEY_MAX_RETRIES,
+                       retry_exceptions: Tuple[type, ...] = CONNECTION_ERRORS) -> Any:
+        """Async counterpart of request()"""
+        response, _ = await self._asend(send, max_retries, retry_exceptions, hold=False)
+        return response
+
+    @asynccontextmanager
+    async def astream(self, send: Callable[[str], Awaitable[Any]], max_retries: int = KEY_MAX_RETRIES,
+                      retry_exceptions: Tuple[type, ...] = CONNECTION_ERRORS) -> AsyncIterator[Any]:
+        """Async counterpart of stream()"""
+        response, api_key = await self._asend(send, max_retries, retry_exceptions, hold=True)
+        status_code = response.status_code
+        try:
+            yield response
+        except Exception:
+            status_code = None
+            raise
+        finally:
+            await response.aclose()
+            if api_key is not None:
+                self.release(api_key, status_code)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Per-key request, throttle and load counters"""
+        now = time.monotonic()
+        with self.lock:
+            return [
+                {
+                    "key": key_display(state.api_key),
+                    "requests": state.requests,
+                    "throttled": state.throttled,
+                    "errors": state.errors,
+                    "in_flight": state.in_flight,
+                    "cooling_down": state.cooldown_until > now
+                }
+                for state in self.states
+            ]
+
+_key_pool: Optional[ApiKeyPool] = None
+_key_pool_lock = threading.Lock()
+
+def get_key_pool() -> ApiKeyPool:
+    """Return the process-wide key pool shared by the query and ingestion paths"""
+    global _key_pool
+    with _key_pool_lock:
+        if _key_pool is None:
+            _key_pool = ApiKeyPool(configured_api_keys())
+            logger.info(f"API key pool initialized with {len(_key_pool)} keys")
+        return _key_pool
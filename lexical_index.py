@@ -0,0 +1,224 @@
+"""
+In-memory BM25 inverted index over chunk content, used alongside the
+vector index for hybrid retrieval. Results from both are merged with
+reciprocal rank fusion.
+"""
+
+import os
+import re
+import json
+import math
+import logging
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional
+from dotenv import load_dotenv
+
+from entity_filters import ENTITY_ID_PATTERN
+from record_ids import vector_id, record_key, assign_chunk_numbers
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Configuration
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+PHONE_PATTERN = re.compile(r"\+?\d[\d\-\s().]{5,}\d")
+# "Name: ..." lines of hospital, doctor and patient chunks
+NAME_LINE_PATTERN = re.compile(r"^\s*Name:\s*(.+?)\s*$", re.MULTILINE)
+
+# Words that do not change whether a query is a pure lookup ("find USR099")
+LOOKUP_STOPWORDS = {
+    "a", "an", "the", "for", "of", "on", "about", "find", "show", "get", "lookup",
+    "look", "up", "search", "me", "patient", "patients", "doctor", "hospital",
+    "record", "records", "info", "information", "details", "id", "phone", "number",
+    "mobile", "name", "named", "who", "is", "with", "and"
+}
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase alphanumeric tokens"""
+    return TOKEN_PATTERN.findall(text.lower())
+
+def record_names(content: str) -> List[tuple]:
+    """Token tuples of the multi-word names a chunk's "Name:" lines give"""
+    names = [tuple(tokenize(name)) for name in NAME_LINE_PATTERN.findall(content)]
+    return [name for name in names if len(name) > 1]
+
+def is_lexical_query(query: str, index: Optional["BM25Index"] = None) -> bool:
+    """True when the query only names IDs, phone numbers or a name that occurs in the index
+
+    Capitalised words alone are not enough ("Hypertension", "Diabetes?"):
+    they must together spell a multi-word name the index has seen.
+    """
+    ids = ENTITY_ID_PATTERN.findall(query)
+    phones = PHONE_PATTERN.findall(query)
+    words = [word.strip("?,.!:;'\"") for word in PHONE_PATTERN.sub(" ", query).split()]
+    words = [
+        word for word in words
+        if word and word.lower() not in LOOKUP_STOPWORDS and not ENTITY_ID_PATTERN.fullmatch(word)
+    ]
+    if not words:
+        return bool(ids or phones)
+
+    if len(words) < 2 or index is None:
+        return False
+    if not all(word.isalpha() and word[0].isupper() and word[1:].islower() for word in words):
+        return False
+    return index.has_name(tuple(word.lower() for word in words))
+
+def reciprocal_rank_fusion(result_lists: Iterable[List[Dict]], top_k: int, k: int = RRF_K) -> List[Dict]:
+    """Merge ranked result lists by reciprocal rank fusion"""
+    fused: Dict[str, Dict] = {}
+    for results in result_lists:
+        for rank, result in enumerate(results):
+            entry = fused.get(result['id'])
+            if entry is None:
+                entry = {'id': result['id'], 'score': 0.0, 'metadata': result['metadata']}
+                fused[result['id']] = entry
+            entry['score'] += 1.0 / (k + rank + 1)
+    return sorted(fused.values(), key=lambda entry: entry['score'], reverse=True)[:top_k]
+
+class BM25Index:
+    def __init__(self, k1: float = BM25_K1, b: float = BM25_B):
+        """Initialize an empty BM25 index"""
+        self.k1 = k1
+        self.b = b
+        # doc_id -> (metadata, document length)
+        self.documents: Dict[str, tuple] = {}
+        # term -> {doc_id: term frequency}
+        self.postings: Dict[str, Dict[str, int]] = {}
+        # name tokens -> number of indexed chunks giving that name
+        self.names: Counter = Counter()
+        self.total_length = 0
+        self.lock = threading.Lock()
+
+    def _remove(self, doc_id: str):
+        # Caller holds the lock
+        metadata, length = self.documents.pop(doc_id)
+        self.total_length -= length
+        for term in set(tokenize(metadata["content"])):
+            postings = self.postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self.postings[term]
+        for name in record_names(metadata["content"]):
+            self.names[name] -= 1
+            if self.names[name] <= 0:
+                del self.names[name]
+
+    def add_documents(self, chunks: Iterable[Dict]) -> int:
+        """Index chunks of the form {"content": ..., "metadata": {...}}; returns the number added
+
+        A chunk whose ID is already indexed with different content replaces it.
+        """
+        added = 0
+        with self.lock:
+            for chunk in chunks:
+                content = chunk.get("content", "")
+                # Same ID scheme as store_embeddings_in_pinecone so results fuse with vector matches
+                doc_id = vector_id(content, chunk.get("metadata", {}))
+                if doc_id in self.documents:
+                    if self.documents[doc_id][0]["content"] == content:
+                        continue
+                    self._remove(doc_id)
+
+                terms = Counter(tokenize(content))
+                metadata = {
+                    key: value for key, value in chunk.get("metadata", {}).items()
+                    if value is not None
+                }
+                metadata["content"] = content
+                length = sum(terms.values())
+
+                self.documents[doc_id] = (metadata, length)
+                self.total_length += length
+                for term, frequency in terms.items():
+                    self.postings.setdefault(term, {})[doc_id] = frequency
+                self.names.update(record_names(content))
+                added += 1
+        return added
+
+    def remove_records(self, keys: Iterable[str]) -> int:
+        """Drop every chunk of the given `source:primary_key` records; returns the number removed"""
+        keys = set(keys)
+        removed = 0
+        with self.lock:
+            for doc_id in [doc_id for doc_id, (metadata, _) in self.documents.items() if record_key(metadata) in keys]:
+                self._remove(doc_id)
+                removed += 1
+        return removed
+
+    def reload(self, path: str = "chunked_prisma_data.json") -> int:
+        """Replace the whole index with the chunks in a file; searches see the old index until the swap"""
+        fresh = BM25Index(self.k1, self.b)
+        added = fresh.load(path)
+        with self.lock:
+            self.documents = fresh.documents
+            self.postings = fresh.postings
+            self.names = fresh.names
+            self.total_length = fresh.total_length
+        return added
+
+    def load(self, path: str = "chunked_prisma_data.json") -> int:
+        """Index every chunk in a chunked data file"""
+        if not os.path.exists(path):
+            logger.warning(f"Chunked data file {path} not found, lexical index is empty")
+            return 0
+        with open(path, "r", encoding="utf-8") as f:
+            chunks = json.load(f)
+        assign_chunk_numbers(chunk.get("metadata", {}) for chunk in chunks)
+        added = self.add_documents(chunks)
+        logger.info(f"Indexed {added} chunks in lexical index")
+        return added
+
+    def search(self, query: str, top_k: int = 5,
+               metadata_filter: Optional[Dict[str, List[str]]] = None) -> List[Dict]:
+        """Return the top_k chunks by BM25 score"""
+        terms = set(tokenize(query))
+        with self.lock:
+            total_docs = len(self.documents)
+            if not terms or total_docs == 0:
+                return []
+            average_length = self.total_length / total_docs
+
+            scores: Dict[str, float] = {}
+            for term in terms:
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (total_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, frequency in postings.items():
+                    length = self.documents[doc_id][1]
+                    norm = frequency + self.k1 * (1 - self.b + self.b * length / average_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * frequency * (self.k1 + 1) / norm
+
+            if metadata_filter:
+                scores = {
+                    doc_id: score for doc_id, score in scores.items()
+                    if any(self.documents[doc_id][0].get(field) in values
+                           for field, values in metadata_filter.items())
+                }
+
+            ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+            return [
+                {'id': doc_id, 'score': score, 'metadata': dict(self.documents[doc_id][0])}
+                for doc_id, score in ranked
+            ]
+
+    def has_name(self, name: tuple) -> bool:
+        """True if some indexed chunk gives exactly this (lowercase) name"""
+        with self.lock:
+            return name in self.names
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+# Shared index for the API process; the ingestion path adds new chunks to it
+lexical_index = BM25Index()
@@ -0,0 +1,144 @@
+"""
+In-process exact vector search over the embeddings stored on disk.
+Used by MedicalRAG as an alternative to querying Pinecone.
+"""
+
+import os
+import logging
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from embedding_log import iter_embeddings
+from record_ids import vector_id
+from embedding_store import BinaryEmbeddingStore, sidecar_path_for
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+class LocalVectorStore:
+    def __init__(self, embeddings_path: str = "embedded_prisma_data.json", sidecar_path: Optional[str] = None):
+        """Initialize an empty local vector store backed by an embeddings file or its binary store"""
+        self.embeddings_path = embeddings_path
+        self.sidecar_path = sidecar_path or sidecar_path_for(embeddings_path)
+        self.ids: List[str] = []
+        self.metadata: List[Dict] = []
+        # L2-normalized float32 matrix, one row per vector
+        self.matrix = np.zeros((0, 0), dtype=np.float32)
+        # metadata field -> value -> row numbers, used to pre-filter rows
+        self.field_index: Dict[str, Dict[str, List[int]]] = {}
+        self.lock = threading.Lock()
+
+    def load(self) -> int:
+        """Load embeddings from disk into a normalized float32 matrix"""
+        if not os.path.exists(self.embeddings_path) and not BinaryEmbeddingStore(self.sidecar_path).exists():
+            logger.warning(f"Embeddings file {self.embeddings_path} not found, local store is empty")
+            return 0
+
+        ids = []
+        metadata = []
+        vectors = []
+        # Streams the snapshot plus any records still in the checkpoint log
+        for item in iter_embeddings(self.embeddings_path, sidecar_path=self.sidecar_path):
+            content = item.get("content", "")
+            embedding = item.get("embedding")
+            if embedding is None or len(embedding) == 0:
+                continue
+
+            # Same ID scheme and metadata layout as store_embeddings_in_pinecone
+            item_metadata = {
+                key: value for key, value in item.get("metadata", {}).items()
+                if value is not None
+            }
+            item_metadata["content"] = content
+
+            ids.append(vector_id(content, item.get("metadata", {})))
+            metadata.append(item_metadata)
+            vectors.append(embedding)
+
+        field_index: Dict[str, Dict[str, List[int]]] = {}
+        for row, item_metadata in enumerate(metadata):
+            for key, value in item_metadata.items():
+                if key != "content" and isinstance(value, str):
+                    field_index.setdefault(key, {}).setdefault(value, []).append(row)
+
+        matrix = np.asarray(vectors, dtype=np.float32)
+        if matrix.size:
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            matrix /= norms
+
+        with self.lock:
+            self.ids = ids
+            self.metadata = metadata
+            self.matrix = matrix
+            self.field_index = field_index
+
+        logger.info(f"Loaded {len(ids)} vectors into local vector store")
+        return len(ids)
+
+    def _filter_rows(self, field_index: Dict[str, Dict[str, List[int]]], size: int,
+                     metadata_filter: Dict[str, List[str]]) -> np.ndarray:
+        """Row numbers whose metadata matches any of the filter's field values"""
+        mask = np.zeros(size, dtype=bool)
+        for field, values in metadata_filter.items():
+            rows_by_value = field_index.get(field, {})
+            for value in values:
+                rows = rows_by_value.get(value)
+                if rows:
+                    mask[rows] = True
+        return np.flatnonzero(mask)
+
+    def query(self, vector: List[float], top_k: int = 5,
+              metadata_filter: Optional[Dict[str, List[str]]] = None) -> List[Dict]:
+        """Return the top_k most similar vectors by cosine similarity, optionally pre-filtered"""
+        with self.lock:
+            matrix = self.matrix
+            ids = self.ids
+            metadata = self.metadata
+            field_index = self.field_index
+
+        if not ids or top_k <= 0:
+            return []
+
+        query = np.asarray(vector, dtype=np.float32)
+        if query.shape[0] != matrix.shape[1]:
+            logger.error(f"Query dimension {query.shape[0]} does not match index dimension {matrix.shape[1]}")
+            return []
+
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return []
+        query /= norm
+
+        if metadata_filter:
+            # Only score the rows for the requested entities
+            rows = self._filter_rows(field_index, len(ids), metadata_filter)
+            if rows.size == 0:
+                return []
+            scores = matrix[rows] @ query
+        else:
+            rows = None
+            scores = matrix @ query
+
+        # argpartition selects the top_k in O(n); only those are sorted
+        k = min(top_k, scores.shape[0])
+        if k < scores.shape[0]:
+            candidates = np.argpartition(scores, -k)[-k:]
+        else:
+            candidates = np.arange(scores.shape[0])
+        candidates = candidates[np.argsort(-scores[candidates])]
+
+        results = []
+        for i in candidates:
+            row = rows[i] if rows is not None else i
+            results.append({
+                'id': ids[row],
+                'score': float(scores[i]),
+                'metadata': dict(metadata[row])
+            })
+        return results
+
+    def __len__(self) -> int:
+        return len(self.ids)
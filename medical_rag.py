@@ -5,7 +5,22 @@ from dotenv import load_dotenv
 from pinecone import Pinecone
 import requests
 import time
-from typing import Any, Dict, List, Optional
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+from local_vector_store import LocalVectorStore
+from embedding_store import EMBEDDING_SIDECAR_PATH
+from embedding_cache import EmbeddingCache, normalize_text
+from answer_cache import SemanticAnswerCache
+from index_version import get_index_version
+from http_clients import get_session, connection_stats, EMBEDDING_TIMEOUT, LLM_TIMEOUT, LLM_READ_TIMEOUT
+from session_store import SessionHistoryStore
+from entity_filters import extract_entity_filters, to_pinecone_filter
+from lexical_index import lexical_index, is_lexical_query, reciprocal_rank_fusion
+from context_packer import ContextPacker
+from single_flight import SingleFlight
+from hedging import RequestHedger, HedgeTimeout
+from key_pool import get_key_pool
 
 # Set up logging
 logger = logging.getLogger(__name__)
@@ -18,89 +33,200 @@ PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 LLM_API_KEY = os.getenv("LLM_API_KEY")
 SAMBANOVA_BASE_URL = os.getenv("SAMBANOVA_BASE_URL", "https://api.sambanova.ai/v1")
 
+# Vector store backend: "pinecone" (default) or "local" for in-process search
+VECTOR_STORE = os.getenv("VECTOR_STORE", "pinecone").lower()
+LOCAL_EMBEDDINGS_PATH = os.getenv("LOCAL_EMBEDDINGS_PATH", "embedded_prisma_data.json")
+CHUNKED_DATA_PATH = os.getenv("CHUNKED_DATA_PATH", "chunked_prisma_data.json")
+
+# Batch question settings
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+BATCH_RETRIEVAL_CONCURRENCY = int(os.getenv("BATCH_RETRIEVAL_CONCURRENCY", "16"))
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "4"))
+# Upper bound on the concurrency a caller may ask for
+BATCH_LLM_MAX_CONCURRENCY = int(os.getenv("BATCH_LLM_MAX_CONCURRENCY", "16"))
+
+# Session used when callers do not identify one (e.g. the interactive CLI)
+DEFAULT_SESSION_ID = "default"
+
+# Answer given without calling the LLM when retrieval finds nothing
+NO_DOCUMENTS_ANSWER = "I couldn't find any relevant medical records to answer your question."
+
+class AnswerPlan(NamedTuple):
+    """How a question will be answered, shared by the sync, async and streaming paths"""
+    # Set when no LLM call is needed (no documents, or a cached answer)
+    response: Optional[str]
+    # Identical concurrent questions over the same records share one LLM call
+    flight_key: Tuple
+    # (chunk_ids, index_version, context_key) to store the answer under, or None
+    cache_key: Optional[Tuple]
+
+class StreamError(Exception):
+    """A streamed LLM answer failed part-way; the message is safe to show the user"""
+
+def history_key(history: List[Dict[str, str]]) -> str:
+    """Stable key for the conversation turns that go into a prompt"""
+    if not history:
+        return ""
+    text = "\n".join(f"{turn['query']}\n{turn['response']}" for turn in history)
+    return hashlib.md5(text.encode('utf-8')).hexdigest()
+
 class MedicalRAG:
     def __init__(self):
         """Initialize the Medical RAG system"""
         # Validate environment variables
-        if not PINECONE_API_KEY:
+        if VECTOR_STORE not in ("pinecone", "local"):
+            raise ValueError(f"Unsupported VECTOR_STORE '{VECTOR_STORE}', expected 'pinecone' or 'local'")
+        if VECTOR_STORE == "pinecone" and not PINECONE_API_KEY:
             raise ValueError("PINECONE_API_KEY not found in environment variables")
         if not LLM_API_KEY:
             raise ValueError("LLM_API_KEY not found in environment variables")
         
-        # Initialize Pinecone - Updated for Pinecone SDK v7+
-        self.pc = Pinecone(api_key=PINECONE_API_KEY)
-        self.index = self.pc.Index("medical-records")
+        self.pc = None
+        self.index = None
+        self.local_store: Optional[LocalVectorStore] = None
+        
+        if VECTOR_STORE == "local":
+            # Serve similarity search from the embeddings file on disk
+            self.local_store = LocalVectorStore(LOCAL_EMBEDDINGS_PATH, EMBEDDING_SIDECAR_PATH)
+            self.local_store.load()
+            self.local_store_version = get_index_version()
+        else:
+            # Initialize Pinecone - Updated for Pinecone SDK v7+
+            self.pc = Pinecone(api_key=PINECONE_API_KEY)
+            self.index = self.pc.Index("medical-records")
         
         # LLM configuration
         self.llm_model = "Meta-Llama-3.3-70B-Instruct"
+        self.embedding_model = "E5-Mistral-7B-Instruct"
+        
+        # BM25 index over chunk content for hybrid and exact-match retrieval
+        self.lexical_index = lexical_index
+        if not len(self.lexical_index):
+            self.lexical_index.load(CHUNKED_DATA_PATH)
+        
+        # Token-budgeted assembly of retrieved documents into the prompt
+        self.context_packer = ContextPacker()
+        
+        # Cache of query embeddings, keyed on normalized text and model
+        self.embedding_cache = EmbeddingCache()
+        
+        # Coalesce identical concurrent embedding and generation calls
+        self.embedding_flight = SingleFlight("embedding")
+        self.generation_flight = SingleFlight("generation")
+        
+        # Requests are spread over LLM_API_KEY and the FALLBACK_API_KEY_* keys
+        self.key_pool = get_key_pool()
         
-        # Chat history
-        self.chat_history: List[Dict[str, str]] = []
+        # Duplicate slow LLM calls on another key once they pass the rolling p95
+        self.hedger = RequestHedger()
+        
+        # Cache of LLM answers for near-duplicate queries over the same chunks
+        self.answer_cache = SemanticAnswerCache()
+        
+        # Chat history, kept separately for each session
+        self.sessions = SessionHistoryStore()
         
         logger.info("Medical RAG system initialized successfully")
     
-    def search_similar_documents(self, query: str, top_k: int = 5) -> List[Dict]:
-        """Search for similar documents in Pinecone based on the query"""
+    def search_similar_documents(self, query: str, top_k: int = 5,
+                                 query_embedding: Optional[List[float]] = None) -> List[Dict]:
+        """Search for similar documents in the vector store based on the query"""
         try:
             logger.info(f"Searching for similar documents for query: {query[:50]}...")
-            # Generate embedding for the query
-            query_embedding = self.get_embedding(query)
+            # Generate embedding for the query unless the caller already has one
+            if query_embedding is None:
+                query_embedding = self.get_embedding(query)
             
             if query_embedding is None:
                 logger.warning("Failed to generate query embedding")
                 return []
             
-            # Search in Pinecone
-            results = self.index.query(
-                vector=query_embedding,
-                top_k=top_k,
-                include_metadata=True
-            )
-            
-            # Extract matches from results - correct way for Pinecone client
+            # Push exact entity IDs in the query down as metadata filters
+            entity_filters = extract_entity_filters(query)
             matches = []
-            # Access matches using getattr to avoid linter issues
-            scored_vectors = list(getattr(results, 'matches', []))
-            for match in scored_vectors:
-                matches.append({
-                    'id': getattr(match, 'id', ''),
-                    'score': getattr(match, 'score', 0.0),
-                    'metadata': dict(getattr(match, 'metadata', {}))
-                })
+            if entity_filters:
+                matches = self.query_vector_store(query_embedding, top_k, entity_filters)
+                if not matches:
+                    logger.info("No documents matched the entity filter, falling back to unfiltered search")
+                    entity_filters = {}
+            if not matches:
+                matches = self.query_vector_store(query_embedding, top_k)
+            
+            # Merge with BM25 results, which catch exact terms dense vectors miss
+            lexical_matches = self.lexical_index.search(query, top_k, entity_filters or None)
+            if lexical_matches:
+                matches = reciprocal_rank_fusion([matches, lexical_matches], top_k)
             
-            logger.info(f"Found {len(matches)} similar documents")
+            logger.info(f"Found {len(matches)} similar documents ({len(lexical_matches)} lexical matches fused)")
             return matches
             
         except Exception as error:
             logger.error(f"Error searching documents: {error}")
             return []
     
+    def query_vector_store(self, query_embedding: List[float], top_k: int,
+                           entity_filters: Optional[Dict[str, List[str]]] = None) -> List[Dict]:
+        """Run a top-k similarity query against the configured vector store"""
+        if self.local_store is not None:
+            # Pick up embeddings written by the ingestion path
+            index_version = get_index_version()
+            if index_version != self.local_store_version:
+                self.local_store.load()
+                self.local_store_version = index_version
+            return self.local_store.query(query_embedding, top_k=top_k, metadata_filter=entity_filters)
+        
+        # Search in Pinecone
+        results = self.index.query(
+            vector=query_embedding,
+            top_k=top_k,
+            include_metadata=True,
+            filter=to_pinecone_filter(entity_filters) if entity_filters else None
+        )
+        
+        # Extract matches from results - correct way for Pinecone client
+        matches = []
+        # Access matches using getattr to avoid linter issues
+        scored_vectors = list(getattr(results, 'matches', []))
+        for match in scored_vectors:
+            matches.append({
+                'id': getattr(match, 'id', ''),
+                'score': getattr(match, 'score', 0.0),
+                'metadata': dict(getattr(match, 'metadata', {}))
+            })
+        return matches
+    
     def get_embedding(self, text: str) -> Optional[List[float]]:
         """Generate embedding for text using Sambanova API"""
+        cached = self.embedding_cache.get(text, self.embedding_model)
+        if cached is not None:
+            logger.debug("Using cached query embedding")
+            return cached
+        
+        key = (self.embedding_model, normalize_text(text))
+        return self.embedding_flight.do(key, self.request_embedding, text)
+    
+    def request_embedding(self, text: str) -> Optional[List[float]]:
+        """Call the Sambanova embeddings API for a single text"""
         try:
-            headers = {
-                "Authorization": f"Bearer {LLM_API_KEY}",
-                "Content-Type": "application/json"
-            }
-            
             payload = {
-                "model": "E5-Mistral-7B-Instruct",
+                "model": self.embedding_model,
                 "input": text
             }
             
             logger.debug(f"Generating embedding for text (length: {len(text)} chars)")
-            response = requests.post(
+            response = self.key_pool.request(lambda api_key: get_session(api_key).post(
                 f"{SAMBANOVA_BASE_URL}/embeddings",
-                headers=headers,
                 json=payload,
-                timeout=30
-            )
+                timeout=EMBEDDING_TIMEOUT
+            ))
             
             if response.status_code == 200:
                 data = response.json()
                 if 'data' in data and len(data['data']) > 0:
                     logger.debug("Successfully generated embedding")
-                    return data['data'][0]['embedding']
+                    embedding = data['data'][0]['embedding']
+                    self.embedding_cache.put(text, self.embedding_model, embedding)
+                    return embedding
                 else:
                     logger.error("Unexpected embedding response format")
                     return None
@@ -115,43 +241,80 @@ class MedicalRAG:
             logger.error(f"Error generating embedding: {error}")
             return None
     
-    def format_context(self, documents: List[Dict]) -> str:
-        """Format retrieved documents as context for the LLM"""
+    def get_embeddings(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """Generate embeddings for many texts with multi-input embedding requests"""
+        embeddings: List[Optional[List[float]]] = [None] * len(texts)
+        missing = []
+        for i, text in enumerate(texts):
+            embeddings[i] = self.embedding_cache.get(text, self.embedding_model)
+            if embeddings[i] is None:
+                missing.append(i)
+        
+        for start in range(0, len(missing), EMBEDDING_BATCH_SIZE):
+            batch = missing[start:start + EMBEDDING_BATCH_SIZE]
+            try:
+                payload = {
+                    "model": self.embedding_model,
+                    "input": [texts[i] for i in batch]
+                }
+                
+                logger.info(f"Generating {len(batch)} embeddings in one request")
+                response = self.key_pool.request(lambda api_key: get_session(api_key).post(
+                    f"{SAMBANOVA_BASE_URL}/embeddings",
+                    json=payload,
+                    timeout=EMBEDDING_TIMEOUT
+                ))
+                
+                if response.status_code != 200:
+                    logger.error(f"Error generating embeddings: {response.status_code} - {response.text}")
+                    continue
+                
+                data = response.json().get('data', [])
+                # Results carry their input position; fall back to response order
+                for position, item in enumerate(data):
+                    offset = item.get('index', position)
+                    if not isinstance(offset, int) or not 0 <= offset < len(batch):
+                        logger.warning(f"Ignoring embedding with out-of-range index {offset}")
+                        continue
+                    i = batch[offset]
+                    embeddings[i] = item['embedding']
+                    self.embedding_cache.put(texts[i], self.embedding_model, item['embedding'])
+                
+            except requests.exceptions.Timeout:
+                logger.error("Request timeout while generating embeddings")
+            except Exception as error:
+                logger.error(f"Error generating embeddings: {error}")
+        
+        return embeddings
+    
+    def format_context(self, documents: List[Dict], query: str = "") -> str:
+        """Format retrieved documents as context for the LLM within the token budget"""
         if not documents:
             logger.warning("No documents to format as context")
             return "No relevant documents found."
         
-        context = ""
-        for i, doc in enumerate(documents):
-            metadata = doc.get('metadata', {})
-            score = doc.get('score', 0.0)
-            
-            context += f"Document {i+1}:\n"
-            context += f"Content: {metadata.get('content', 'N/A')}\n"
-            context += f"Source: {metadata.get('source', 'N/A')}\n"
-            context += f"Relevance Score: {score:.4f}\n\n"
-        return context
+        return self.context_packer.pack(documents, query).text
     
-    def generate_response(self, query: str, context_documents: List[Dict]) -> str:
-        """Generate response using the LLM with RAG context"""
-        try:
-            # Format context from retrieved documents
-            context = self.format_context(context_documents)
-            logger.info(f"Formatted context with {len(context_documents)} documents")
-            
-            # Prepare chat history (last 3 turns for context)
-            chat_history = ""
-            if self.chat_history:
-                for turn in self.chat_history[-3:]:
-                    chat_history += f"Human: {turn['query']}\nAssistant: {turn['response']}\n\n"
-            
-            # Create prompt with RAG context
-            if chat_history:
-                chat_history_text = f"Conversation History:\n{chat_history}"
-            else:
-                chat_history_text = ""
-            
-            prompt = f"""You are a medical assistant AI. Use the following medical records and conversation history to answer the user's question.
+    def build_llm_payload(self, query: str, context_documents: List[Dict], stream: bool = False,
+                          history: Optional[List[Dict[str, str]]] = None) -> Dict[str, Any]:
+        """Build the chat completions payload with RAG context and the session's recent turns"""
+        # Format context from retrieved documents
+        context = self.format_context(context_documents, query)
+        logger.info(f"Formatted context with {len(context_documents)} documents")
+        
+        # Prepare chat history (last 3 turns for context)
+        chat_history = ""
+        if history:
+            for turn in history[-3:]:
+                chat_history += f"Human: {turn['query']}\nAssistant: {turn['response']}\n\n"
+        
+        # Create prompt with RAG context
+        if chat_history:
+            chat_history_text = f"Conversation History:\n{chat_history}"
+        else:
+            chat_history_text = ""
+        
+        prompt = f"""You are a medical assistant AI. Use the following medical records and conversation history to answer the user's question.
 
 {chat_history_text}
 
@@ -170,28 +333,32 @@ Instructions:
 7. Address the user as a medical professional (doctor).
 8. Be direct and avoid unnecessary explanations."""
 
-            # Call LLM API
-            headers = {
-                "Authorization": f"Bearer {LLM_API_KEY}",
-                "Content-Type": "application/json"
-            }
-            
-            payload = {
-                "model": self.llm_model,
-                "messages": [
-                    {"role": "system", "content": "You are a medical assistant AI specialized in analyzing patient records and providing diagnostic differentials when requested. Always base your responses on the specific patient information provided in the records. Address the user as a medical professional (doctor). Be direct and concise."},
-                    {"role": "user", "content": prompt}
-                ],
-                "temperature": 0.7,
-                "max_tokens": 300  # Further reduced for more concise responses
-            }
+        return {
+            "model": self.llm_model,
+            "messages": [
+                {"role": "system", "content": "You are a medical assistant AI specialized in analyzing patient records and providing diagnostic differentials when requested. Always base your responses on the specific patient information provided in the records. Address the user as a medical professional (doctor). Be direct and concise."},
+                {"role": "user", "content": prompt}
+            ],
+            "temperature": 0.7,
+            "max_tokens": 300,  # Further reduced for more concise responses
+            "stream": stream
+        }
+    
+    def generate_response(self, query: str, context_documents: List[Dict],
+                          history: Optional[List[Dict[str, str]]] = None) -> str:
+        """Generate response using the LLM with RAG context"""
+        try:
+            payload = self.build_llm_payload(query, context_documents, history=history)
             
+            # Call LLM API, hedging on another key if the primary is slow
             logger.info("Generating response with LLM...")
-            response = requests.post(
-                f"{SAMBANOVA_BASE_URL}/chat/completions",
-                headers=headers,
-                json=payload,
-                timeout=60
+            # Read timeouts are left to the hedge rather than retried on the same call
+            send = lambda: self.key_pool.request(lambda api_key: self.post_chat_completion(api_key, payload))
+            response = self.hedger.call(
+                send,
+                send if len(self.key_pool) > 1 else None,
+                deadline=LLM_READ_TIMEOUT,
+                accept=lambda result: result.status_code == 200
             )
             
             if response.status_code == 200:
@@ -206,14 +373,154 @@ Instructions:
                 logger.error(f"Error generating response: {response.status_code} - {response.text}")
                 return "Sorry, I encountered an error while generating the response."
                 
-        except requests.exceptions.Timeout:
+        except (requests.exceptions.Timeout, HedgeTimeout):
             logger.error("Request timeout while generating response")
             return "Sorry, the request timed out. Please try again."
         except Exception as error:
             logger.error(f"Error generating response: {error}")
             return "Sorry, I encountered an error while generating the response."
     
-    def ask_question(self, query: str) -> str:
+    def post_chat_completion(self, api_key: str, payload: Dict) -> requests.Response:
+        """Send one non-streaming chat completion request"""
+        return get_session(api_key).post(
+            f"{SAMBANOVA_BASE_URL}/chat/completions",
+            json=payload,
+            timeout=LLM_TIMEOUT
+        )
+    
+    def stream_response(self, query: str, context_documents: List[Dict],
+                        history: Optional[List[Dict[str, str]]] = None) -> Iterator[str]:
+        """Generate response using the LLM with RAG context, yielding tokens as they arrive
+
+        Raises StreamError if the request fails or the stream breaks off, so a
+        partial answer is never mistaken for a complete one.
+        """
+        try:
+            payload = self.build_llm_payload(query, context_documents, stream=True, history=history)
+            
+            logger.info("Streaming response from LLM...")
+            # The key counts as busy until the whole answer has been read
+            with self.key_pool.stream(lambda api_key: get_session(api_key).post(
+                f"{SAMBANOVA_BASE_URL}/chat/completions",
+                json=payload,
+                timeout=LLM_TIMEOUT,
+                stream=True
+            )) as response:
+                if response.status_code != 200:
+                    logger.error(f"Error streaming response: {response.status_code} - {response.text}")
+                    raise StreamError("Sorry, I encountered an error while generating the response.")
+                
+                # Server-sent events: one "data: {...}" line per chunk, ending with "data: [DONE]"
+                finished = False
+                for line in response.iter_lines(decode_unicode=True):
+                    if not line or not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        finished = True
+                        break
+                    chunk = json.loads(data)
+                    choices = chunk.get('choices') or []
+                    if choices:
+                        token = (choices[0].get('delta') or {}).get('content')
+                        if token:
+                            yield token
+                if not finished:
+                    logger.error("LLM stream ended before [DONE]")
+                    raise StreamError("Sorry, the response was cut off. Please try again.")
+            
+            logger.info("Successfully streamed response")
+            
+        except StreamError:
+            raise
+        except requests.exceptions.Timeout as error:
+            logger.error("Request timeout while streaming response")
+            raise StreamError("Sorry, the request timed out. Please try again.") from error
+        except Exception as error:
+            logger.error(f"Error streaming response: {error}")
+            raise StreamError("Sorry, I encountered an error while generating the response.") from error
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Return runtime counters for the query path"""
+        return {
+            "embedding_cache": self.embedding_cache.stats(),
+            "answer_cache": self.answer_cache.stats(),
+            "sessions": self.sessions.stats(),
+            "context": self.context_packer.stats(),
+            "single_flight": {
+                "embedding": self.embedding_flight.stats(),
+                "generation": self.generation_flight.stats()
+            },
+            "hedging": self.hedger.stats(),
+            "api_keys": self.key_pool.stats(),
+            "http": connection_stats()
+        }
+    
+    def lexical_lookup(self, query: str, top_k: int = 5) -> List[Dict]:
+        """Serve ID, phone number and name lookups from the BM25 index alone"""
+        if not is_lexical_query(query, self.lexical_index):
+            return []
+        matches = self.lexical_index.search(query, top_k, extract_entity_filters(query) or None)
+        if matches:
+            logger.info(f"Answered lexical query from BM25 index with {len(matches)} documents, skipping embedding")
+        return matches
+    
+    def retrieve(self, query: str) -> Tuple[Optional[List[float]], List[Dict]]:
+        """Embed the query and retrieve relevant documents"""
+        lexical_matches = self.lexical_lookup(query)
+        if lexical_matches:
+            return None, lexical_matches
+        
+        query_embedding = self.get_embedding(query)
+        if query_embedding is None:
+            logger.warning("Failed to generate query embedding")
+            return None, []
+        return query_embedding, self.search_similar_documents(query, query_embedding=query_embedding)
+    
+    def record_turn(self, query: str, response: str, session_id: str = DEFAULT_SESSION_ID):
+        """Store a question and its answer in the session's chat history"""
+        self.sessions.add_turn(session_id, query, response)
+    
+    def plan_answer(self, query: str, query_embedding: Optional[List[float]],
+                    relevant_docs: List[Dict], history: List[Dict[str, str]]) -> AnswerPlan:
+        """Decide how to answer from retrieved documents, reusing a cached answer when possible"""
+        if not relevant_docs:
+            return AnswerPlan(NO_DOCUMENTS_ANSWER, (), None)
+        
+        context_key = history_key(history)
+        chunk_ids = [doc['id'] for doc in relevant_docs]
+        flight_key = (normalize_text(query), tuple(chunk_ids), context_key)
+        if query_embedding is None:
+            # Lexical lookups have no embedding to match against the answer cache
+            return AnswerPlan(None, flight_key, None)
+        
+        # Reuse a stored answer for a near-identical query over the same records
+        index_version = get_index_version()
+        response = self.answer_cache.get(query_embedding, chunk_ids, index_version, context_key)
+        if response is not None:
+            logger.info("Using cached answer for semantically similar question")
+        return AnswerPlan(response, flight_key, (chunk_ids, index_version, context_key))
+    
+    def store_answer(self, query_embedding: Optional[List[float]], plan: AnswerPlan, response: str):
+        """Cache a generated answer, unless it is empty or an apology for a failure"""
+        if plan.cache_key is None or not response or response.startswith("Sorry,"):
+            return
+        chunk_ids, index_version, context_key = plan.cache_key
+        self.answer_cache.put(query_embedding, chunk_ids, index_version, response, context_key)
+    
+    def answer_from_documents(self, query: str, query_embedding: Optional[List[float]],
+                              relevant_docs: List[Dict], history: List[Dict[str, str]]) -> str:
+        """Answer from retrieved documents, reusing a cached answer when possible"""
+        plan = self.plan_answer(query, query_embedding, relevant_docs, history)
+        if plan.response is not None:
+            return plan.response
+        
+        # Generate response using LLM with RAG
+        response = self.generation_flight.do(plan.flight_key, self.generate_response, query, relevant_docs, history)
+        self.store_answer(query_embedding, plan, response)
+        return response
+    
+    def ask_question(self, query: str, session_id: str = DEFAULT_SESSION_ID) -> str:
         """Main method to ask a question and get a response"""
         if not query or not query.strip():
             logger.warning("Empty or invalid question provided")
@@ -221,26 +528,109 @@ Instructions:
         
         logger.info(f"Processing question: {query[:50]}...")
         # Search for relevant documents
-        relevant_docs = self.search_similar_documents(query)
-        
-        if not relevant_docs:
-            response = "I couldn't find any relevant medical records to answer your question."
-        else:
-            # Generate response using LLM with RAG
-            response = self.generate_response(query, relevant_docs)
+        query_embedding, relevant_docs = self.retrieve(query)
+        history = self.sessions.get_turns(session_id)
+        response = self.answer_from_documents(query, query_embedding, relevant_docs, history)
         
         # Store in chat history
-        self.chat_history.append({
-            "query": query,
-            "response": response
-        })
-        
-        # Keep only last 10 turns
-        if len(self.chat_history) > 10:
-            self.chat_history.pop(0)
+        self.record_turn(query, response, session_id)
         
         logger.info("Question processed successfully")
         return response
+    
+    def ask_question_stream(self, query: str, session_id: str = DEFAULT_SESSION_ID) -> Iterator[Dict[str, Any]]:
+        """Ask a question, yielding retrieval results first and then answer tokens"""
+        if not query or not query.strip():
+            logger.warning("Empty or invalid question provided")
+            yield {"event": "error", "data": {"error": "Please provide a valid question."}}
+            return
+        
+        logger.info(f"Processing streaming question: {query[:50]}...")
+        query_embedding, relevant_docs = self.retrieve(query)
+        yield {"event": "documents", "data": {"documents": relevant_docs}}
+        
+        history = self.sessions.get_turns(session_id)
+        plan = self.plan_answer(query, query_embedding, relevant_docs, history)
+        if plan.response is not None:
+            response = plan.response
+            yield {"event": "token", "data": {"content": response}}
+        else:
+            tokens = []
+            try:
+                for token in self.stream_response(query, relevant_docs, history):
+                    tokens.append(token)
+                    yield {"event": "token", "data": {"content": token}}
+            except StreamError as error:
+                # Nothing is cached or kept in the history for a failed answer
+                yield {"event": "error", "data": {"error": str(error), "partial": "".join(tokens)}}
+                return
+            response = "".join(tokens)
+            self.store_answer(query_embedding, plan, response)
+        
+        # Store in chat history once the full answer is known
+        self.record_turn(query, response, session_id)
+        
+        logger.info("Streaming question processed successfully")
+        yield {"event": "done", "data": {"answer": response}}
+
+    def ask_many(self, queries: List[str], max_concurrency: int = BATCH_LLM_CONCURRENCY) -> List[Dict[str, Any]]:
+        """Answer many independent questions, returning results in input order
+
+        Each result has the question and either an "answer" or an "error".
+        max_concurrency is clamped to 1..BATCH_LLM_MAX_CONCURRENCY.
+        """
+        max_concurrency = max(1, min(int(max_concurrency), BATCH_LLM_MAX_CONCURRENCY))
+        results: List[Dict[str, Any]] = [{"question": query} for query in queries]
+        embeddings: List[Optional[List[float]]] = [None] * len(queries)
+        documents: List[List[Dict]] = [[] for _ in queries]
+        
+        # Lexical lookups skip the embedding call entirely
+        to_embed = []
+        for i, query in enumerate(queries):
+            if not isinstance(query, str) or not query.strip():
+                results[i]["error"] = "Please provide a valid question."
+                continue
+            documents[i] = self.lexical_lookup(query)
+            if not documents[i]:
+                to_embed.append(i)
+        
+        logger.info(f"Processing batch of {len(queries)} questions ({len(to_embed)} need embeddings)")
+        for i, embedding in zip(to_embed, self.get_embeddings([queries[i] for i in to_embed])):
+            if embedding is None:
+                results[i]["error"] = "Failed to generate query embedding"
+            embeddings[i] = embedding
+        
+        # Vector queries are I/O bound, so run them concurrently
+        to_search = [i for i in to_embed if embeddings[i] is not None]
+        with ThreadPoolExecutor(max_workers=max(1, min(BATCH_RETRIEVAL_CONCURRENCY, len(to_search) or 1))) as executor:
+            futures = {
+                i: executor.submit(self.search_similar_documents, queries[i], 5, embeddings[i])
+                for i in to_search
+            }
+            for i, future in futures.items():
+                documents[i] = future.result()
+        
+        # Fan out LLM calls with a bounded number in flight
+        to_answer = [i for i, result in enumerate(results) if "error" not in result]
+        with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(to_answer) or 1))) as executor:
+            futures = {
+                i: executor.submit(self.answer_from_documents, queries[i], embeddings[i], documents[i], [])
+                for i in to_answer
+            }
+            for i, future in futures.items():
+                try:
+                    answer = future.result()
+                    # Generation failures come back as apologies; report them as errors
+                    if answer.startswith("Sorry,"):
+                        results[i]["error"] = answer
+                    else:
+                        results[i]["answer"] = answer
+                except Exception as error:
+                    logger.error(f"Error answering batch question {i}: {error}")
+                    results[i]["error"] = str(error)
+        
+        logger.info("Batch processed successfully")
+        return results
 
 def main():
     """Main function to demonstrate the Medical RAG system"""
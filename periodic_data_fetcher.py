@@ -1,6 +1,7 @@
 """
 Periodic Data Fetcher
-This script periodically checks for new data in the database and sends it to the RAG system.
+This script periodically checks all tables for rows changed since their
+sync watermarks and sends them to the RAG system.
 """
 
 import asyncio
@@ -10,7 +11,10 @@ import os
 import logging
 from dotenv import load_dotenv
 import requests
-from datetime import datetime, timedelta
+from datetime import datetime
+from chunk_prisma_data import collect_changes, latest_watermark
+from record_ids import RECORD_TABLES
+from watermark_store import WatermarkStore
 
 # Set up logging
 logging.basicConfig(
@@ -26,9 +30,10 @@ load_dotenv()
 DATABASE_URL = os.getenv("DATABASE_URL")
 RENDER_SERVICE_URL = os.getenv("RENDER_SERVICE_URL", "https://rag-llm-1.onrender.com")
 UPDATE_RAG_ENDPOINT = f"{RENDER_SERVICE_URL}/update_rag"
-
-# Track the last check time
-last_check_time = None
+# The server ingests the rows before answering, which can take a while
+UPDATE_RAG_TIMEOUT = float(os.getenv("UPDATE_RAG_TIMEOUT", "600"))
+# Rows fetched per page while collecting changes
+WATERMARK_BATCH_SIZE = int(os.getenv("WATERMARK_BATCH_SIZE", "1000"))
 
 async def send_to_rag_system(data, operation_type):
     """Send data to the RAG system"""
@@ -38,18 +43,21 @@ async def send_to_rag_system(data, operation_type):
         }
         
         # Format the data to match what the RAG system expects
+        # (dates as strings, as the RAG system stores them)
         payload = {
             "timestamp": datetime.now().isoformat(),
             "source": "periodic_fetcher",
             "operation": operation_type,
-            "data": data
+            "data": json.loads(json.dumps(data, default=str)),
+            # Answer only once the rows are ingested, so a 200 means they are in the index
+            "wait": True
         }
         
         logger.info(f"Sending data to RAG system: {UPDATE_RAG_ENDPOINT}")
-        logger.info(f"Payload: {payload}")
+        logger.info(f"Payload tables: {list(data)}")
         
         # Send the request
-        response = requests.post(UPDATE_RAG_ENDPOINT, json=payload, headers=headers, timeout=30)
+        response = requests.post(UPDATE_RAG_ENDPOINT, json=payload, headers=headers, timeout=UPDATE_RAG_TIMEOUT)
         
         if response.status_code == 200:
             logger.info("Successfully sent data to RAG system")
@@ -67,83 +75,28 @@ async def send_to_rag_system(data, operation_type):
         return False
 
 async def check_for_new_data(conn):
-    """Check for new data in all tables"""
-    global last_check_time
-    
-    # Set the check time for this run
-    current_check_time = datetime.utcnow()
-    
-    # If this is the first run, check for data from the last 5 minutes
-    if last_check_time is None:
-        last_check_time = current_check_time - timedelta(minutes=5)
-    
-    logger.info(f"Checking for data updated between {last_check_time} and {current_check_time}")
-    
-    # Check Hospital table
-    try:
-        hospitals = await conn.fetch('''
-            SELECT * FROM "Hospital" 
-            WHERE created_at > $1
-            ORDER BY created_at DESC
-        ''', last_check_time)
-        
-        if hospitals:
-            logger.info(f"Found {len(hospitals)} new/updated hospitals")
-            hospitals_data = []
-            for hospital in hospitals:
-                hospital_dict = dict(hospital)
-                # Convert datetime objects to strings
-                if 'created_at' in hospital_dict and hospital_dict['created_at']:
-                    hospital_dict['created_at'] = hospital_dict['created_at'].isoformat()
-                hospitals_data.append(hospital_dict)
-            await send_to_rag_system(hospitals_data, "hospital_update")
-    except Exception as e:
-        logger.error(f"Error checking hospitals: {e}")
+    """Forward rows changed in any table since its committed watermark to the RAG system"""
+    # Watermarks are durable, so a restart resumes where the last accepted send left off
+    store = WatermarkStore()
+    for table in RECORD_TABLES:
+        if store.get(table) is None:
+            # History is ingested by the server's full refresh; start watching from now
+            watermark = await latest_watermark(conn, table)
+            if watermark is not None:
+                store.commit(table, watermark)
+                logger.info(f"Started watching {table} from {watermark.changed_at}")
     
-    # Check Doctor table
-    try:
-        doctors = await conn.fetch('''
-            SELECT * FROM "Doctor" 
-            WHERE created_at > $1
-            ORDER BY created_at DESC
-        ''', last_check_time)
-        
-        if doctors:
-            logger.info(f"Found {len(doctors)} new/updated doctors")
-            doctors_data = []
-            for doctor in doctors:
-                doctor_dict = dict(doctor)
-                # Convert datetime objects to strings
-                if 'created_at' in doctor_dict and doctor_dict['created_at']:
-                    doctor_dict['created_at'] = doctor_dict['created_at'].isoformat()
-                doctors_data.append(doctor_dict)
-            await send_to_rag_system(doctors_data, "doctor_update")
-    except Exception as e:
-        logger.error(f"Error checking doctors: {e}")
-    
-    # Check User table
-    try:
-        users = await conn.fetch('''
-            SELECT * FROM "User" 
-            WHERE created_at > $1
-            ORDER BY created_at DESC
-        ''', last_check_time)
-        
-        if users:
-            logger.info(f"Found {len(users)} new/updated users")
-            users_data = []
-            for user in users:
-                user_dict = dict(user)
-                # Convert datetime objects to strings
-                if 'created_at' in user_dict and user_dict['created_at']:
-                    user_dict['created_at'] = user_dict['created_at'].isoformat()
-                users_data.append(user_dict)
-            await send_to_rag_system(users_data, "user_update")
-    except Exception as e:
-        logger.error(f"Error checking users: {e}")
+    data, advanced = await collect_changes(conn, store, WATERMARK_BATCH_SIZE)
+    if not data:
+        return
     
-    # Update the last check time
-    last_check_time = current_check_time
+    logger.info(f"Found {sum(len(rows) for rows in data.values())} new/updated rows in {', '.join(advanced)}")
+    # The server ingests in its own working directory; advance only once it ingested the rows
+    if await send_to_rag_system(data, "incremental_sync"):
+        for table, (watermark, keys) in advanced.items():
+            store.commit(table, watermark, keys)
+    else:
+        logger.error("RAG system did not ingest the changes; they will be resent on the next check")
 
 async def periodic_fetcher():
     """Main periodic fetcher loop"""
@@ -0,0 +1,179 @@
+"""
+Parallel Pinecone upsert engine.
+Batches are sized by serialized request bytes rather than vector count,
+and several batches are in flight at once on a bounded thread pool. Throttled,
+5xx and connection failures are retried with jittered backoff; a batch
+rejected as too large is split in half and retried.
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Set
+from dotenv import load_dotenv
+
+import urllib3
+
+from key_pool import backoff_delay, parse_retry_after, RETRYABLE_STATUS
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Configuration (Pinecone rejects upsert requests over 2 MB or 1000 vectors)
+PINECONE_UPSERT_MAX_BYTES = int(os.getenv("PINECONE_UPSERT_MAX_BYTES", "1800000"))
+PINECONE_UPSERT_MAX_VECTORS = int(os.getenv("PINECONE_UPSERT_MAX_VECTORS", "1000"))
+PINECONE_UPSERT_CONCURRENCY = int(os.getenv("PINECONE_UPSERT_CONCURRENCY", "4"))
+PINECONE_UPSERT_MAX_RETRIES = int(os.getenv("PINECONE_UPSERT_MAX_RETRIES", "5"))
+PINECONE_UPSERT_BACKOFF_BASE = float(os.getenv("PINECONE_UPSERT_BACKOFF_BASE", "0.5"))
+PINECONE_UPSERT_BACKOFF_MAX = float(os.getenv("PINECONE_UPSERT_BACKOFF_MAX", "30"))
+
+class UpsertStats(NamedTuple):
+    vectors: int
+    bytes: int
+    failed: int
+    requests: int
+    seconds: float
+
+    @property
+    def vectors_per_second(self) -> float:
+        return self.vectors / self.seconds if self.seconds else 0.0
+
+    @property
+    def bytes_per_second(self) -> float:
+        return self.bytes / self.seconds if self.seconds else 0.0
+
+def vector_bytes(vector: Dict) -> int:
+    """Serialized size of a vector record, as it is sent in the request body"""
+    return len(json.dumps(vector, separators=(",", ":"), default=str).encode("utf-8"))
+
+def is_transient(error: Exception) -> bool:
+    """Throttling, server and connection errors, which succeed if the same request is retried"""
+    if getattr(error, "status", None) in RETRYABLE_STATUS:
+        return True
+    return isinstance(error, (ConnectionError, TimeoutError, urllib3.exceptions.HTTPError))
+
+def is_too_large(error: Exception) -> bool:
+    """Pinecone rejected the request for its size, so smaller halves can succeed"""
+    status = getattr(error, "status", None)
+    message = str(error).lower()
+    return status == 413 or (status == 400 and ("size" in message or "too large" in message))
+
+class UpsertEngine:
+    def __init__(self, index, max_bytes: int = PINECONE_UPSERT_MAX_BYTES,
+                 max_vectors: int = PINECONE_UPSERT_MAX_VECTORS,
+                 concurrency: int = PINECONE_UPSERT_CONCURRENCY,
+                 max_retries: int = PINECONE_UPSERT_MAX_RETRIES,
+                 on_success: Optional[Callable[[List[Any]], None]] = None):
+        """Upsert into index; on_success receives the tags of every vector Pinecone accepted"""
+        self.index = index
+        self.max_bytes = max_bytes
+        self.max_vectors = max_vectors
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.on_success = on_success
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="upsert")
+        self.in_flight: Set = set()
+        # (vector, tag, size) triples waiting to be sent
+        self.batch: List[tuple] = []
+        self.batch_bytes = 0
+        self.lock = threading.Lock()
+        self.vectors = 0
+        self.bytes = 0
+        self.failed = 0
+        self.requests = 0
+        self.started = time.monotonic()
+        self.stats: Optional[UpsertStats] = None
+
+    def submit(self, vector: Dict, tag: Any = None):
+        """Queue a vector; full batches are sent as soon as a worker is free"""
+        size = vector_bytes(vector)
+        if self.batch and (self.batch_bytes + size > self.max_bytes or len(self.batch) >= self.max_vectors):
+            self._send()
+        self.batch.append((vector, tag, size))
+        self.batch_bytes += size
+
+    def _send(self):
+        # Backpressure: wait for a worker instead of queueing unbounded batches
+        while len(self.in_flight) >= self.concurrency:
+            done, self.in_flight = wait(self.in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                future.result()
+        self.in_flight.add(self.executor.submit(self._upsert, self.batch))
+        self.batch = []
+        self.batch_bytes = 0
+
+    def _upsert(self, batch: List[tuple]):
+        attempt = 0
+        while True:
+            try:
+                self.index.upsert(vectors=[vector for vector, _, _ in batch])
+                break
+            except Exception as error:
+                with self.lock:
+                    self.requests += 1
+                if is_too_large(error) and len(batch) > 1:
+                    logger.warning(f"Upsert of {len(batch)} vectors was too large ({error}), retrying in halves")
+                    middle = len(batch) // 2
+                    self._upsert(batch[:middle])
+                    self._upsert(batch[middle:])
+                    return
+                if not is_transient(error) or attempt == self.max_retries:
+                    logger.error(f"Failed to upsert {len(batch)} vectors starting at {batch[0][0].get('id')}: {error}")
+                    with self.lock:
+                        self.failed += len(batch)
+                    return
+                headers = getattr(error, "headers", None) or {}
+                delay = parse_retry_after(headers.get("Retry-After"))
+                if delay is None:
+                    delay = backoff_delay(attempt, PINECONE_UPSERT_BACKOFF_BASE, PINECONE_UPSERT_BACKOFF_MAX)
+                logger.warning(f"Upsert of {len(batch)} vectors failed ({error}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+                attempt += 1
+
+        with self.lock:
+            self.requests += 1
+            self.vectors += len(batch)
+            self.bytes += sum(size for _, _, size in batch)
+        if self.on_success:
+            self.on_success([tag for _, tag, _ in batch])
+
+    def close(self) -> UpsertStats:
+        """Send the last batch, wait for all requests and return throughput stats"""
+        if self.stats is not None:
+            return self.stats
+        if self.batch:
+            self._send()
+        for future in self.in_flight:
+            future.result()
+        self.in_flight = set()
+        self.executor.shutdown(wait=True)
+
+        stats = self.stats = UpsertStats(
+            vectors=self.vectors,
+            bytes=self.bytes,
+            failed=self.failed,
+            requests=self.requests,
+            seconds=time.monotonic() - self.started
+        )
+        if stats.vectors or stats.failed:
+            logger.info(
+                f"Upserted {stats.vectors} vectors ({stats.bytes / 1e6:.1f} MB) in {stats.requests} requests "
+                f"over {stats.seconds:.1f}s: {stats.vectors_per_second:.0f} vectors/s, "
+                f"{stats.bytes_per_second / 1e6:.2f} MB/s, {stats.failed} failed"
+            )
+        return stats
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.executor.shutdown(wait=True)
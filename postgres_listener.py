@@ -11,6 +11,7 @@ import logging
 from dotenv import load_dotenv
 import requests
 from datetime import datetime
+from record_ids import RECORD_TABLES
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -26,6 +27,32 @@ UPDATE_RAG_ENDPOINT = f"{RENDER_SERVICE_URL}/update_rag"
 
 # Global event loop reference
 event_loop = None
+# Pool for re-reading changed rows (the listening connection only listens)
+db_pool = None
+
+async def build_update(notification):
+    """Turn a row-change notification into the data /update_rag ingests
+
+    Inserted and updated rows are re-read and sent as records, which replace
+    the record's vectors in place; deleted rows are sent under "deleted".
+    Full-refresh and other notifications are forwarded unchanged.
+    """
+    table = notification.get("table")
+    record_id = notification.get("record_id")
+    if table not in RECORD_TABLES or record_id is None:
+        return notification
+    
+    deleted = {"deleted": [{"table": table, "record_id": record_id}]}
+    if notification.get("operation") == "DELETE":
+        return deleted
+    
+    data_key, _, primary_key = RECORD_TABLES[table]
+    row = await db_pool.fetchrow(f'SELECT * FROM "{table}" WHERE "{primary_key}" = $1', record_id)
+    if row is None:
+        # Deleted again before we read it
+        return deleted
+    # Dates and decimals as strings, as the RAG system stores them
+    return {data_key: [json.loads(json.dumps(dict(row), default=str))]}
 
 async def send_to_rag_system(data):
     """Send data to the RAG system"""
@@ -60,7 +87,7 @@ async def send_to_rag_system(data):
 
 async def listen_for_notifications():
     """Listen for PostgreSQL notifications"""
-    global event_loop
+    global event_loop, db_pool
     event_loop = asyncio.get_event_loop()
     
     # Initialize connection variable
@@ -69,6 +96,7 @@ async def listen_for_notifications():
     try:
         # Connect to the database
         conn = await asyncpg.connect(DATABASE_URL)
+        db_pool = await asyncpg.create_pool(DATABASE_URL, min_size=1, max_size=4)
         logger.info("Connected to PostgreSQL database")
         
         # Listen for RAG update notifications
@@ -85,10 +113,20 @@ async def listen_for_notifications():
     except Exception as e:
         logger.error(f"Error in listener: {e}")
     finally:
+        if db_pool:
+            await db_pool.close()
         if conn:
             await conn.close()
             logger.info("Database connection closed")
 
+async def forward_notification(notification):
+    """Build the update for a notification and send it to the RAG system"""
+    try:
+        return await send_to_rag_system(await build_update(notification))
+    except Exception as e:
+        logger.error(f"Error forwarding notification {notification}: {e}")
+        return False
+
 def handle_notification(connection, pid, channel, payload):
     """Handle incoming PostgreSQL notifications"""
     try:
@@ -102,7 +140,7 @@ def handle_notification(connection, pid, channel, payload):
             # Send to RAG system using the global event loop
             if event_loop:
                 logger.info("Scheduling send_to_rag_system to run in event loop")
-                asyncio.run_coroutine_threadsafe(send_to_rag_system(data), event_loop)
+                asyncio.run_coroutine_threadsafe(forward_notification(data), event_loop)
                 logger.info("Scheduled send_to_rag_system successfully")
             else:
                 logger.warning("No event loop available to schedule send_to_rag_system")
@@ -42,17 +42,29 @@ $func_notify_rag$ LANGUAGE plpgsql;
 */
 
 -- Alternative approach using pg_notify (requires external listener):
+-- The trigger argument names the table's primary key column; the changed
+-- row's key is sent as record_id so the listener can re-read an inserted or
+-- updated row and delete a removed row's vectors (source:record_id:chunk_no)
 CREATE OR REPLACE FUNCTION notify_rag_system()
 RETURNS TRIGGER AS $func_notify_rag$
 DECLARE
     payload JSON;
+    row_data JSONB;
 BEGIN
+    -- NEW is NULL for DELETE, so read the key from OLD
+    IF TG_OP = 'DELETE' THEN
+        row_data := to_jsonb(OLD);
+    ELSE
+        row_data := to_jsonb(NEW);
+    END IF;
+
     -- Create payload with information about the change
     payload := json_build_object(
         'table', TG_TABLE_NAME,
         'operation', TG_OP,
         'timestamp', NOW(),
-        'schema', TG_TABLE_SCHEMA
+        'schema', TG_TABLE_SCHEMA,
+        'record_id', row_data ->> TG_ARGV[0]
     );
     
     -- Notify any listening processes
@@ -73,37 +85,37 @@ $func_notify_rag$ LANGUAGE plpgsql;
 DROP TRIGGER IF EXISTS hospital_rag_update_trigger ON "Hospital";
 CREATE TRIGGER hospital_rag_update_trigger
     AFTER INSERT OR UPDATE OR DELETE ON "Hospital"
-    FOR EACH ROW EXECUTE FUNCTION notify_rag_system();
+    FOR EACH ROW EXECUTE FUNCTION notify_rag_system('hospital_id');
 
 -- Doctor table trigger
 DROP TRIGGER IF EXISTS doctor_rag_update_trigger ON "Doctor";
 CREATE TRIGGER doctor_rag_update_trigger
     AFTER INSERT OR UPDATE OR DELETE ON "Doctor"
-    FOR EACH ROW EXECUTE FUNCTION notify_rag_system();
+    FOR EACH ROW EXECUTE FUNCTION notify_rag_system('doctor_id');
 
 -- User (Patient) table trigger
 DROP TRIGGER IF EXISTS user_rag_update_trigger ON "User";
 CREATE TRIGGER user_rag_update_trigger
     AFTER INSERT OR UPDATE OR DELETE ON "User"
-    FOR EACH ROW EXECUTE FUNCTION notify_rag_system();
+    FOR EACH ROW EXECUTE FUNCTION notify_rag_system('user_id');
 
 -- Interaction table trigger
 DROP TRIGGER IF EXISTS interaction_rag_update_trigger ON "Interaction";
 CREATE TRIGGER interaction_rag_update_trigger
     AFTER INSERT OR UPDATE OR DELETE ON "Interaction"
-    FOR EACH ROW EXECUTE FUNCTION notify_rag_system();
+    FOR EACH ROW EXECUTE FUNCTION notify_rag_system('id');
 
 -- Report table trigger
 DROP TRIGGER IF EXISTS report_rag_update_trigger ON "Report";
 CREATE TRIGGER report_rag_update_trigger
     AFTER INSERT OR UPDATE OR DELETE ON "Report"
-    FOR EACH ROW EXECUTE FUNCTION notify_rag_system();
+    FOR EACH ROW EXECUTE FUNCTION notify_rag_system('id');
 
 -- SOAP Note table trigger
 DROP TRIGGER IF EXISTS soap_note_rag_update_trigger ON "SoapNote";
 CREATE TRIGGER soap_note_rag_update_trigger
     AFTER INSERT OR UPDATE OR DELETE ON "SoapNote"
-    FOR EACH ROW EXECUTE FUNCTION notify_rag_system();
+    FOR EACH ROW EXECUTE FUNCTION notify_rag_system('id');
 
 -- Create a function to manually trigger RAG updates for all data
 CREATE OR REPLACE FUNCTION trigger_full_rag_update()
@@ -0,0 +1,423 @@
+"""
+Reconciliation job between Postgres and the Pinecone index.
+Record keys are hashed into partitions, and each side is reduced to one
+order-independent digest per partition (XOR of hashed vector ID +
+fingerprint pairs). Only partitions whose digests differ are drilled into,
+by re-reading just those rows, and the missing, stale and orphaned vectors
+found there are repaired in one bulk update.
+
+On the database side Postgres hashes every row, and each record's vector
+digest is cached against that hash, so only rows that changed since the
+last run are read in full and re-chunked. Delete the cache after changing
+how rows are turned into chunks.
+
+On the index side the vector IDs are listed from Pinecone and digested
+per partition, which catches lost and left-over vectors; content digests
+are compared against the upsert manifest, the ledger of writes Pinecone
+acknowledged, which catches rows changed since their last upsert. In the
+partitions that differ either way, the vectors themselves are fetched and
+their metadata compared, and the manifest is corrected from what the index
+holds. Set RECONCILE_VERIFY_INDEX=true to fetch and compare every vector,
+which also finds vectors changed in the index behind the manifest's back.
+"""
+
+import os
+import asyncio
+import sqlite3
+import hashlib
+import logging
+import threading
+from typing import AsyncIterator, Dict, Iterable, Iterator, List, Set, Tuple
+
+import asyncpg
+from dotenv import load_dotenv
+
+from chunk_prisma_data import convert_to_documents, chunk_documents
+from record_ids import RECORD_TABLES, vector_record_key
+from store_embeddings_pinecone import initialize_pinecone, prepare_vector, delete_vectors, PINECONE_INDEX_NAME
+from upsert_manifest import UpsertManifest, vector_fingerprint
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Configuration
+DATABASE_URL = os.getenv("DATABASE_URL")
+RECONCILE_PARTITIONS = int(os.getenv("RECONCILE_PARTITIONS", "256"))
+RECONCILE_FETCH_SIZE = int(os.getenv("RECONCILE_FETCH_SIZE", "1000"))
+# Vectors fetched per request when comparing the index's metadata
+RECONCILE_INDEX_FETCH_SIZE = int(os.getenv("RECONCILE_INDEX_FETCH_SIZE", "100"))
+RECONCILE_REPAIR = os.getenv("RECONCILE_REPAIR", "true").lower() == "true"
+RECONCILE_VERIFY_INDEX = os.getenv("RECONCILE_VERIFY_INDEX", "false").lower() == "true"
+RECONCILE_DIGEST_CACHE_PATH = os.getenv("RECONCILE_DIGEST_CACHE_PATH", "reconcile_digests.sqlite3")
+
+# SQLite limits the number of bound parameters per statement
+SQLITE_BATCH_SIZE = 500
+
+# Document source -> Prisma table
+SOURCE_TABLES = {source: table for table, (_, source, _) in RECORD_TABLES.items()}
+
+def partition_of(vector_id: str, partitions: int = RECONCILE_PARTITIONS) -> int:
+    """Partition of a vector: all chunks of a record share their record key's partition"""
+    key = vector_record_key(vector_id) or vector_id
+    # 28 bits of md5 so Postgres computes the same value (see partition_sql)
+    return int(hashlib.md5(key.encode("utf-8")).hexdigest()[:7], 16) % partitions
+
+def partition_sql(table: str) -> str:
+    """SQL expression for partition_of over a table's rows, given the partition count as $1"""
+    _, source, primary_key = RECORD_TABLES[table]
+    return f"""('x' || substr(md5('{source}:' || "{primary_key}"::text), 1, 7))::bit(28)::int % $1"""
+
+def expected_vectors(data: Dict) -> Iterator[Tuple[str, str, Dict]]:
+    """(vector_id, fingerprint, metadata) of every chunk the rows in data produce, as the upsert computes them"""
+    for chunk in chunk_documents(convert_to_documents(data)):
+        vector_id, metadata = prepare_vector({"content": chunk.page_content, "metadata": chunk.metadata})
+        yield vector_id, vector_fingerprint(chunk.page_content, metadata), metadata
+
+def index_fingerprint(metadata: Dict) -> str:
+    """Fingerprint of a vector's metadata as the index returns it
+
+    Pinecone returns every number as a float, so whole numbers are turned
+    back into ints; apply it to the expected metadata too before comparing.
+    """
+    normalised = {
+        key: int(value) if isinstance(value, float) and value.is_integer() else value
+        for key, value in (metadata or {}).items()
+    }
+    return vector_fingerprint(normalised.get("content", ""), normalised)
+
+def entry_digest(vector_id: str, fingerprint: str) -> int:
+    """128-bit hash of one (vector_id, fingerprint) pair"""
+    digest = hashlib.sha256(f"{vector_id}\0{fingerprint}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:16], "big")
+
+class PartitionDigests:
+    def __init__(self, partitions: int = RECONCILE_PARTITIONS):
+        """One XOR digest and vector count per partition; insertion order does not matter"""
+        self.partitions = partitions
+        self.digests = [0] * partitions
+        self.counts = [0] * partitions
+
+    def add(self, vector_id: str, fingerprint: str):
+        self.add_digest(partition_of(vector_id, self.partitions), entry_digest(vector_id, fingerprint), 1)
+
+    def add_digest(self, partition: int, digest: int, count: int):
+        """Fold in the combined digest of `count` entries of one partition"""
+        self.digests[partition] ^= digest
+        self.counts[partition] += count
+
+    def add_all(self, entries: Iterable[Tuple[str, str]]):
+        for vector_id, fingerprint in entries:
+            self.add(vector_id, fingerprint)
+
+    def differing(self, other: "PartitionDigests") -> List[int]:
+        """Partitions whose contents differ between the two sides"""
+        return [
+            partition for partition in range(self.partitions)
+            if self.digests[partition] != other.digests[partition]
+            or self.counts[partition] != other.counts[partition]
+        ]
+
+    def __len__(self) -> int:
+        return sum(self.counts)
+
+class RecordDigestCache:
+    def __init__(self, path: str = RECONCILE_DIGEST_CACHE_PATH):
+        """Open (or create) the cache of record key -> (row hash, vector digest, ID digest, vector count)"""
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            columns = {row[1] for row in self.conn.execute("PRAGMA table_info(record_digests)")}
+            if columns and "id_digest" not in columns:
+                # Written before ID digests were cached; it only costs one full re-chunk
+                self.conn.execute("DROP TABLE record_digests")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS record_digests ("
+                " record_key TEXT PRIMARY KEY,"
+                " row_hash TEXT NOT NULL,"
+                " digest TEXT NOT NULL,"
+                " id_digest TEXT NOT NULL,"
+                " vectors INTEGER NOT NULL"
+                ") WITHOUT ROWID"
+            )
+            self.conn.commit()
+
+    def all(self) -> Dict[str, Tuple[str, int, int, int]]:
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT record_key, row_hash, digest, id_digest, vectors FROM record_digests"
+            ).fetchall()
+        return {
+            key: (row_hash, int(digest, 16), int(id_digest, 16), vectors)
+            for key, row_hash, digest, id_digest, vectors in rows
+        }
+
+    def put(self, entries: Iterable[Tuple[str, str, int, int, int]]):
+        """Store (record key, row hash, vector digest, ID digest, vector count) entries"""
+        rows = [
+            (key, row_hash, format(digest, "x"), format(id_digest, "x"), vectors)
+            for key, row_hash, digest, id_digest, vectors in entries
+        ]
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO record_digests (record_key, row_hash, digest, id_digest, vectors) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            self.conn.commit()
+
+    def forget(self, keys: Iterable[str]):
+        """Drop the entries of records that no longer exist"""
+        keys = list(keys)
+        with self.lock:
+            for start in range(0, len(keys), SQLITE_BATCH_SIZE):
+                batch = keys[start:start + SQLITE_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                self.conn.execute(f"DELETE FROM record_digests WHERE record_key IN ({placeholders})", batch)
+            self.conn.commit()
+
+async def iter_table_batches(conn, table: str, partitions: List[int] = None,
+                             partition_count: int = RECONCILE_PARTITIONS) -> AsyncIterator[List[Dict]]:
+    """Stream a table's rows in batches through a server-side cursor, optionally only some partitions"""
+    if partitions is None:
+        query, args = f'SELECT * FROM "{table}"', []
+    else:
+        query = f'SELECT * FROM "{table}" WHERE {partition_sql(table)} = ANY($2::int[])'
+        args = [partition_count, partitions]
+    batch = []
+    async with conn.transaction():
+        async for row in conn.cursor(query, *args, prefetch=RECONCILE_FETCH_SIZE):
+            batch.append(dict(row))
+            if len(batch) >= RECONCILE_FETCH_SIZE:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+async def database_digests(conn, partition_count: int = RECONCILE_PARTITIONS,
+                           cache: RecordDigestCache = None) -> Tuple[PartitionDigests, PartitionDigests]:
+    """Digest what the index should contain, from every row in Postgres
+
+    Returns the digests of (vector ID, fingerprint) pairs and of vector IDs
+    alone. Only row hashes are read for every row; rows whose hash is not in
+    the cache are fetched and re-chunked, and their digests cached.
+    """
+    cache = cache or RecordDigestCache()
+    cached = cache.all()
+    seen: Set[str] = set()
+    digests = PartitionDigests(partition_count)
+    ids = PartitionDigests(partition_count)
+    rechunked = 0
+    for table, (data_key, source, primary_key) in RECORD_TABLES.items():
+        # record_id -> row hash of rows that changed since their digest was cached
+        changed: Dict[str, str] = {}
+        query = (
+            f'SELECT "{primary_key}"::text AS record_id, md5(t::text) AS row_hash, '
+            f'{partition_sql(table)} AS partition FROM "{table}" AS t'
+        )
+        async with conn.transaction():
+            async for row in conn.cursor(query, partition_count, prefetch=RECONCILE_FETCH_SIZE):
+                key = f"{source}:{row['record_id']}"
+                seen.add(key)
+                entry = cached.get(key)
+                if entry is not None and entry[0] == row["row_hash"]:
+                    digests.add_digest(row["partition"], entry[1], entry[3])
+                    ids.add_digest(row["partition"], entry[2], entry[3])
+                else:
+                    changed[row["record_id"]] = row["row_hash"]
+
+        record_ids = list(changed)
+        for start in range(0, len(record_ids), RECONCILE_FETCH_SIZE):
+            rows = await conn.fetch(
+                f'SELECT * FROM "{table}" WHERE "{primary_key}"::text = ANY($1::text[])',
+                record_ids[start:start + RECONCILE_FETCH_SIZE]
+            )
+            entries = []
+            for row in rows:
+                row = dict(row)
+                digest = 0
+                id_digest = 0
+                vectors = 0
+                for vector_id, fingerprint, _ in expected_vectors({data_key: [row]}):
+                    digests.add(vector_id, fingerprint)
+                    ids.add(vector_id, "")
+                    digest ^= entry_digest(vector_id, fingerprint)
+                    id_digest ^= entry_digest(vector_id, "")
+                    vectors += 1
+                record_id = str(row[primary_key])
+                entries.append((f"{source}:{record_id}", changed[record_id], digest, id_digest, vectors))
+            cache.put(entries)
+            rechunked += len(entries)
+
+    cache.forget(set(cached) - seen)
+    logger.info(f"Digested {len(seen)} records, {rechunked} of them changed since the last run and re-chunked")
+    return digests, ids
+
+def manifest_digests(manifest: UpsertManifest, partition_count: int = RECONCILE_PARTITIONS) -> PartitionDigests:
+    """Digest the (vector ID, fingerprint) pairs the manifest records as upserted"""
+    digests = PartitionDigests(partition_count)
+    digests.add_all(manifest.entries(PINECONE_INDEX_NAME))
+    return digests
+
+def list_index_ids(index) -> Set[str]:
+    """Every vector ID in the index (serverless list API)"""
+    listed: Set[str] = set()
+    for ids in index.list():
+        listed.update(ids)
+    return listed
+
+def index_id_digests(listed: Iterable[str], partition_count: int = RECONCILE_PARTITIONS) -> PartitionDigests:
+    """Digest the vector IDs listed from the index"""
+    digests = PartitionDigests(partition_count)
+    digests.add_all((vector_id, "") for vector_id in listed)
+    return digests
+
+def fetch_index_fingerprints(index, vector_ids: List[str]) -> Dict[str, str]:
+    """index_fingerprint() of each vector's metadata as stored in the index; vectors gone since listing are left out"""
+    fingerprints: Dict[str, str] = {}
+    for start in range(0, len(vector_ids), RECONCILE_INDEX_FETCH_SIZE):
+        response = index.fetch(ids=vector_ids[start:start + RECONCILE_INDEX_FETCH_SIZE])
+        for vector_id, vector in response.vectors.items():
+            fingerprints[vector_id] = index_fingerprint(vector.metadata)
+    return fingerprints
+
+async def drill_down(conn, index, manifest: UpsertManifest, listed: Set[str], partitions: List[int],
+                     partition_count: int = RECONCILE_PARTITIONS) -> Dict:
+    """Compare the differing partitions vector by vector against what the index holds
+
+    The manifest is corrected along the way: matching vectors are recorded
+    with their fingerprint, missing and stale ones are forgotten so the
+    repair upserts them, and orphaned ones are recorded so it deletes them.
+    """
+    wanted = set(partitions)
+    # vector_id -> (manifest fingerprint, index fingerprint)
+    expected: Dict[str, Tuple[str, str]] = {}
+    # record key -> (data key, row), for re-ingesting records that need repair
+    rows_by_record: Dict[str, Tuple[str, Dict]] = {}
+    for table, (data_key, _, _) in RECORD_TABLES.items():
+        async for rows in iter_table_batches(conn, table, partitions, partition_count):
+            for row in rows:
+                for vector_id, fingerprint, metadata in expected_vectors({data_key: [row]}):
+                    expected[vector_id] = (fingerprint, index_fingerprint(metadata))
+                    rows_by_record[vector_record_key(vector_id)] = (data_key, row)
+
+    in_partitions = [vector_id for vector_id in listed if partition_of(vector_id, partition_count) in wanted]
+    actual = await asyncio.to_thread(fetch_index_fingerprints, index, in_partitions)
+    missing = [vector_id for vector_id in expected if vector_id not in actual]
+    stale = [vector_id for vector_id in expected if vector_id in actual and actual[vector_id] != expected[vector_id][1]]
+    orphaned = [vector_id for vector_id in actual if vector_id not in expected]
+
+    manifest.mark_upserted(PINECONE_INDEX_NAME, [
+        (vector_id, fingerprint) for vector_id, (fingerprint, compared) in expected.items()
+        if actual.get(vector_id) == compared
+    ])
+    manifest.forget(PINECONE_INDEX_NAME, missing + stale)
+    manifest.mark_upserted(PINECONE_INDEX_NAME, [(vector_id, "") for vector_id in orphaned])
+    return {
+        "missing": missing,
+        "stale": stale,
+        "orphaned": orphaned,
+        "rows_by_record": rows_by_record
+    }
+
+async def repair(index, manifest: UpsertManifest, found: Dict) -> bool:
+    """Re-ingest records with missing or stale vectors and delete orphaned ones, in one update"""
+    # Imported here: update_rag loads the whole ingestion pipeline
+    from update_rag import process_rag_update
+
+    records = {vector_record_key(vector_id) for vector_id in found["missing"] + found["stale"]}
+    deleted = []
+    unkeyed = []
+    for vector_id in found["orphaned"]:
+        record = vector_record_key(vector_id)
+        if record is None:
+            unkeyed.append(vector_id)
+        elif record in found["rows_by_record"]:
+            # The record still exists but produces fewer chunks now
+            records.add(record)
+        else:
+            source, _, record_id = record.partition(":")
+            deleted.append({"table": SOURCE_TABLES[source], "record_id": record_id})
+
+    data: Dict[str, List] = {}
+    for record in records:
+        data_key, row = found["rows_by_record"][record]
+        data.setdefault(data_key, []).append(row)
+    if deleted:
+        data["deleted"] = deleted
+
+    # Content-hash IDs from before record keys have no row to re-ingest or delete
+    if unkeyed:
+        delete_vectors(index, manifest, unkeyed)
+        logger.info(f"Deleted {len(unkeyed)} orphaned content-hash vectors")
+
+    if not data:
+        return True
+    logger.info(f"Repairing {sum(len(rows) for rows in data.values())} records")
+    return await process_rag_update(data)
+
+async def reconcile(repair_index: bool = RECONCILE_REPAIR, verify_index: bool = RECONCILE_VERIFY_INDEX,
+                    partition_count: int = RECONCILE_PARTITIONS) -> Dict:
+    """Compare Postgres with the index and optionally repair it; returns a report"""
+    if not DATABASE_URL:
+        raise ValueError("DATABASE_URL not found in environment variables")
+    index = initialize_pinecone()
+    if not index:
+        raise RuntimeError("Failed to initialize Pinecone")
+    manifest = UpsertManifest()
+    listed = await asyncio.to_thread(list_index_ids, index)
+
+    conn = await asyncpg.connect(DATABASE_URL)
+    try:
+        expected, expected_ids = await database_digests(conn, partition_count)
+        recorded = manifest_digests(manifest, partition_count)
+        indexed = index_id_digests(listed, partition_count)
+
+        # Vectors lost from or left in the index change the ID digests; rows changed
+        # since their last upsert change the content digests against the manifest
+        if verify_index:
+            differing = list(range(partition_count))
+        else:
+            differing = sorted(set(expected_ids.differing(indexed)) | set(expected.differing(recorded)))
+        logger.info(
+            f"{len(differing)}/{partition_count} partitions to compare "
+            f"({len(expected)} expected vectors, {len(listed)} in the index, {len(recorded)} recorded)"
+        )
+        report = {
+            "partitions": partition_count,
+            "differing_partitions": len(differing),
+            "expected_vectors": len(expected),
+            "indexed_vectors": len(listed),
+            "recorded_vectors": len(recorded),
+            "missing": 0,
+            "stale": 0,
+            "orphaned": 0,
+            "repaired": False
+        }
+        if not differing:
+            return report
+
+        found = await drill_down(conn, index, manifest, listed, differing, partition_count)
+    finally:
+        await conn.close()
+
+    report.update(missing=len(found["missing"]), stale=len(found["stale"]), orphaned=len(found["orphaned"]))
+    logger.info(
+        f"Found {report['missing']} missing, {report['stale']} stale and {report['orphaned']} orphaned vectors"
+    )
+    if repair_index:
+        report["repaired"] = await repair(index, manifest, found)
+    return report
+
+if __name__ == "__main__":
+    # Set up logging for standalone execution
+    logging.basicConfig(level=logging.INFO)
+    logger = logging.getLogger(__name__)
+
+    logger.info("Reconciling Pinecone index with the Prisma database...")
+    report = asyncio.run(reconcile())
+    logger.info(f"Reconciliation report: {report}")
@@ -0,0 +1,64 @@
+"""
+Stable, record-keyed vector IDs.
+Every chunk of a database record gets the ID `source:primary_key:chunk_no`
+(e.g. `user:USR099:0`), so re-ingesting an updated record overwrites its
+vectors in place and a deleted record's vectors can be found by key.
+"""
+
+import hashlib
+from typing import Dict, Iterable, Optional
+
+# Prisma table -> (key in fetched data, document source, primary key column)
+RECORD_TABLES = {
+    "Hospital": ("hospitals", "hospital", "hospital_id"),
+    "Doctor": ("doctors", "doctor", "doctor_id"),
+    "User": ("users", "user", "user_id"),
+    "Interaction": ("interactions", "interaction", "id"),
+    "Report": ("reports", "report", "id"),
+    "SoapNote": ("soap_notes", "soap_note", "id")
+}
+
+# Document source -> metadata field convert_to_documents stores the primary key under
+SOURCE_KEY_FIELDS = {
+    "hospital": "hospital_id",
+    "doctor": "doctor_id",
+    "user": "user_id",
+    "interaction": "interaction_id",
+    "report": "report_id",
+    "soap_note": "soap_id"
+}
+
+def record_key(metadata: Dict) -> Optional[str]:
+    """`source:primary_key` for a chunk's record, or None for chunks without one"""
+    source = metadata.get("source")
+    field = SOURCE_KEY_FIELDS.get(source)
+    if not field or metadata.get(field) is None:
+        return None
+    return f"{source}:{metadata[field]}"
+
+def table_record_key(table: str, record_id) -> Optional[str]:
+    """`source:primary_key` for a row of a Prisma table"""
+    if table not in RECORD_TABLES:
+        return None
+    return f"{RECORD_TABLES[table][1]}:{record_id}"
+
+def vector_id(content: str, metadata: Dict) -> str:
+    """`source:primary_key:chunk_no`; chunks that are not tied to a record keep the content-hash ID"""
+    key = record_key(metadata)
+    if key is None:
+        return f"chunk_{hashlib.md5(content.encode('utf-8')).hexdigest()}"
+    return f"{key}:{metadata.get('chunk_no', 0)}"
+
+def assign_chunk_numbers(metadatas: Iterable[Dict]):
+    """Number each record's chunks 0, 1, ... in order, in their chunk_no metadata"""
+    counters: Dict[str, int] = {}
+    for metadata in metadatas:
+        key = record_key(metadata)
+        if key is not None:
+            metadata["chunk_no"] = counters.get(key, 0)
+            counters[key] = metadata["chunk_no"] + 1
+
+def vector_record_key(vector_id: str) -> Optional[str]:
+    """The `source:primary_key` a record-keyed vector ID belongs to, or None for content-hash IDs"""
+    key, separator, _ = vector_id.rpartition(":")
+    return key if separator else None
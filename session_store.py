@@ -0,0 +1,121 @@
+"""
+Per-session conversation history for the shared MedicalRAG instance.
+Sessions are kept in LRU order, expire after an idle period and are
+evicted oldest-first once the store exceeds a global memory cap.
+"""
+
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List
+from dotenv import load_dotenv
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Configuration
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "1000"))
+SESSION_MAX_TURNS = int(os.getenv("SESSION_MAX_TURNS", "10"))
+SESSION_IDLE_TTL = float(os.getenv("SESSION_IDLE_TTL", "1800"))
+SESSION_MAX_BYTES = int(os.getenv("SESSION_MAX_BYTES", str(16 * 1024 * 1024)))
+
+def _turn_size(turn: Dict[str, str]) -> int:
+    """Approximate memory used by one turn"""
+    return len(turn["query"].encode("utf-8")) + len(turn["response"].encode("utf-8"))
+
+class SessionHistoryStore:
+    def __init__(self, max_sessions: int = SESSION_MAX_SESSIONS, max_turns: int = SESSION_MAX_TURNS,
+                 idle_ttl: float = SESSION_IDLE_TTL, max_bytes: int = SESSION_MAX_BYTES):
+        """Initialize an empty store with session count, turn, idle and memory limits"""
+        self.max_sessions = max_sessions
+        self.max_turns = max_turns
+        self.idle_ttl = idle_ttl
+        self.max_bytes = max_bytes
+        # session_id -> {"turns": [...], "last_access": float, "bytes": int}
+        self.sessions: "OrderedDict[str, Dict]" = OrderedDict()
+        self.total_bytes = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def _drop(self, session_id: str):
+        session = self.sessions.pop(session_id)
+        self.total_bytes -= session["bytes"]
+        self.evictions += 1
+
+    def _expire_idle(self, now: float):
+        # Sessions are in LRU order, so expired ones are all at the front
+        while self.sessions:
+            session_id, session = next(iter(self.sessions.items()))
+            if now - session["last_access"] <= self.idle_ttl:
+                break
+            self._drop(session_id)
+
+    def get_turns(self, session_id: str, limit: int = 3) -> List[Dict[str, str]]:
+        """Return a copy of the most recent turns for a session"""
+        now = time.monotonic()
+        with self.lock:
+            self._expire_idle(now)
+            session = self.sessions.get(session_id)
+            if session is None:
+                return []
+            session["last_access"] = now
+            self.sessions.move_to_end(session_id)
+            return [dict(turn) for turn in session["turns"][-limit:]] if limit > 0 else []
+
+    def add_turn(self, session_id: str, query: str, response: str):
+        """Append a turn to a session, enforcing per-session and global limits"""
+        turn = {"query": query, "response": response}
+        size = _turn_size(turn)
+        now = time.monotonic()
+        with self.lock:
+            self._expire_idle(now)
+            session = self.sessions.get(session_id)
+            if session is None:
+                session = {"turns": [], "last_access": now, "bytes": 0}
+                self.sessions[session_id] = session
+
+            session["turns"].append(turn)
+            session["bytes"] += size
+            self.total_bytes += size
+            session["last_access"] = now
+            self.sessions.move_to_end(session_id)
+
+            # Keep only the last max_turns turns
+            while len(session["turns"]) > self.max_turns:
+                removed = _turn_size(session["turns"].pop(0))
+                session["bytes"] -= removed
+                self.total_bytes -= removed
+
+            # Evict least recently used sessions, never the one just written
+            while len(self.sessions) > self.max_sessions or (
+                    self.total_bytes > self.max_bytes and len(self.sessions) > 1):
+                oldest = next(iter(self.sessions))
+                if oldest == session_id:
+                    break
+                self._drop(oldest)
+
+            # A single oversized session gives up its oldest turns
+            while self.total_bytes > self.max_bytes and len(session["turns"]) > 1:
+                removed = _turn_size(session["turns"].pop(0))
+                session["bytes"] -= removed
+                self.total_bytes -= removed
+
+    def clear(self, session_id: str):
+        """Forget a session's history"""
+        with self.lock:
+            if session_id in self.sessions:
+                self._drop(session_id)
+
+    def stats(self) -> Dict[str, int]:
+        """Return the number of sessions, memory used and evictions"""
+        with self.lock:
+            return {
+                "sessions": len(self.sessions),
+                "bytes": self.total_bytes,
+                "evictions": self.evictions
+            }
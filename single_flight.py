@@ -0,0 +1,96 @@
+"""
+Single-flight request coalescing.
+Concurrent callers asking for the same key share one in-flight call instead
+of each starting their own upstream request.
+"""
+
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+class SingleFlight:
+    def __init__(self, name: str):
+        """Initialize an empty in-flight table; name is used in logs"""
+        self.name = name
+        self.in_flight: Dict[Hashable, Future] = {}
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.shared = 0
+
+    def do(self, key: Hashable, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run fn once per key at a time; concurrent callers wait for the same result"""
+        with self.lock:
+            future = self.in_flight.get(key)
+            if future is not None:
+                self.shared += 1
+                leader = False
+            else:
+                future = Future()
+                self.in_flight[key] = future
+                self.calls += 1
+                leader = True
+
+        if not leader:
+            logger.debug(f"Joining in-flight {self.name} call")
+            return future.result()
+
+        try:
+            result = fn(*args, **kwargs)
+            future.set_result(result)
+            return result
+        except BaseException as error:
+            future.set_exception(error)
+            raise
+        finally:
+            with self.lock:
+                del self.in_flight[key]
+
+    def stats(self) -> Dict[str, int]:
+        """Return upstream calls made and calls saved by coalescing"""
+        with self.lock:
+            return {
+                "upstream_calls": self.calls,
+                "coalesced": self.shared,
+                "in_flight": len(self.in_flight)
+            }
+
+class AsyncSingleFlight:
+    def __init__(self, name: str):
+        """Initialize an empty in-flight table for use on one event loop"""
+        self.name = name
+        self.in_flight: Dict[Hashable, asyncio.Future] = {}
+        self.calls = 0
+        self.shared = 0
+
+    async def do(self, key: Hashable, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """Await fn once per key at a time; concurrent callers await the same result"""
+        future = self.in_flight.get(key)
+        if future is not None:
+            self.shared += 1
+            logger.debug(f"Joining in-flight {self.name} call")
+            # shield so one cancelled waiter does not cancel the shared call
+            return await asyncio.shield(future)
+
+        future = asyncio.ensure_future(fn(*args, **kwargs))
+        self.in_flight[key] = future
+        self.calls += 1
+        try:
+            return await asyncio.shield(future)
+        finally:
+            if future.done():
+                self.in_flight.pop(key, None)
+            else:
+                future.add_done_callback(lambda _: self.in_flight.pop(key, None))
+
+    def stats(self) -> Dict[str, int]:
+        """Return upstream calls made and calls saved by coalescing"""
+        return {
+            "upstream_calls": self.calls,
+            "coalesced": self.shared,
+            "in_flight": len(self.in_flight)
+        }
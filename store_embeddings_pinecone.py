@@ -1,10 +1,14 @@
 import os
-import json
 import logging
 from dotenv import load_dotenv
 from pinecone import Pinecone, ServerlessSpec
 import time
-import hashlib
+import numpy as np
+from index_version import bump_index_version
+from embedding_log import iter_embeddings
+from upsert_manifest import UpsertManifest, vector_fingerprint
+from pinecone_upsert import UpsertEngine
+from record_ids import vector_id as record_vector_id
 
 # Set up logging
 logger = logging.getLogger(__name__)
@@ -14,6 +18,9 @@ load_dotenv()
 
 # Pinecone configuration
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
+PINECONE_INDEX_NAME = "medical-records"
+# Pinecone deletes at most 1000 IDs per request
+PINECONE_DELETE_BATCH_SIZE = 1000
 
 def clean_metadata(metadata):
     """Clean metadata to remove null values and ensure all values are valid for Pinecone"""
@@ -36,7 +43,7 @@ def initialize_pinecone():
         pc = Pinecone(api_key=PINECONE_API_KEY)
         
         # Define index name
-        index_name = "medical-records"
+        index_name = PINECONE_INDEX_NAME
         
         # Check if index exists
         existing_indexes = pc.list_indexes()
@@ -56,6 +63,8 @@ def initialize_pinecone():
             # Wait for index to be ready
             time.sleep(10)
             logger.info(f"Index {index_name} created successfully")
+            # Nothing recorded for an earlier index of this name is in the new one
+            UpsertManifest().clear(index_name)
         else:
             logger.info(f"Index {index_name} already exists")
         
@@ -67,8 +76,82 @@ def initialize_pinecone():
         logger.error(f"Error initializing Pinecone: {error}")
         return None
 
+def prepare_vector(item):
+    """Build the Pinecone record for an embedded chunk, without its values"""
+    # Record-keyed ID (source:primary_key:chunk_no), so an updated record overwrites its vectors
+    vector_id = record_vector_id(item["content"], item["metadata"])
+    
+    # Extract content and metadata
+    content = item["content"]
+    metadata = dict(item["metadata"])
+    
+    # Add content to metadata for retrieval
+    metadata["content"] = content
+    
+    # Clean metadata to remove null values
+    cleaned_metadata = clean_metadata(metadata)
+    return vector_id, cleaned_metadata
+
+def submit_changed(engine, manifest, items, seen):
+    """Queue the items that are new or changed since the last upsert; returns the number skipped"""
+    prepared = []
+    for item in items:
+        vector_id, metadata = prepare_vector(item)
+        seen.add(vector_id)
+        prepared.append((item, vector_id, metadata, vector_fingerprint(item["content"], metadata)))
+    
+    previous = manifest.upserted(PINECONE_INDEX_NAME, [vector_id for _, vector_id, _, _ in prepared])
+    skipped = 0
+    for item, vector_id, metadata, fingerprint in prepared:
+        if previous.get(vector_id) == fingerprint:
+            skipped += 1
+            continue
+        engine.submit({
+            "id": vector_id,
+            # Binary-store rows are float32/float16 views; Pinecone takes plain floats
+            "values": np.asarray(item["embedding"], dtype=np.float32).tolist(),
+            "metadata": metadata
+        }, tag=(vector_id, fingerprint))
+    return skipped
+
+def delete_vectors(index, manifest, vector_ids):
+    """Delete vectors from the index and the manifest, in batches Pinecone accepts"""
+    vector_ids = sorted(vector_ids)
+    for start in range(0, len(vector_ids), PINECONE_DELETE_BATCH_SIZE):
+        batch = vector_ids[start:start + PINECONE_DELETE_BATCH_SIZE]
+        index.delete(ids=batch)
+        manifest.forget(PINECONE_INDEX_NAME, batch)
+    return len(vector_ids)
+
+def delete_legacy_vectors(index, manifest, live_ids):
+    """Delete chunk_<md5> vectors left from before record-keyed IDs; returns how many
+
+    The manifest of an index populated before the switch may not list them,
+    so they are found with the index's list API instead. Once they are gone
+    this is a single empty list request.
+    """
+    try:
+        listed = [vector_id for ids in index.list(prefix="chunk_") for vector_id in ids]
+    except Exception as error:
+        # Pod-based indexes have no list API
+        logger.warning(f"Could not list legacy content-hash vectors: {error}")
+        return 0
+    # Chunks without a source record still use content-hash IDs
+    legacy = set(listed) - live_ids
+    deleted = delete_vectors(index, manifest, legacy)
+    if deleted:
+        logger.info(f"Deleted {deleted} legacy content-hash vectors")
+    return deleted
+
+def delete_orphaned_vectors(index, manifest, live_ids):
+    """Delete upserted vectors that are no longer in the embedding store; returns how many"""
+    deleted = delete_vectors(index, manifest, manifest.vector_ids(PINECONE_INDEX_NAME) - live_ids)
+    if deleted:
+        logger.info(f"Deleted {deleted} vectors of deleted records or dropped chunks")
+    return deleted + delete_legacy_vectors(index, manifest, live_ids)
+
 def store_embeddings_in_pinecone():
-    """Store embeddings in Pinecone database"""
+    """Store new or changed embeddings in Pinecone database"""
     try:
         # Initialize Pinecone
         logger.info("Initializing Pinecone...")
@@ -77,47 +160,38 @@ def store_embeddings_in_pinecone():
             logger.error("Failed to initialize Pinecone")
             return False
         
-        # Load embedded data
+        # Stream embedded data, including records still in the checkpoint log
         logger.info("Loading embedded data...")
-        with open("embedded_prisma_data.json", "r", encoding="utf-8") as f:
-            embedded_data = json.load(f)
+        manifest = UpsertManifest()
+        skipped = 0
+        batch = []
+        seen = set()
+        # Vectors are only recorded in the manifest once Pinecone has accepted them
+        with UpsertEngine(index, on_success=lambda entries: manifest.mark_upserted(PINECONE_INDEX_NAME, entries)) as engine:
+            for item in iter_embeddings():
+                batch.append(item)
+                # Check the manifest 100 records at a time
+                if len(batch) >= 100:
+                    skipped += submit_changed(engine, manifest, batch, seen)
+                    batch = []
+            if batch:
+                skipped += submit_changed(engine, manifest, batch, seen)
+        stats = engine.close()
+        
+        logger.info(f"Upserted {stats.vectors} new or changed vectors, skipped {skipped} unchanged vectors")
         
-        logger.info(f"Found {len(embedded_data)} embeddings to store")
+        # Keep the index the size of the live data: vectors of deleted records and chunks a
+        # shorter update no longer produces are removed (never on an empty store, which is
+        # far more likely a missing file than an empty database)
+        deleted = delete_orphaned_vectors(index, manifest, seen) if seen else 0
         
-        # Prepare vectors for upsert
-        vectors = []
-        for i, item in enumerate(embedded_data):
-            # Create a unique ID for each vector based on content hash
-            content_hash = hashlib.md5(item["content"].encode('utf-8')).hexdigest()
-            vector_id = f"chunk_{content_hash}"
-            
-            # Extract content and metadata
-            content = item["content"]
-            metadata = item["metadata"]
-            
-            # Add content to metadata for retrieval
-            metadata["content"] = content
-            
-            # Clean metadata to remove null values
-            cleaned_metadata = clean_metadata(metadata)
-            
-            # Create vector record
-            vector_record = {
-                "id": vector_id,
-                "values": item["embedding"],
-                "metadata": cleaned_metadata
-            }
-            
-            vectors.append(vector_record)
-            
-            # Upsert in batches of 100 (Pinecone's recommended batch size)
-            if len(vectors) >= 100 or i == len(embedded_data) - 1:
-                logger.info(f"Upserting batch of {len(vectors)} vectors...")
-                index.upsert(vectors=vectors)
-                logger.info(f"Successfully upserted batch of {len(vectors)} vectors")
-                vectors = []  # Reset for next batch
+        # Invalidate answers derived from the previous index contents
+        if stats.vectors or deleted:
+            bump_index_version()
         
-        logger.info("All embeddings stored in Pinecone successfully!")
+        if stats.failed:
+            logger.error(f"{stats.failed} vectors could not be upserted and will be retried on the next run")
+            return False
         return True
         
     except Exception as error:
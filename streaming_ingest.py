@@ -0,0 +1,203 @@
+"""
+Streaming full refresh.
+Rows are read from Postgres page by page and flow through conversion,
+chunking, embedding and upsert as an asyncio pipeline. The stages are
+joined by bounded queues, so a slow stage holds back the ones before it
+and peak memory depends on the batch size and queue depth rather than on
+the size of the tables.
+"""
+
+import os
+import json
+import asyncio
+import logging
+import itertools
+from typing import Dict, List
+from dotenv import load_dotenv
+
+from chunk_prisma_data import (
+    stream_prisma_data, convert_to_documents, chunk_documents, STREAM_BATCH_SIZE, CHUNKED_DATA_PATH
+)
+from generate_embeddings import iter_embedding_batches
+from embedding_log import EmbeddingCheckpointLog, replay_log, iter_embeddings, write_snapshot
+from store_embeddings_pinecone import initialize_pinecone, submit_changed, delete_orphaned_vectors, PINECONE_INDEX_NAME
+from upsert_manifest import UpsertManifest
+from pinecone_upsert import UpsertEngine
+from index_version import bump_index_version
+from lexical_index import lexical_index
+from record_ids import vector_id
+from ingest_lock import ingest_lock
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Configuration
+STREAM_QUEUE_SIZE = int(os.getenv("STREAM_QUEUE_SIZE", "4"))
+
+# Marks the end of a stage's output
+_DONE = object()
+
+async def _produce(rows_queue: asyncio.Queue, batch_size: int):
+    async for data in stream_prisma_data(batch_size):
+        await rows_queue.put(data)
+    await rows_queue.put(_DONE)
+
+async def _chunk(rows_queue: asyncio.Queue, chunks_queue: asyncio.Queue, chunk_file):
+    while True:
+        data = await rows_queue.get()
+        if data is _DONE:
+            break
+        chunks = [
+            {"content": chunk.page_content, "metadata": chunk.metadata}
+            for chunk in chunk_documents(convert_to_documents(data))
+        ]
+        for chunk in chunks:
+            chunk_file.write(chunk)
+        await chunks_queue.put(chunks)
+    await chunks_queue.put(_DONE)
+
+def _embed_batch(chunks: List[Dict]) -> List[Dict]:
+    texts = [chunk["content"] for chunk in chunks]
+    records = []
+    for positions, embeddings in iter_embedding_batches(texts):
+        for i, embedding in zip(positions, embeddings):
+            records.append(dict(chunks[i], embedding=embedding))
+    return records
+
+async def _embed(chunks_queue: asyncio.Queue, records_queue: asyncio.Queue, checkpoint_log, stats: Dict):
+    while True:
+        chunks = await chunks_queue.get()
+        if chunks is _DONE:
+            break
+        # The embedding cache answers unchanged chunks without an API call
+        records = await asyncio.to_thread(_embed_batch, chunks)
+        embedded = []
+        for record in records:
+            if record["embedding"] is None:
+                stats["failed"] += 1
+                # Keep the old vector and embedding until a later run embeds this chunk
+                stats["seen"].add(vector_id(record["content"], record["metadata"]))
+                stats["failed_ids"].add(vector_id(record["content"], record["metadata"]))
+                continue
+            checkpoint_log.append(record)
+            embedded.append(record)
+        await records_queue.put(embedded)
+    await records_queue.put(_DONE)
+
+async def _upsert(records_queue: asyncio.Queue, engine: UpsertEngine, manifest: UpsertManifest, stats: Dict):
+    while True:
+        records = await records_queue.get()
+        if records is _DONE:
+            break
+        # submit() blocks while the upsert workers are busy
+        stats["skipped"] += await asyncio.to_thread(submit_changed, engine, manifest, records, stats["seen"])
+
+class _ChunkFileWriter:
+    """Streams chunks into a JSON array file, one chunk per line"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file = open(path, "w", encoding="utf-8")
+        self.file.write("[\n")
+        self.count = 0
+
+    def write(self, chunk: Dict):
+        if self.count:
+            self.file.write(",\n")
+        self.file.write(json.dumps(chunk, separators=(",", ":"), default=str))
+        self.count += 1
+
+    def close(self):
+        self.file.write("\n]\n")
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+
+def _swap_in(index, manifest: UpsertManifest, chunk_path: str, log_path: str, stats: Dict, upsert_stats) -> int:
+    """Swap in the rebuilt corpus and embeddings and delete orphaned vectors; returns the embeddings written"""
+    os.replace(chunk_path, CHUNKED_DATA_PATH)
+    # Chunks that failed to embed keep their previous embedding, like their vector in the index
+    carried = (
+        record for record in iter_embeddings()
+        if vector_id(record["content"], record["metadata"]) in stats["failed_ids"]
+    ) if stats["failed_ids"] else ()
+    count = write_snapshot(itertools.chain(replay_log(log_path), carried))
+    os.remove(log_path)
+
+    deleted = delete_orphaned_vectors(index, manifest, stats["seen"]) if stats["seen"] else 0
+    if upsert_stats.vectors or deleted:
+        bump_index_version()
+
+    lexical_index.reload(CHUNKED_DATA_PATH)
+    return count
+
+async def stream_full_refresh(batch_size: int = STREAM_BATCH_SIZE, queue_size: int = STREAM_QUEUE_SIZE) -> bool:
+    """Re-ingest the whole database as a bounded-memory pipeline; returns True on success
+
+    The chunk file and embedding snapshot are rebuilt next to the live ones and
+    swapped in at the end; vectors of rows that no longer exist are deleted.
+    Only the set of vector IDs seen (for that orphan check) grows with the corpus.
+    Runs one at a time with incremental updates (see ingest_lock).
+    """
+    async with ingest_lock():
+        return await _stream_full_refresh(batch_size, queue_size)
+
+async def _stream_full_refresh(batch_size: int, queue_size: int) -> bool:
+    index = await asyncio.to_thread(initialize_pinecone)
+    if not index:
+        logger.error("Failed to initialize Pinecone")
+        return False
+    manifest = UpsertManifest()
+
+    rows_queue = asyncio.Queue(maxsize=queue_size)
+    chunks_queue = asyncio.Queue(maxsize=queue_size)
+    records_queue = asyncio.Queue(maxsize=queue_size)
+    stats = {"failed": 0, "skipped": 0, "seen": set(), "failed_ids": set()}
+
+    chunk_path = f"{CHUNKED_DATA_PATH}.refresh"
+    log_path = f"{CHUNKED_DATA_PATH}.refresh.log"
+    if os.path.exists(log_path):
+        os.remove(log_path)
+    chunk_file = _ChunkFileWriter(chunk_path)
+    engine = UpsertEngine(index, on_success=lambda entries: manifest.mark_upserted(PINECONE_INDEX_NAME, entries))
+    try:
+        with EmbeddingCheckpointLog(log_path) as checkpoint_log:
+            tasks = [
+                asyncio.create_task(_produce(rows_queue, batch_size)),
+                asyncio.create_task(_chunk(rows_queue, chunks_queue, chunk_file)),
+                asyncio.create_task(_embed(chunks_queue, records_queue, checkpoint_log, stats)),
+                asyncio.create_task(_upsert(records_queue, engine, manifest, stats))
+            ]
+            try:
+                await asyncio.gather(*tasks)
+            except Exception:
+                # One failed stage would leave the others blocked on their queues
+                for task in tasks:
+                    task.cancel()
+                raise
+        chunk_file.close()
+        upsert_stats = await asyncio.to_thread(engine.close)
+    except Exception as error:
+        logger.error(f"Streaming refresh failed: {error}")
+        await asyncio.to_thread(engine.executor.shutdown, wait=True)
+        if not chunk_file.file.closed:
+            chunk_file.file.close()
+        for path in (chunk_path, log_path):
+            if os.path.exists(path):
+                os.remove(path)
+        return False
+
+    # The swap rewrites whole files and calls Pinecone, so it runs off the event loop
+    count = await asyncio.to_thread(_swap_in, index, manifest, chunk_path, log_path, stats, upsert_stats)
+    logger.info(f"Streamed {chunk_file.count} chunks, {count} embedded; {stats['skipped']} vectors unchanged")
+
+    if stats["failed"] or upsert_stats.failed:
+        logger.error(
+            f"{stats['failed']} chunks could not be embedded and {upsert_stats.failed} vectors could not be "
+            f"upserted; they will be retried on the next run"
+        )
+        return False
+    return True
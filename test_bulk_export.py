@@ -0,0 +1,29 @@
+from datetime import datetime, timezone
+
+from bulk_export import parse_timestamp
+
+def test_parse_timestamp():
+    """Test COPY text timestamps parse to the datetimes asyncpg would return"""
+    cases = {
+        "2025-11-14 12:00:00": datetime(2025, 11, 14, 12, 0, 0),
+        "2025-11-14 12:00:00.5": datetime(2025, 11, 14, 12, 0, 0, 500000),
+        "2025-11-14 12:00:00.123456": datetime(2025, 11, 14, 12, 0, 0, 123456),
+        "2025-11-14 12:00:00+00": datetime(2025, 11, 14, 12, 0, 0, tzinfo=timezone.utc),
+        "2025-11-14 17:30:00.25+05:30": datetime(2025, 11, 14, 12, 0, 0, 250000, tzinfo=timezone.utc),
+        "2025-11-14 07:00:00-05": datetime(2025, 11, 14, 12, 0, 0, tzinfo=timezone.utc)
+    }
+    for text, expected in cases.items():
+        parsed = parse_timestamp(text)
+        print(f"{text} -> {parsed!r}")
+        assert parsed == expected
+        assert (parsed.tzinfo is None) == (expected.tzinfo is None)
+
+    try:
+        parse_timestamp("14/11/2025")
+    except ValueError as e:
+        print(f"Rejected: {e}")
+    else:
+        raise AssertionError("Expected a ValueError for an unrecognised timestamp")
+
+if __name__ == "__main__":
+    test_parse_timestamp()
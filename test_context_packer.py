@@ -0,0 +1,43 @@
+from context_packer import ContextPacker, estimate_tokens
+
+def _doc(content, source="user", score=0.9):
+    return {"metadata": {"content": content, "source": source}, "score": score}
+
+def test_context_packer():
+    """Test near-duplicates are dropped and the context stays within the token budget"""
+    record = (
+        "Patient Information:\n"
+        "ID: USR099\n"
+        "Name: Rahul Verma\n"
+        "Transcript: Patient has mild throat pain and cough. Prescribed rest and fluids.\n"
+        "Audio URL: https://example.com/audio/99\n"
+        "Created: 2025-11-14T12:00:00Z"
+    )
+    other = (
+        "Patient Information:\n"
+        "ID: USR003\n"
+        "Name: Robert Johnson\n"
+        "Transcript: Patient has been experiencing chest pain after exercise."
+    )
+    packer = ContextPacker(token_budget=200)
+    packed = packer.pack([_doc(record), _doc(record + " "), _doc(other, score=0.5)], "throat pain")
+
+    print(f"Packed context ({packed.tokens} tokens):\n{packed.text}")
+    assert packed.documents_used == 2
+    assert packed.documents_dropped == 1
+    assert packed.tokens <= 200
+    assert "ID: USR099" in packed.text and "ID: USR003" in packed.text
+    # Audio URLs are left out unless the query asks for them
+    assert "https://example.com/audio/99" not in packed.text
+    assert "https://example.com/audio/99" in packer.pack([_doc(record)], "audio url").text
+
+    # A tight budget keeps the identifying fields before the transcript
+    tight = ContextPacker(token_budget=40).pack([_doc(record)], "weight")
+    print(f"Tight context:\n{tight.text}")
+    assert "ID: USR099" in tight.text
+    assert tight.tokens <= 40 + estimate_tokens("Relevance Score: 0.9000")
+
+    assert packer.stats()["requests"] == 2
+
+if __name__ == "__main__":
+    test_context_packer()
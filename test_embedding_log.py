@@ -0,0 +1,45 @@
+from embedding_log import EmbeddingCheckpointLog, replay_log, iter_embeddings, compact
+from testing_support import embedded_chunk, scratch_paths
+
+def test_embedding_log_replay():
+    """Test a torn last line from a crash is skipped and later records start on a fresh line"""
+    with scratch_paths("embedded_prisma_data.log") as (log_path,):
+        with EmbeddingCheckpointLog(log_path) as log:
+            log.append(embedded_chunk("USR001", "Patient has a cough", [1.0, 2.0]))
+            log.append(embedded_chunk("USR002", "Patient has a fever", [2.0, 3.0]))
+        with open(log_path, "a", encoding="utf-8") as f:
+            f.write('{"content": "Patient has')
+        print(f"Replayed {len(list(replay_log(log_path)))} records from the log")
+        assert len(list(replay_log(log_path))) == 2
+
+        with EmbeddingCheckpointLog(log_path) as log:
+            log.append(embedded_chunk("USR003", "Patient has a rash", [3.0, 4.0]))
+        assert [record["metadata"]["user_id"] for record in replay_log(log_path)] == ["USR001", "USR002", "USR003"]
+
+def test_embedding_log_compaction():
+    """Test compaction folds the log into the snapshot, skipping records repeated after a crash"""
+    names = ("embedded_prisma_data.json", "embedded_prisma_data.log", "embedded_prisma_data.meta.jsonl")
+    with scratch_paths(*names) as (snapshot_path, log_path, sidecar_path):
+        with EmbeddingCheckpointLog(log_path) as log:
+            log.append(embedded_chunk("USR001", "Patient has a cough", [1.0, 2.0]))
+        assert compact(snapshot_path, log_path, sidecar_path, store_format="json") == 1
+
+        # A crash between compaction and log removal repeats the record in the log
+        with EmbeddingCheckpointLog(log_path) as log:
+            log.append(embedded_chunk("USR001", "Patient has a cough", [1.0, 2.0]))
+            log.append(embedded_chunk("USR001", "Follow-up in two weeks", [4.0, 5.0], chunk_no=1))
+        count = compact(snapshot_path, log_path, sidecar_path, store_format="json")
+        print(f"Compacted {count} records into {snapshot_path}")
+        assert count == 2
+        records = list(iter_embeddings(snapshot_path, log_path, sidecar_path))
+        assert [record["metadata"]["chunk_no"] for record in records] == [0, 1]
+
+        # keep drops superseded records; nothing to fold in returns None unless forced
+        assert compact(snapshot_path, log_path, sidecar_path, store_format="json") is None
+        count = compact(snapshot_path, log_path, sidecar_path, store_format="json",
+                        keep=lambda record: record["metadata"]["chunk_no"] == 1, force=True)
+        assert count == 1
+
+if __name__ == "__main__":
+    test_embedding_log_replay()
+    test_embedding_log_compaction()
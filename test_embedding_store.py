@@ -0,0 +1,44 @@
+import os
+
+import numpy as np
+
+from embedding_log import EmbeddingCheckpointLog, iter_embeddings, compact
+from embedding_store import BinaryEmbeddingStore, sidecar_path_for
+from testing_support import embedded_chunk, scratch_paths
+
+def test_binary_embedding_store():
+    """Test compaction into the memory-mapped matrix, replacing the previous matrix and the JSON snapshot"""
+    names = ("embedded_prisma_data.json", "embedded_prisma_data.log", "embedded_prisma_data.meta.jsonl")
+    with scratch_paths(*names) as (snapshot_path, log_path, sidecar_path):
+        assert sidecar_path_for(snapshot_path) == sidecar_path
+
+        # A JSON snapshot is migrated on the first compaction
+        with EmbeddingCheckpointLog(log_path) as log:
+            log.append(embedded_chunk("USR001", "Patient has a cough", [1.0, 2.0, 3.0]))
+        compact(snapshot_path, log_path, sidecar_path, store_format="json")
+        with EmbeddingCheckpointLog(log_path) as log:
+            log.append(embedded_chunk("USR002", "Patient has a fever", [2.0, 3.0, 4.0]))
+        count = compact(snapshot_path, log_path, sidecar_path, store_format="binary")
+        print(f"Compacted {count} records into {sidecar_path}")
+        assert count == 2
+        assert not os.path.exists(snapshot_path) and not os.path.exists(log_path)
+
+        store = BinaryEmbeddingStore(sidecar_path)
+        header = store.header()
+        print(f"Sidecar header: {header}")
+        assert len(store) == 2
+        matrix = store.open()
+        assert matrix.dtype == np.float32 and matrix.shape == (2, 3)
+        records = list(iter_embeddings(snapshot_path, log_path, sidecar_path))
+        assert [record["metadata"]["user_id"] for record in records] == ["USR001", "USR002"]
+        assert np.allclose(records[1]["embedding"], [2.0, 3.0, 4.0])
+
+        # Rewriting the store removes the old matrix
+        count = compact(snapshot_path, log_path, sidecar_path, store_format="binary",
+                        keep=lambda record: record["metadata"]["user_id"] != "USR001", force=True)
+        assert count == 1
+        assert not os.path.exists(os.path.join(os.path.dirname(sidecar_path), header["matrix"]))
+        assert [record["metadata"]["user_id"] for record in iter_embeddings(snapshot_path, log_path, sidecar_path)] == ["USR002"]
+
+if __name__ == "__main__":
+    test_binary_embedding_store()
@@ -1,16 +1,25 @@
 import os
 import json
 
+from embedding_log import EMBEDDINGS_SNAPSHOT_PATH, EMBEDDING_LOG_PATH
+from embedding_store import BinaryEmbeddingStore, EMBEDDING_SIDECAR_PATH, EMBEDDING_STORE_FORMAT
+
 def test_file_paths():
     """Test file paths and working directory"""
     print(f"Current working directory: {os.getcwd()}")
     print(f"Files in current directory: {os.listdir('.')}")
-    
-    # Check if the file exists
-    file_path = "embedded_prisma_data.json"
-    print(f"Does {file_path} exist? {os.path.exists(file_path)}")
-    
-    # Try to create a test file
+
+    # Check which embedding files exist; the binary store replaces the JSON snapshot
+    print(f"Embedding store format: {EMBEDDING_STORE_FORMAT}")
+    for path in (EMBEDDINGS_SNAPSHOT_PATH, EMBEDDING_SIDECAR_PATH, EMBEDDING_LOG_PATH):
+        print(f"Does {path} exist? {os.path.exists(path)}")
+    header = BinaryEmbeddingStore(EMBEDDING_SIDECAR_PATH).header()
+    if header:
+        matrix_path = os.path.join(os.path.dirname(os.path.abspath(EMBEDDING_SIDECAR_PATH)), header["matrix"])
+        print(f"Binary store: {header['rows']} rows in {matrix_path}, exists? {os.path.exists(matrix_path)}")
+
+    # Try to create a test file next to the embeddings without touching them
+    file_path = os.path.join(os.path.dirname(os.path.abspath(EMBEDDINGS_SNAPSHOT_PATH)), "file_paths_test.json")
     test_data = [{"test": "data"}]
     try:
         with open(file_path, "w", encoding="utf-8") as f:
@@ -18,17 +27,18 @@ def test_file_paths():
         print(f"Successfully created {file_path}")
     except Exception as e:
         print(f"Error creating {file_path}: {e}")
-    
+
     # Try to read it back
     try:
         if os.path.exists(file_path):
             with open(file_path, "r", encoding="utf-8") as f:
                 data = json.load(f)
             print(f"Successfully read {file_path}: {data}")
+            os.remove(file_path)
         else:
             print(f"{file_path} does not exist after creation attempt")
     except Exception as e:
         print(f"Error reading {file_path}: {e}")
 
 if __name__ == "__main__":
-    test_file_paths()
\ No newline at end of file
+    test_file_paths()
@@ -0,0 +1,65 @@
+import time
+
+from key_pool import ApiKeyPool, NoKeyAvailable
+
+class _Response:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+    def close(self):
+        pass
+
+def test_token_bucket():
+    """Test each key allows its burst, then refills at the configured rate"""
+    pool = ApiKeyPool(["key-one"], rate=20.0, burst=2)
+    for _ in range(2):
+        pool.release(pool.acquire(timeout=0), 200)
+    try:
+        pool.acquire(timeout=0)
+    except NoKeyAvailable as e:
+        print(f"Bucket empty: {e}")
+    else:
+        raise AssertionError("Expected the bucket to be empty after the burst")
+
+    # One token comes back after 1 / rate seconds, and acquire waits for it
+    started = time.monotonic()
+    pool.release(pool.acquire(timeout=1), 200)
+    waited = time.monotonic() - started
+    print(f"Waited {waited:.3f}s for a token")
+    assert 0.02 <= waited < 0.5
+
+    # Without a timeout acquire waits as long as it takes
+    pool.release(pool.acquire(timeout=None), 200)
+
+def test_key_rotation():
+    """Test requests spread over keys, skip keys cooling down after a 429 and retry on another key"""
+    pool = ApiKeyPool(["key-one", "key-two", "key-three"], rate=100.0, burst=5)
+
+    # The least-loaded key is chosen, so concurrent requests use different keys
+    held = [pool.acquire(timeout=0) for _ in range(3)]
+    print(f"Concurrent requests went to {held}")
+    assert sorted(held) == ["key-one", "key-three", "key-two"]
+
+    # A throttled key cools down for Retry-After and is skipped meanwhile
+    for api_key in held:
+        pool.release(api_key, 429 if api_key == "key-one" else 200, retry_after=60)
+    assert all(pool.acquire(timeout=0) != "key-one" for _ in range(4))
+    assert [stats["cooling_down"] for stats in pool.stats()] == [True, False, False]
+
+    # request() retries a 429 on a different key
+    pool = ApiKeyPool(["key-one", "key-two"], rate=100.0, burst=5)
+    used = []
+
+    def send(api_key):
+        used.append(api_key)
+        return _Response(429, {"Retry-After": "30"}) if len(used) == 1 else _Response(200)
+
+    assert pool.request(send).status_code == 200
+    print(f"Keys used: {used}")
+    assert len(used) == 2 and used[0] != used[1]
+    assert sum(stats["in_flight"] for stats in pool.stats()) == 0
+
+if __name__ == "__main__":
+    test_token_bucket()
+    test_key_rotation()
@@ -0,0 +1,62 @@
+from lexical_index import BM25Index, reciprocal_rank_fusion, is_lexical_query
+from testing_support import patient_chunk
+
+def test_bm25_index():
+    """Test BM25 ranking, record replacement and removal"""
+    index = BM25Index()
+    added = index.add_documents([
+        patient_chunk("USR099", "Rahul Verma", "Patient has mild throat pain and cough"),
+        patient_chunk("USR003", "Robert Johnson", "Patient has been experiencing chest pain after exercise"),
+        patient_chunk("USR004", "Asha Nair", "Routine checkup, no complaints")
+    ])
+    assert added == 3
+
+    results = index.search("USR003 chest pain")
+    print(f"BM25 results: {[(result['id'], round(result['score'], 3)) for result in results]}")
+    assert results[0]["id"] == "user:USR003:0"
+    assert all(result["id"] != "user:USR004:0" for result in results)
+    assert [result["id"] for result in index.search("pain", metadata_filter={"user_id": ["USR099"]})] == ["user:USR099:0"]
+
+    # Re-adding a record under the same ID replaces its terms
+    index.add_documents([patient_chunk("USR099", "Rahul Verma", "Patient reports a fever")])
+    assert len(index) == 3
+    assert [result["id"] for result in index.search("fever")] == ["user:USR099:0"]
+    assert all(result["id"] != "user:USR099:0" for result in index.search("throat"))
+
+    assert index.remove_records({"user:USR003"}) == 1
+    assert index.search("chest") == []
+
+def test_reciprocal_rank_fusion():
+    """Test documents ranked well by both lists come first"""
+    vector_results = [{"id": "a", "metadata": {}}, {"id": "b", "metadata": {}}, {"id": "c", "metadata": {}}]
+    lexical_results = [{"id": "b", "metadata": {}}, {"id": "d", "metadata": {}}]
+    fused = reciprocal_rank_fusion([vector_results, lexical_results], top_k=3, k=60)
+    print(f"Fused ranking: {[(entry['id'], round(entry['score'], 4)) for entry in fused]}")
+    assert [entry["id"] for entry in fused] == ["b", "a", "d"]
+    assert abs(fused[0]["score"] - (1 / 62 + 1 / 61)) < 1e-12
+
+def test_is_lexical_query():
+    """Test only ID, phone and known-name lookups are routed to the lexical index"""
+    index = BM25Index()
+    index.add_documents([patient_chunk("USR099", "Rahul Verma", "Patient has mild throat pain")])
+    cases = {
+        "USR099": True,
+        "Show the record for USR099": True,
+        "Patient with mobile 9123456780": True,
+        "Rahul Verma": True,
+        "Who is Rahul Verma?": True,
+        "Robert Johnson": False,
+        "Hypertension": False,
+        "Diabetes Treatment": False,
+        "Which patients have throat pain?": False
+    }
+    for query, expected in cases.items():
+        print(f"{query!r}: {is_lexical_query(query, index)}")
+        assert is_lexical_query(query, index) == expected
+    # Without an index names cannot be confirmed
+    assert not is_lexical_query("Rahul Verma")
+
+if __name__ == "__main__":
+    test_bm25_index()
+    test_reciprocal_rank_fusion()
+    test_is_lexical_query()
@@ -0,0 +1,56 @@
+import numpy as np
+
+from embedding_log import write_json_array
+from local_vector_store import LocalVectorStore
+from testing_support import embedded_chunk, scratch_paths
+
+def _store(records):
+    with scratch_paths("embedded_prisma_data.json", "embedded_prisma_data.meta.jsonl") as (snapshot_path, sidecar_path):
+        write_json_array(records, snapshot_path)
+        store = LocalVectorStore(snapshot_path, sidecar_path)
+        loaded = store.load()
+    return store, loaded
+
+def test_local_vector_store():
+    """Test exact cosine search, top-k order and the metadata pre-filter"""
+    store, loaded = _store([
+        embedded_chunk("USR001", "Patient has a cough", [1.0, 0.0, 0.0]),
+        embedded_chunk("USR002", "Patient has a fever", [3.0, 4.0, 0.0]),
+        embedded_chunk("USR003", "Patient has a rash", [0.0, 0.0, 2.0]),
+        embedded_chunk("USR004", "No embedding yet", [])
+    ])
+    print(f"Loaded {loaded} vectors")
+    assert loaded == len(store) == 3
+
+    # Rows are normalised on load, so scores are cosine similarities
+    assert np.allclose(np.linalg.norm(store.matrix, axis=1), 1.0)
+
+    results = store.query([1.0, 1.0, 0.0], top_k=2)
+    print(f"Top 2: {[(result['id'], round(result['score'], 3)) for result in results]}")
+    assert [result["id"] for result in results] == ["user:USR002:0", "user:USR001:0"]
+    assert abs(results[0]["score"] - 7 / (5 * np.sqrt(2))) < 1e-6
+    assert results[0]["metadata"]["content"].endswith("Patient has a fever")
+
+    assert [result["id"] for result in store.query([0.1, 0.0, 1.0], top_k=10)] == [
+        "user:USR003:0", "user:USR001:0", "user:USR002:0"
+    ]
+
+    # The pre-filter restricts scoring to the matching rows
+    filtered = store.query([1.0, 1.0, 0.0], top_k=5, metadata_filter={"user_id": ["USR003", "USR001"]})
+    assert [result["id"] for result in filtered] == ["user:USR001:0", "user:USR003:0"]
+    assert store.query([1.0, 1.0, 0.0], metadata_filter={"user_id": ["USR999"]}) == []
+
+    # Wrong dimensions and zero vectors return no matches instead of raising
+    assert store.query([1.0, 0.0]) == []
+    assert store.query([0.0, 0.0, 0.0]) == []
+
+def test_local_vector_store_missing_file():
+    """Test a missing embeddings file leaves the store empty"""
+    with scratch_paths("missing.json") as (snapshot_path,):
+        store = LocalVectorStore(snapshot_path)
+        assert store.load() == 0
+        assert store.query([1.0, 0.0, 0.0]) == []
+
+if __name__ == "__main__":
+    test_local_vector_store()
+    test_local_vector_store_missing_file()
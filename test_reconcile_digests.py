@@ -0,0 +1,46 @@
+import random
+
+from reconcile_index import PartitionDigests, partition_of, entry_digest, index_fingerprint
+from upsert_manifest import vector_fingerprint
+
+def test_partition_digests():
+    """Test digests ignore insertion order and pinpoint the partitions that differ"""
+    entries = [(f"user:USR{i:03d}:0", f"fingerprint-{i}") for i in range(200)]
+    shuffled = list(entries)
+    random.Random(7).shuffle(shuffled)
+
+    database = PartitionDigests(partitions=16)
+    database.add_all(entries)
+    index = PartitionDigests(partitions=16)
+    index.add_all(shuffled)
+    print(f"Digests over {len(database)} vectors, differing partitions: {database.differing(index)}")
+    assert len(database) == 200
+    assert database.differing(index) == []
+
+    # A changed fingerprint and a missing vector each show up in their own partition
+    changed = PartitionDigests(partitions=16)
+    changed.add_all([
+        (vector_id, "edited" if vector_id == "user:USR010:0" else fingerprint)
+        for vector_id, fingerprint in entries if vector_id != "user:USR150:0"
+    ])
+    expected = sorted({partition_of("user:USR010:0", 16), partition_of("user:USR150:0", 16)})
+    print(f"Differing partitions after an edit and a delete: {database.differing(changed)}")
+    assert database.differing(changed) == expected
+
+    # Folding in a precomputed per-record digest matches adding the entries one by one
+    combined = PartitionDigests(partitions=16)
+    for vector_id, fingerprint in entries:
+        combined.add_digest(partition_of(vector_id, 16), entry_digest(vector_id, fingerprint), 1)
+    assert combined.differing(database) == []
+
+def test_index_fingerprint():
+    """Test metadata read back from the index, where numbers are floats, matches what was upserted"""
+    upserted = {"source": "user", "user_id": "USR099", "chunk_no": 2, "content": "Patient has a cough"}
+    returned = dict(upserted, chunk_no=2.0)
+    assert index_fingerprint(returned) == index_fingerprint(upserted)
+    assert index_fingerprint(upserted) == vector_fingerprint(upserted["content"], upserted)
+    assert index_fingerprint(dict(returned, content="Patient has a fever")) != index_fingerprint(upserted)
+
+if __name__ == "__main__":
+    test_partition_digests()
+    test_index_fingerprint()
@@ -1,4 +1,5 @@
 import hashlib
+from record_ids import vector_id, record_key, table_record_key, assign_chunk_numbers, vector_record_key
 
 def test_vector_id_generation():
     """Test vector ID generation with content hashing"""
@@ -45,5 +46,35 @@ def test_vector_id_generation():
     print()
     print(f"IDs are different: {vector_id1 != vector_id2}")
 
+def test_record_vector_ids():
+    """Test record-keyed vector IDs stay stable when a record's content changes"""
+    metadatas = [
+        {"source": "user", "user_id": "USR099"},
+        {"source": "user", "user_id": "USR099"},
+        {"source": "doctor", "doctor_id": "DR009"},
+        {"source": "user", "user_id": "USR099"},
+        {"source": "notes"}
+    ]
+    assign_chunk_numbers(metadatas)
+    print(f"Chunk numbers: {[metadata.get('chunk_no') for metadata in metadatas]}")
+    assert [metadata.get("chunk_no") for metadata in metadatas] == [0, 1, 0, 2, None]
+
+    before = vector_id("Transcript: Patient has mild throat pain", metadatas[1])
+    after = vector_id("Transcript: Patient has a fever", metadatas[1])
+    print(f"Vector ID before and after the update: {before}, {after}")
+    assert before == after == "user:USR099:1"
+
+    # Chunks without a record keep the content-hash ID
+    content = "Clinic opening hours"
+    assert vector_id(content, metadatas[4]) == f"chunk_{hashlib.md5(content.encode('utf-8')).hexdigest()}"
+
+    assert record_key(metadatas[2]) == "doctor:DR009"
+    assert record_key({"source": "user"}) is None
+    assert table_record_key("User", "USR099") == "user:USR099"
+    assert table_record_key("Unknown", "X1") is None
+    assert vector_record_key("user:USR099:2") == "user:USR099"
+    assert vector_record_key("chunk_abc") is None
+
 if __name__ == "__main__":
-    test_vector_id_generation()
\ No newline at end of file
+    test_vector_id_generation()
+    test_record_vector_ids()
\ No newline at end of file
@@ -0,0 +1,40 @@
+from datetime import datetime, timedelta
+
+from watermark_store import WatermarkStore, Watermark, row_key
+from testing_support import scratch_paths
+
+def test_watermark_store():
+    """Test watermarks persist, never move backwards and keep only rows inside the overlap window"""
+    with scratch_paths("watermarks.sqlite3") as (path,):
+        store = WatermarkStore(path, overlap_seconds=300)
+        assert store.get("User") is None
+
+        now = datetime(2025, 11, 14, 12, 0, 0)
+        early = now - timedelta(minutes=30)
+        late = now - timedelta(minutes=2)
+        store.commit("User", Watermark(now, "USR099"), [row_key("USR001", early), row_key("USR098", late)])
+        print(f"Committed watermark: {store.get('User')}")
+        assert store.get("User") == Watermark(now, "USR099")
+
+        # Only rows inside the overlap window are remembered
+        assert store.recent("User") == {row_key("USR098", late)}
+        assert store.window_start(store.get("User")) == Watermark(now - timedelta(seconds=300), "")
+
+        # An older watermark does not move it backwards
+        store.commit("User", Watermark(early, "USR001"))
+        assert store.get("User") == Watermark(now, "USR099")
+
+        # Watermarks survive reopening the store
+        reopened = WatermarkStore(path, overlap_seconds=300)
+        print(f"Watermarks after reopening: {reopened.all()}")
+        assert reopened.all() == {"User": Watermark(now, "USR099")}
+
+        # Moving on prunes rows that fell out of the window
+        reopened.commit("User", Watermark(now + timedelta(minutes=10), "USR100"))
+        assert reopened.recent("User") == set()
+
+        reopened.reset("User")
+        assert reopened.get("User") is None
+
+if __name__ == "__main__":
+    test_watermark_store()
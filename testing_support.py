@@ -0,0 +1,26 @@
+"""
+Sample records and scratch files shared by the test_*.py scripts.
+"""
+
+import os
+import tempfile
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+def patient_chunk(user_id: str, name: str, transcript: str, chunk_no: Optional[int] = None) -> Dict:
+    """A chunk of a User record, laid out the way convert_to_documents writes it"""
+    metadata = {"source": "user", "user_id": user_id}
+    if chunk_no is not None:
+        metadata["chunk_no"] = chunk_no
+    content = f"Patient Information:\nID: {user_id}\nName: {name}\nTranscript: {transcript}"
+    return {"content": content, "metadata": metadata}
+
+def embedded_chunk(user_id: str, transcript: str, embedding: List[float], chunk_no: int = 0) -> Dict:
+    """A patient chunk with its embedding, as stored in the log and snapshot"""
+    return dict(patient_chunk(user_id, "Test Patient", transcript, chunk_no), embedding=embedding)
+
+@contextmanager
+def scratch_paths(*names: str) -> Iterator[List[str]]:
+    """Paths for the given file names in a temporary directory removed afterwards"""
+    with tempfile.TemporaryDirectory() as directory:
+        yield [os.path.join(directory, name) for name in names]
@@ -7,9 +7,18 @@ import os
 import json
 import logging
 from dotenv import load_dotenv
-from chunk_prisma_data import fetch_prisma_data, convert_to_documents
+import asyncpg
+from chunk_prisma_data import (
+    fetch_prisma_data, collect_changes, latest_watermark, convert_to_documents, chunk_documents,
+    DATABASE_URL, CHUNKED_DATA_PATH
+)
 from generate_embeddings import generate_embeddings_for_chunks
 from store_embeddings_pinecone import store_embeddings_in_pinecone
+from lexical_index import lexical_index
+from streaming_ingest import stream_full_refresh
+from ingest_lock import ingest_lock
+from record_ids import RECORD_TABLES, record_key, table_record_key, assign_chunk_numbers
+from watermark_store import WatermarkStore, WATERMARK_COLUMN
 import asyncio
 from datetime import datetime
 
@@ -20,22 +29,91 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
+# Full refreshes stream the database through the pipeline instead of loading it whole
+STREAMING_EXPORT = os.getenv("STREAMING_EXPORT", "false").lower() == "true"
+# Updates fetch only rows changed since each table's watermark instead of re-fetching
+# everything. On by default once WATERMARK_COLUMN tracks edits; with the default
+# created_at column edits to existing rows would never be seen, so the default stays
+# a full refresh until the tables carry an updated_at column
+INCREMENTAL_SYNC = os.getenv(
+    "INCREMENTAL_SYNC", "false" if WATERMARK_COLUMN == "created_at" else "true"
+).lower() == "true"
+# Rows fetched per page while collecting changes
+WATERMARK_BATCH_SIZE = int(os.getenv("WATERMARK_BATCH_SIZE", "1000"))
+
 async def update_rag_with_new_data():
     """Update the RAG system with new data from Prisma database"""
     try:
-        logger.info("Fetching new data from Prisma database...")
-        data = await fetch_prisma_data()
-        
-        if not data:
-            logger.warning("No data fetched from database")
-            return False
-            
-        return await process_rag_update(data)
+        if INCREMENTAL_SYNC:
+            return await update_rag_incremental()
+        return await full_refresh()
         
     except Exception as e:
         logger.error(f"Error updating RAG: {e}")
         return False
 
+async def full_refresh():
+    """Re-ingest every row of every table"""
+    if STREAMING_EXPORT:
+        logger.info("Streaming data from Prisma database...")
+        return await stream_full_refresh()
+    
+    logger.info("Fetching new data from Prisma database...")
+    data = await fetch_prisma_data()
+    
+    if not data:
+        logger.warning("No data fetched from database")
+        return False
+        
+    return await process_rag_update(data)
+
+async def update_rag_incremental(batch_size=WATERMARK_BATCH_SIZE):
+    """Ingest the rows of all tables changed since their committed watermarks
+
+    All changes are collected first and ingested in one update, and the
+    watermarks are committed only if it succeeds. Tables that were never
+    synced are bootstrapped with a full refresh instead of paging through
+    their whole history.
+    """
+    if WATERMARK_COLUMN == "created_at":
+        logger.warning("Watermarks follow created_at: new rows are synced, edits to existing rows are not")
+    store = WatermarkStore()
+    conn = await asyncpg.connect(DATABASE_URL)
+    try:
+        # Taken before the refresh reads anything, so rows written meanwhile are re-read.
+        # Tables that are still empty are simply read from the beginning next time
+        starting = {}
+        for table in RECORD_TABLES:
+            if store.get(table) is None:
+                watermark = await latest_watermark(conn, table)
+                if watermark is not None:
+                    starting[table] = watermark
+        if starting:
+            logger.info(f"No watermark for {', '.join(starting)}, bootstrapping with a full refresh")
+            if not await full_refresh():
+                logger.error("Bootstrap refresh failed, watermarks not set")
+                return False
+            for table, watermark in starting.items():
+                store.commit(table, watermark)
+        
+        data, advanced = await collect_changes(conn, store, batch_size)
+    finally:
+        await conn.close()
+    
+    if not data:
+        logger.info("Incremental sync found no changed rows")
+        return True
+    
+    count = sum(len(rows) for rows in data.values())
+    logger.info(f"Ingesting {count} changed rows from {', '.join(advanced)}")
+    if not await process_rag_update(data):
+        logger.error("Incremental update failed, watermarks not advanced")
+        return False
+    for table, (watermark, keys) in advanced.items():
+        store.commit(table, watermark, keys)
+    logger.info(f"Incremental sync ingested {count} changed rows")
+    return True
+
 async def update_rag_with_provided_data(data):
     """Update the RAG system with provided data"""
     try:
@@ -50,70 +128,95 @@ async def update_rag_with_provided_data(data):
         return False
 
 async def process_rag_update(data):
-    """Process RAG update with provided data"""
+    """Process RAG update with provided data
+
+    Records in data replace every chunk previously stored for the same
+    `source:primary_key`; rows listed under data["deleted"] as
+    {"table", "record_id"} are removed from the corpus and the index.
+    Runs one at a time with other updates and refreshes (see ingest_lock).
+    """
+    async with ingest_lock():
+        return await _process_rag_update(data)
+
+async def _process_rag_update(data):
     try:
+        deleted_keys = set()
+        for row in data.get("deleted", []) if isinstance(data, dict) else []:
+            key = table_record_key(row.get("table"), row.get("record_id"))
+            if key is None:
+                logger.warning(f"Ignoring delete of unknown table {row.get('table')}")
+            else:
+                deleted_keys.add(key)
+        
         logger.info("Converting data to documents...")
         documents = convert_to_documents(data)
         
-        if not documents:
+        if not documents and not deleted_keys:
             logger.warning("No documents generated from data")
             return False
             
-        logger.info(f"Generated {len(documents)} documents")
+        logger.info(f"Generated {len(documents)} documents, {len(deleted_keys)} deleted records")
         
         # Load existing chunked data if it exists
         existing_chunked_data = []
-        if os.path.exists("chunked_prisma_data.json"):
+        if os.path.exists(CHUNKED_DATA_PATH):
             try:
-                with open("chunked_prisma_data.json", "r", encoding="utf-8") as f:
+                with open(CHUNKED_DATA_PATH, "r", encoding="utf-8") as f:
                     existing_chunked_data = json.load(f)
+                assign_chunk_numbers(chunk.get("metadata", {}) for chunk in existing_chunked_data)
                 logger.info(f"Loaded {len(existing_chunked_data)} existing chunks")
             except Exception as e:
                 logger.warning(f"Could not load existing chunked data: {e}")
                 existing_chunked_data = []
         
-        # Convert new documents to chunked format
-        new_chunked_data = []
-        for i, doc in enumerate(documents):
-            chunked_item = {
-                "content": doc.page_content,
-                "metadata": doc.metadata
-            }
-            new_chunked_data.append(chunked_item)
-        
-        # Combine existing and new data, removing duplicates based on content
-        # Use a more robust deduplication approach
-        combined_chunked_data = existing_chunked_data.copy()
-        existing_content_set = set()
+        # Chunk new documents the same way as the full build, so a record keeps its chunk IDs
+        new_chunked_data = [
+            {"content": chunk.page_content, "metadata": chunk.metadata}
+            for chunk in chunk_documents(documents)
+        ]
+        
+        # Updated and deleted records drop all their old chunks; the new chunks take over
+        # the same source:primary_key:chunk_no IDs, so their vectors are overwritten in place
+        replaced_keys = deleted_keys | {record_key(chunk["metadata"]) for chunk in new_chunked_data}
+        replaced_keys.discard(None)
+        kept_chunked_data = [
+            chunk for chunk in existing_chunked_data
+            if record_key(chunk.get("metadata", {})) not in replaced_keys
+        ]
+        removed_count = len(existing_chunked_data) - len(kept_chunked_data)
         
-        # Add existing content to the set for deduplication
-        for chunk in existing_chunked_data:
-            content = chunk.get('content', '')
+        # Chunks that are not tied to a record are still deduplicated on content
+        combined_chunked_data = kept_chunked_data
+        existing_content_set = set()
+        for chunk in kept_chunked_data:
             # Use a normalized version of the content for comparison
-            normalized_content = ' '.join(content.split())
-            existing_content_set.add(normalized_content)
+            existing_content_set.add(' '.join(chunk.get('content', '').split()))
         
-        # Add new chunks that don't already exist
-        added_count = 0
+        added_chunks = []
         for new_chunk in new_chunked_data:
-            content = new_chunk.get('content', '')
-            # Use a normalized version of the content for comparison
-            normalized_content = ' '.join(content.split())
-            
-            if normalized_content not in existing_content_set:
-                combined_chunked_data.append(new_chunk)
-                existing_content_set.add(normalized_content)
-                added_count += 1
+            normalized_content = ' '.join(new_chunk.get('content', '').split())
+            if record_key(new_chunk["metadata"]) is None and normalized_content in existing_content_set:
+                continue
+            combined_chunked_data.append(new_chunk)
+            existing_content_set.add(normalized_content)
+            added_chunks.append(new_chunk)
+        added_count = len(added_chunks)
         
-        # Save combined documents to chunked_prisma_data.json for processing
-        with open("chunked_prisma_data.json", "w", encoding="utf-8") as f:
+        # Save combined documents to the chunk file for processing
+        with open(CHUNKED_DATA_PATH, "w", encoding="utf-8") as f:
             json.dump(combined_chunked_data, f, indent=2, default=str)
         
-        logger.info(f"Total unique chunks to process: {len(combined_chunked_data)} ({len(existing_chunked_data)} existing, {len(new_chunked_data)} new, {added_count} actually added)")
+        logger.info(f"Total unique chunks to process: {len(combined_chunked_data)} ({removed_count} replaced or deleted, {added_count} added)")
+        
+        # Make the changes visible to the in-memory BM25 index right away
+        lexical_index.remove_records(replaced_keys)
+        lexical_index.add_documents(added_chunks)
         
         logger.info("Generating embeddings...")
-        embeddings_data = generate_embeddings_for_chunks()
+        if not generate_embeddings_for_chunks():
+            logger.warning("Embedding generation failed, storing the embeddings already in the snapshot")
         
+        # Upserts overwrite updated records; vectors of deleted records are deleted
         logger.info("Storing embeddings in Pinecone...")
         success = store_embeddings_in_pinecone()
         
@@ -0,0 +1,119 @@
+"""
+Manifest of what has already been upserted to Pinecone.
+Records vector ID -> fingerprint of the upserted content and metadata, so
+store_embeddings_in_pinecone only sends vectors that are new or changed.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from typing import Dict, Iterable, Iterator, Set, Tuple
+from dotenv import load_dotenv
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Configuration
+UPSERT_MANIFEST_PATH = os.getenv("UPSERT_MANIFEST_PATH", "upsert_manifest.sqlite3")
+
+# SQLite limits the number of bound parameters per statement
+SQLITE_BATCH_SIZE = 500
+
+def vector_fingerprint(content: str, metadata: Dict) -> str:
+    """Hash of everything a vector record carries besides its values"""
+    payload = json.dumps({"content": content, "metadata": metadata}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class UpsertManifest:
+    def __init__(self, path: str = UPSERT_MANIFEST_PATH):
+        """Open (or create) the manifest database"""
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS upserts ("
+                " index_name TEXT NOT NULL,"
+                " vector_id TEXT NOT NULL,"
+                " fingerprint TEXT NOT NULL,"
+                " upserted_at REAL NOT NULL,"
+                " PRIMARY KEY (index_name, vector_id)"
+                ") WITHOUT ROWID"
+            )
+            self.conn.commit()
+
+    def upserted(self, index_name: str, vector_ids: Iterable[str]) -> Dict[str, str]:
+        """Return {vector_id: fingerprint} for the given IDs that have been upserted"""
+        ids = list(vector_ids)
+        found: Dict[str, str] = {}
+        with self.lock:
+            for start in range(0, len(ids), SQLITE_BATCH_SIZE):
+                batch = ids[start:start + SQLITE_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                rows = self.conn.execute(
+                    f"SELECT vector_id, fingerprint FROM upserts WHERE index_name = ? AND vector_id IN ({placeholders})",
+                    [index_name, *batch]
+                ).fetchall()
+                found.update(rows)
+        return found
+
+    def mark_upserted(self, index_name: str, entries: Iterable[Tuple[str, str]]):
+        """Record (vector_id, fingerprint) pairs after Pinecone accepted them"""
+        now = time.time()
+        rows = [(index_name, vector_id, fingerprint, now) for vector_id, fingerprint in entries]
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO upserts (index_name, vector_id, fingerprint, upserted_at) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self.conn.commit()
+
+    def vector_ids(self, index_name: str) -> Set[str]:
+        """Every vector ID recorded as upserted to an index"""
+        with self.lock:
+            rows = self.conn.execute("SELECT vector_id FROM upserts WHERE index_name = ?", (index_name,))
+            return {vector_id for (vector_id,) in rows}
+
+    def entries(self, index_name: str) -> Iterator[Tuple[str, str]]:
+        """Yield every (vector_id, fingerprint) recorded for an index, in ID order"""
+        last_id = ""
+        while True:
+            # Page through the primary key so the lock is never held while the caller works
+            with self.lock:
+                rows = self.conn.execute(
+                    "SELECT vector_id, fingerprint FROM upserts WHERE index_name = ? AND vector_id > ?"
+                    " ORDER BY vector_id LIMIT ?",
+                    (index_name, last_id, SQLITE_BATCH_SIZE)
+                ).fetchall()
+            if not rows:
+                return
+            yield from rows
+            last_id = rows[-1][0]
+
+    def forget(self, index_name: str, vector_ids: Iterable[str]):
+        """Drop entries for vectors deleted from the index"""
+        with self.lock:
+            self.conn.executemany(
+                "DELETE FROM upserts WHERE index_name = ? AND vector_id = ?",
+                [(index_name, vector_id) for vector_id in vector_ids]
+            )
+            self.conn.commit()
+
+    def clear(self, index_name: str):
+        """Forget everything upserted to an index (e.g. after it was recreated)"""
+        with self.lock:
+            self.conn.execute("DELETE FROM upserts WHERE index_name = ?", (index_name,))
+            self.conn.commit()
+        logger.info(f"Cleared upsert manifest for index {index_name}")
+
+    def __len__(self) -> int:
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM upserts").fetchone()[0]
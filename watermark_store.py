@@ -0,0 +1,129 @@
+"""
+Durable per-table sync watermarks.
+A watermark is the (change column, primary key) of the last row ingested
+from a table. Incremental syncs re-read an overlap window behind it,
+because created_at/updated_at is the writing transaction's start time
+and a transaction that commits late can land behind a watermark that has
+already moved on. Rows ingested inside the window are remembered, so
+only the late ones are ingested again. A new watermark is committed only
+once its rows have been accepted, so a failed run is simply repeated.
+"""
+
+import os
+import time
+import sqlite3
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, NamedTuple, Optional, Set, Tuple
+from dotenv import load_dotenv
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Configuration
+WATERMARK_STORE_PATH = os.getenv("WATERMARK_STORE_PATH", "watermarks.sqlite3")
+# Column that changes when a row changes; the Prisma schema only has created_at,
+# set this to updated_at once the tables carry one so updates are picked up too
+WATERMARK_COLUMN = os.getenv("WATERMARK_COLUMN", "created_at")
+# How far behind the watermark each sync re-reads for late-committing rows
+WATERMARK_OVERLAP_SECONDS = float(os.getenv("WATERMARK_OVERLAP_SECONDS", "300"))
+
+class Watermark(NamedTuple):
+    changed_at: datetime
+    record_id: str
+
+def row_key(record_id, changed_at: datetime) -> Tuple[str, str]:
+    """Identity of one version of a row inside the overlap window"""
+    return str(record_id), changed_at.isoformat()
+
+class WatermarkStore:
+    def __init__(self, path: str = WATERMARK_STORE_PATH, overlap_seconds: float = WATERMARK_OVERLAP_SECONDS):
+        """Open (or create) the watermark database"""
+        self.path = path
+        self.overlap = timedelta(seconds=overlap_seconds)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS watermarks ("
+                " table_name TEXT PRIMARY KEY,"
+                " changed_at TEXT NOT NULL,"
+                " record_id TEXT NOT NULL,"
+                " committed_at REAL NOT NULL"
+                ")"
+            )
+            # Rows already ingested whose change time is inside the overlap window
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS recent_rows ("
+                " table_name TEXT NOT NULL,"
+                " record_id TEXT NOT NULL,"
+                " changed_at TEXT NOT NULL,"
+                " PRIMARY KEY (table_name, record_id, changed_at)"
+                ") WITHOUT ROWID"
+            )
+            self.conn.commit()
+
+    def get(self, table: str) -> Optional[Watermark]:
+        """The last committed watermark for a table, or None if it was never synced"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT changed_at, record_id FROM watermarks WHERE table_name = ?", (table,)
+            ).fetchone()
+        if row is None:
+            return None
+        return Watermark(datetime.fromisoformat(row[0]), row[1])
+
+    def window_start(self, watermark: Watermark) -> Watermark:
+        """Where a sync starts reading: the overlap window behind the watermark"""
+        return Watermark(watermark.changed_at - self.overlap, "")
+
+    def recent(self, table: str) -> Set[Tuple[str, str]]:
+        """row_key()s of the rows already ingested inside the table's overlap window"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT record_id, changed_at FROM recent_rows WHERE table_name = ?", (table,)
+            ).fetchall()
+        return set(rows)
+
+    def commit(self, table: str, watermark: Watermark, ingested: Iterable[Tuple[str, str]] = ()):
+        """Record that rows up to watermark (and the ingested row_key()s) have been ingested"""
+        current = self.get(table)
+        if current is not None and current > watermark:
+            # Never move a watermark backwards
+            watermark = current
+        cutoff = (watermark.changed_at - self.overlap).isoformat()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO watermarks (table_name, changed_at, record_id, committed_at) VALUES (?, ?, ?, ?)",
+                (table, watermark.changed_at.isoformat(), str(watermark.record_id), time.time())
+            )
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO recent_rows (table_name, record_id, changed_at) VALUES (?, ?, ?)",
+                [(table, record_id, changed_at) for record_id, changed_at in ingested if changed_at >= cutoff]
+            )
+            self.conn.execute(
+                "DELETE FROM recent_rows WHERE table_name = ? AND changed_at < ?", (table, cutoff)
+            )
+            self.conn.commit()
+
+    def reset(self, table: Optional[str] = None):
+        """Forget one table's watermark (or all), so its next sync starts from the beginning"""
+        with self.lock:
+            if table is None:
+                self.conn.execute("DELETE FROM watermarks")
+                self.conn.execute("DELETE FROM recent_rows")
+            else:
+                self.conn.execute("DELETE FROM watermarks WHERE table_name = ?", (table,))
+                self.conn.execute("DELETE FROM recent_rows WHERE table_name = ?", (table,))
+            self.conn.commit()
+        logger.info(f"Reset sync watermark for {table or 'all tables'}")
+
+    def all(self) -> Dict[str, Watermark]:
+        with self.lock:
+            rows = self.conn.execute("SELECT table_name, changed_at, record_id FROM watermarks").fetchall()
+        return {table: Watermark(datetime.fromisoformat(changed_at), record_id) for table, changed_at, record_id in rows}